@@ -1,6 +1,9 @@
 """Main k93 CLI module."""
 import contextlib
+import json
 import logging
+import subprocess
+import sys
 import tempfile
 import os
 import yaml
@@ -8,8 +11,18 @@ import yaml
 import click
 
 import k93s
+import k93s.bench
 import k93s.config
+import k93s.diagnostics
+import k93s.exporter
+import k93s.facts
+import k93s.inventory
+import k93s.journal
+import k93s.metrics
 import k93s.provision
+import k93s.registry
+import k93s.status
+import k93s.transport
 import k93s.vms
 import k93s.utils
 
@@ -25,11 +38,16 @@ def _with_config(ctx):
     except FileNotFoundError:
         logger.exception('Config %s does not exist.', config_file)
         exit(5)
+    except RuntimeError as e:
+        logger.error('Config %s can not be used. %s', config_file, e)
+        exit(3)
     else:
         ctx.obj['config_contents'] = config_contents
         with tempfile.TemporaryDirectory() as tmpdirname:
-            yield tmpdirname
-            pass
+            try:
+                yield tmpdirname
+            finally:
+                k93s.metrics.flush(k93s.utils.state_directory(ctx.obj['config']))
 
 
 @click.group()
@@ -76,19 +94,392 @@ def teardown(ctx):
         if click.confirm('Do you really want to tear down k93s cluster, set up '
                          'with config {!s}'.format(ctx.obj['config'])):
             k93s.vms.teardown(tmpdirname, **ctx.obj)
+            k93s.journal.Journal.for_config(ctx.obj['config']).clear()
 
 
 @cli.command()
+@click.argument('name')
 @click.pass_context
-def kubernetes(ctx):
-    """Make sure VMs are set up, and provision cluster with Ansible."""
+def snapshot(ctx, name):
+    """Snapshot all VMs of current cluster under given name."""
     with _with_config(ctx) as tmpdirname:
-        k93s.vms.spinup(tmpdirname, **ctx.obj)
-        # New hosts may have been created, so re-read inventory
-        inventory_contents = k93s.vms.inventory(tmpdirname, **ctx.obj)
-        k93s.provision.ansible_kubernetes(inventory_contents,
-                                          ctx.obj['config_contents'],
-                                          tmpdirname)
+        k93s.vms.snapshot(tmpdirname, name, **ctx.obj)
+
+
+@cli.command()
+@click.argument('name')
+@click.pass_context
+def reset(ctx, name):
+    """Revert all VMs of current cluster to snapshot with given name."""
+    with _with_config(ctx) as tmpdirname:
+        try:
+            k93s.vms.reset(tmpdirname, name, **ctx.obj)
+        except RuntimeError as e:
+            logger.error('Can not reset cluster. %s', e)
+            exit(10)
+    # Nodes are back to the state of the snapshot, which the journal knows nothing about
+    k93s.journal.Journal.for_config(ctx.obj['config']).clear()
+
+
+@cli.command()
+@click.pass_context
+def suspend(ctx):
+    """Save memory of all cluster VMs to disk and stop them, freeing host RAM."""
+    with _with_config(ctx) as tmpdirname:
+        k93s.vms.suspend(tmpdirname, **ctx.obj)
+    k93s.status.clear_cache(k93s.utils.state_directory(ctx.obj['config']))
+
+
+@cli.command()
+@click.option('--timeout', default=120.0, show_default=True,
+              help='Seconds to wait for nodes to become ready.')
+@click.pass_context
+def resume(ctx, timeout):
+    """Bring suspended cluster VMs back, and wait for nodes to become ready.
+
+    Masters are restored first, agents follow. VMs keep their addresses,
+    so inventory and kubeconfig of the cluster stay valid.
+    """
+    with _with_config(ctx) as tmpdirname:
+        with k93s.vms.session(tmpdirname, **ctx.obj) as invoke:
+            invoke('resume')
+            rows = k93s.status.wait_ready(lambda: invoke('stats', quiet=True), timeout)
+    k93s.status.write_cache(k93s.utils.state_directory(ctx.obj['config']), rows)
+    click.echo(k93s.status.format_table(rows))
+    if not all(row['ready'] for row in rows if row['role'] != 'standby'):
+        logger.error('Not all nodes became ready in %ss.', timeout)
+        exit(8)
+
+
+@cli.command()
+@click.option('--kubectl', 'with_kubectl', is_flag=True,
+              help='Also merge cluster into ~/.kube/config and switch to it.')
+@click.option('--fresh', is_flag=True,
+              help='Ignore bring-up journal and redo all phases on all nodes.')
+@click.pass_context
+def kubernetes(ctx, with_kubectl, fresh):
+    """Make sure VMs are set up, and provision cluster with Ansible.
+
+    Phases completed by earlier runs are recorded in a journal, and
+    only incomplete work is redone.
+    """
+    journal = k93s.journal.Journal.for_config(ctx.obj['config'])
+    if fresh:
+        journal.clear()
+    with _with_config(ctx) as tmpdirname:
+        with k93s.vms.session(tmpdirname, **ctx.obj) as invoke:
+            rows = invoke('stats')
+            if any(row['state'] == 'suspended' for row in rows):
+                logger.error('Cluster is suspended, bring it back with k93s resume.')
+                exit(8)
+            journal.reconcile(rows)
+            nodes = [row['name'] for row in rows if row['role'] != 'standby']
+            masters = [row['name'] for row in rows if row['role'] == 'master']
+
+            to_boot = journal.pending(nodes, 'booted')
+            if to_boot:
+                states = {row['name']: row['state'] for row in rows}
+                to_create = [name for name in to_boot if states[name] == 'missing']
+                to_start = [name for name in to_boot if states[name] != 'missing']
+                if to_create:
+                    invoke('spinup', only=to_create)
+                # Spinup skips domains, which exist, so shut off ones are started
+                if to_start:
+                    invoke('resume', only=to_start)
+                # Pick up identities of newly created VMs. Backends only log
+                # failures of spinup, so VMs are marked by their actual state.
+                rows = invoke('stats')
+                states = {row['name']: row['state'] for row in rows}
+                failed = []
+                for name in to_boot:
+                    if states.get(name) == 'running':
+                        journal.mark(name, 'created', 'booted')
+                    else:
+                        if states.get(name, 'missing') != 'missing':
+                            journal.mark(name, 'created')
+                        failed.append(name)
+                if failed:
+                    logger.error('VMs %s did not come up.', ', '.join(failed))
+                    exit(9)
+            fact_cache = k93s.facts.FactCache.for_config(ctx.obj['config'])
+            fact_cache.invalidate(rows)
+
+            to_provision = journal.pending(nodes, 'joined')
+            inventory_contents = None
+            if to_provision:
+                # New hosts may have been created, so re-read inventory
+                inventory_contents = invoke('inventory')
+                _ensure_registry(ctx, inventory_contents)
+                # Agents join with a token, which is read on the first master
+                limit = sorted(set(to_provision + masters[:1]))
+                k93s.provision.ansible_kubernetes(inventory_contents,
+                                                  ctx.obj['config_contents'],
+                                                  tmpdirname,
+                                                  limit=limit,
+                                                  extra_vars=journal.extra_vars(limit),
+                                                  fact_cache=fact_cache)
+            else:
+                logger.warning('All nodes have joined the cluster, nothing to provision.')
+            if with_kubectl:
+                k93s.provision.configure_kubectl(
+                    inventory_contents or invoke('inventory'),
+                    tmpdirname,
+                    True,
+                    context_name=ctx.obj['config_contents'].get('name', 'k93s'),
+                )
+    _refill_pool_in_background(ctx)
+
+
+@cli.command()
+@click.option('--batch-size', default=1, show_default=True,
+              help='Number of agent nodes to upgrade at once.')
+@click.pass_context
+def upgrade(ctx, batch_size):
+    """Upgrade k3s and apply changed node settings, node by node.
+
+    Master is upgraded first, agents follow in batches. Nodes are
+    drained before, and uncordoned after restart of their services.
+    """
+    with _with_config(ctx) as tmpdirname:
+        with k93s.vms.session(tmpdirname, **ctx.obj) as invoke:
+            fact_cache = k93s.facts.FactCache.for_config(ctx.obj['config'])
+            fact_cache.invalidate(invoke('stats'))
+            inventory_contents = invoke('inventory')
+            _ensure_registry(ctx, inventory_contents)
+            k93s.provision.ansible_kubernetes(inventory_contents,
+                                              ctx.obj['config_contents'],
+                                              tmpdirname,
+                                              playbook='upgrade.yml',
+                                              extra_vars={'k93s_upgrade_batch': batch_size},
+                                              fact_cache=fact_cache)
+
+
+def _ensure_registry(ctx, inventory_contents):
+    """Start registry mirror on the host, if it is enabled in config.
+
+    It is published on addresses, which nodes of the inventory reach the host on.
+    """
+    registry_settings = k93s.registry.settings(ctx.obj['config_contents'])
+    if registry_settings is not None:
+        k93s.registry.ensure_running(registry_settings,
+                                     k93s.registry.bind_addresses(inventory_contents))
+
+
+def _refill_pool_in_background(ctx):
+    """Start `k93s pool` detached, if warm pool of agents is configured."""
+    if not int(ctx.obj['config_contents'].get('agents', {}).get('warm_pool', 0)):
+        return
+    log_file = os.path.join(k93s.utils.state_directory(ctx.obj['config']), 'pool.log')
+    logger.warning('Refilling warm pool in background, see %s', log_file)
+    with open(log_file, 'a') as log:
+        subprocess.Popen([sys.executable, '-m', 'k93s', '--config-file', ctx.obj['config'], 'pool'],
+                         stdout=log, stderr=log, stdin=subprocess.DEVNULL,
+                         cwd=k93s.curdir, start_new_session=True)
+
+
+@cli.command()
+@click.pass_context
+def pool(ctx):
+    """Bring up and prepare standby agents of the warm pool."""
+    with _with_config(ctx) as tmpdirname:
+        with k93s.vms.session(tmpdirname, **ctx.obj) as invoke:
+            created = invoke('fill_pool')
+            if created:
+                fact_cache = k93s.facts.FactCache.for_config(ctx.obj['config'])
+                fact_cache.invalidate(invoke('stats'))
+                inventory_contents = invoke('inventory')
+                _ensure_registry(ctx, inventory_contents)
+                journal = k93s.journal.Journal.for_config(ctx.obj['config'])
+                k93s.provision.ansible_kubernetes(
+                    inventory_contents,
+                    ctx.obj['config_contents'],
+                    tmpdirname,
+                    playbook='standby.yml',
+                    limit=[vm.name for vm in created],
+                    extra_vars={'k93s_journal_dir': journal.directory},
+                    fact_cache=fact_cache,
+                )
+
+
+@cli.command()
+@click.option('--remove', is_flag=True, help='Stop and remove the mirror container.')
+@click.option('--purge', is_flag=True, help='With --remove, also drop cached images.')
+@click.pass_context
+def registry(ctx, remove, purge):
+    """Start host registry mirror, shared by all clusters.
+
+    The mirror is left running on teardown of clusters, so the next
+    cluster pulls cached images.
+    """
+    if remove:
+        k93s.registry.remove(purge=purge)
+        return
+    with _with_config(ctx) as tmpdirname:
+        if k93s.registry.settings(ctx.obj['config_contents']) is None:
+            logger.error('Registry mirror is not enabled in %s.', ctx.obj['config'])
+            exit(6)
+        with k93s.vms.session(tmpdirname, **ctx.obj) as invoke:
+            _ensure_registry(ctx, invoke('inventory'))
+
+
+@cli.command()
+@click.option('--image-budget', type=int,
+              help='MiB of disk distro images may take, least recently used ones are '
+                   'removed beyond it. Defaults to image_budget of gc config section.')
+@click.option('--compact', is_flag=True, help='Also recompress distro images no VM uses.')
+@click.option('--dry-run', is_flag=True, help='Only report, what would be removed.')
+@click.pass_context
+def gc(ctx, image_budget, compact, dry_run):
+    """Remove orphaned volumes and stale distro images from storage pools.
+
+    Volumes, which no domain uses, are left by failed spinups and
+    teardowns. Distro images are kept within disk budget.
+    """
+    with _with_config(ctx) as tmpdirname:
+        if image_budget is None:
+            image_budget = ctx.obj['config_contents'].get('gc', {}).get('image_budget')
+        rows = k93s.vms.collect_garbage(tmpdirname, image_budget, compact, dry_run, **ctx.obj)
+    # Imported here, as it needs libvirt, which other commands do without
+    from k93s.vms.gc import format_report
+    click.echo(format_report(rows, dry_run=dry_run))
+
+
+def _without_missing_standby(cluster_inventory, config):
+    """Leave standby agents of warm pool, which the journal does not know, out of inventory.
+
+    Inventory is computed from configuration, without libvirt, so it
+    lists standby agents, before the pool is filled.
+    """
+    journal = k93s.journal.Journal.for_config(config)
+    for name in cluster_inventory.group_hosts('kubernetes_standby'):
+        if not journal.phases(name):
+            cluster_inventory.remove_host(name)
+    return cluster_inventory
+
+
+@cli.command()
+@click.option('--list', 'list_hosts', is_flag=True, help='Print all hosts and groups (default).')
+@click.option('--host', help='Print variables of given host.')
+@click.pass_context
+def inventory(ctx, list_hosts, host):
+    """Print Ansible inventory of the cluster as JSON.
+
+    Options follow Ansible dynamic inventory script protocol, so k93s
+    can serve as one. Standby agents, which were not created yet, are
+    left out.
+    """
+    with _with_config(ctx) as tmpdirname:
+        cluster_inventory = _without_missing_standby(
+            k93s.inventory.as_inventory(k93s.vms.inventory(tmpdirname, **ctx.obj)),
+            ctx.obj['config'])
+    result = cluster_inventory.host(host) if host else cluster_inventory.to_dynamic()
+    click.echo(json.dumps(result, indent=2))
+
+
+@cli.command()
+@click.option('--json', 'as_json', is_flag=True, help='Print status as JSON.')
+@click.option('--ttl', default=10.0, show_default=True,
+              help='Seconds to reuse previously gathered status for.')
+@click.pass_context
+def status(ctx, as_json, ttl):
+    """Show state and health of cluster VMs."""
+    state_dir = k93s.utils.state_directory(ctx.obj['config'])
+    rows = k93s.status.read_cache(state_dir, ttl)
+    if rows is None:
+        with _with_config(ctx) as tmpdirname:
+            rows = k93s.status.gather(k93s.vms.stats(tmpdirname, **ctx.obj))
+        k93s.status.write_cache(state_dir, rows)
+    click.echo(json.dumps(rows, indent=2) if as_json else k93s.status.format_table(rows))
+
+
+def _parse_rates(ctx, param, value):
+    """Comma separated positive integers, e.g. "5,10,20"."""
+    try:
+        rates = [int(rate) for rate in value.split(',')]
+    except ValueError:
+        raise click.BadParameter('{!r} is not a comma separated list of integers.'.format(value))
+    if any(rate < 1 for rate in rates):
+        raise click.BadParameter('Rates must be at least 1 pod per second.')
+    return rates
+
+
+@cli.command()
+@click.option('--rates', default='5,10,20', show_default=True, callback=_parse_rates,
+              help='Comma separated pod creation rates of steps, in pods per second.')
+@click.option('--pods', default=50, show_default=True, type=click.IntRange(min=1),
+              help='Number of pods of every step.')
+@click.option('--timeout', default=300.0, show_default=True,
+              help='Seconds to wait for pods of a step to start.')
+@click.option('--history', is_flag=True, help='Only print results of earlier runs.')
+@click.pass_context
+def bench(ctx, rates, pods, timeout, history):
+    """Measure pod scheduling throughput, startup latency and API latency.
+
+    Results are kept along with sizing of cluster VMs, and printed
+    together with results of earlier runs for comparison.
+    """
+    state_dir = k93s.utils.state_directory(ctx.obj['config'])
+    if not history:
+        with _with_config(ctx) as tmpdirname:
+            cluster_inventory = k93s.vms.inventory(tmpdirname, **ctx.obj)
+        masters = cluster_inventory.group_hosts('kubernetes_master')
+        if not masters:
+            logger.error('Cluster has no master node to run benchmark on.')
+            exit(7)
+        result = k93s.bench.run(
+            k93s.transport.host_from_inventory(cluster_inventory, masters[0]),
+            ctx.obj['config_contents'],
+            rates,
+            pods,
+            timeout=timeout,
+        )
+        logger.warning('Benchmark results saved to %s', k93s.bench.save(state_dir, result))
+    click.echo(k93s.bench.format_table(k93s.bench.load_all(state_dir)))
+
+
+@cli.command()
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Bundle file to write. Defaults to diagnostics directory of cluster state.')
+@click.option('--timeout', default=60.0, show_default=True,
+              help='Seconds to spend collecting from any single node.')
+@click.option('--max-workers', default=16, show_default=True,
+              help='Number of nodes to collect from at a time.')
+@click.option('--lines', default=5000, show_default=True,
+              help='Number of most recent k3s journal lines to collect.')
+@click.pass_context
+def collect(ctx, output, timeout, max_workers, lines):
+    """Collect k3s logs, service state and resource usage of all nodes.
+
+    Nodes are reached concurrently over SSH, their outputs are bundled
+    into one compressed tar archive.
+    """
+    with _with_config(ctx) as tmpdirname:
+        cluster_inventory = _without_missing_standby(
+            k93s.inventory.as_inventory(k93s.vms.inventory(tmpdirname, **ctx.obj)),
+            ctx.obj['config'])
+    path = output or k93s.diagnostics.bundle_path(k93s.utils.state_directory(ctx.obj['config']))
+    summaries = k93s.diagnostics.collect(cluster_inventory, path, max_workers=max_workers,
+                                         timeout=timeout, lines=lines)
+    logger.warning('Diagnostics saved to %s', path)
+    click.echo(k93s.diagnostics.format_table(summaries))
+
+
+@cli.command()
+@click.option('--address', default='127.0.0.1', show_default=True,
+              help='Address to serve metrics on.')
+@click.option('--port', default=9693, show_default=True, help='Port to serve metrics on.')
+@click.pass_context
+def exporter(ctx, address, port):
+    """Serve metrics of cluster VMs and k93s operations for Prometheus.
+
+    CPU, memory, disk and NIC usage of VMs is read on every scrape.
+    Durations of k93s operations and fetched image bytes are totals of
+    all k93s commands run on the cluster.
+    """
+    state_dir = k93s.utils.state_directory(ctx.obj['config'])
+    with _with_config(ctx) as tmpdirname:
+        with k93s.vms.session(tmpdirname, **ctx.obj) as invoke:
+            k93s.exporter.serve(k93s.exporter.Exporter(invoke, state_dir), address, port)
 
 
 @cli.command()
@@ -100,7 +491,8 @@ def kubectl(ctx):
         k93s.provision.configure_kubectl(
             inventory_contents,
             tmpdirname,
-            click.confirm('REWRITE ./.kube/config ?'),
+            click.confirm('Merge cluster into ~/.kube/config and switch to it?'),
+            context_name=ctx.obj['config_contents'].get('name', 'k93s'),
         )
 
 
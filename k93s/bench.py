@@ -0,0 +1,333 @@
+"""Workload benchmark: pod scheduling throughput, startup latency and API latency.
+
+Pods are created in steps of increasing rate, with kubectl run on the
+first master over pooled SSH. Latencies come from timestamps, which the
+API server records on pods, so they have a resolution of one second.
+API server response times are read from its request duration histograms,
+before and after every step. Results are stored in the cluster state
+directory along with sizing of VMs, so runs of differently sized
+clusters can be compared.
+"""
+import collections
+import datetime
+import json
+import logging
+import os
+import re
+import time
+
+import k93s.transport
+
+
+logger = logging.getLogger(__name__)
+
+results_directory_name = 'bench'
+namespace = 'k93s-bench'
+_pause_image = 'rancher/pause:3.1'
+_step_label = 'k93s-bench-step'
+_metric = 'apiserver_request_duration_seconds'
+_bucket_re = re.compile(r'^' + _metric + r'_bucket\{(?P<labels>[^}]*)\} (?P<value>\S+)$')
+_label_re = re.compile(r'(\w+)="([^"]*)"')
+_api_calls = (('POST', 'pods'), ('LIST', 'pods'), ('GET', 'pods'))
+_resolution_note = ('SCHED/s and START latencies come from API server timestamps, '
+                    'which have a resolution of one second.')
+# Config keys, which describe sizing of VMs and nodes
+_tier_keys = ('count', 'distro', 'vcpus', 'memory', 'root_disk_size',
+              'k3s_profile', 'k3s_options')
+_backend_keys = ('cpu_pinning', 'nic_queues', 'vhost_net', 'mtu', 'placement', 'hosts')
+
+
+def _kubectl(host, args, stdin=None, timeout=60):
+    completed = k93s.transport.pool.run(host, 'kubectl ' + args, stdin=stdin, timeout=timeout)
+    return completed.stdout.decode()
+
+
+def pod_manifests(step, count):
+    """List of `count` pause pods of given step."""
+    return {
+        'apiVersion': 'v1',
+        'kind': 'List',
+        'items': [{
+            'apiVersion': 'v1',
+            'kind': 'Pod',
+            'metadata': {
+                'name': 'bench-{:d}-{:d}'.format(step, i),
+                'namespace': namespace,
+                'labels': {_step_label: str(step)},
+            },
+            'spec': {
+                'terminationGracePeriodSeconds': 0,
+                'containers': [{'name': 'pause', 'image': _pause_image}],
+            },
+        } for i in range(count)],
+    }
+
+
+def parse_histograms(metrics_text):
+    """Read cumulative buckets of API server request duration histograms.
+
+    :returns: Mapping of (verb, resource) to mapping of bucket bound to count.
+    :rtype: dict
+    """
+    histograms = collections.defaultdict(lambda: collections.defaultdict(float))
+    for line in metrics_text.splitlines():
+        match = _bucket_re.match(line)
+        if not match:
+            continue
+        labels = dict(_label_re.findall(match.group('labels')))
+        if labels.get('subresource'):
+            # e.g. bindings of pods, made by scheduler
+            continue
+        bound = float(labels['le'])
+        key = (labels.get('verb'), labels.get('resource'))
+        # Buckets of several scopes and components sum up
+        histograms[key][bound] += float(match.group('value'))
+    return histograms
+
+
+def histogram_quantile(q, buckets):
+    """Estimate quantile of cumulative histogram buckets, as Prometheus does.
+
+    :returns: Quantile estimate in seconds, or None for an empty histogram.
+    """
+    bounds = sorted(buckets)
+    if not bounds or not buckets[bounds[-1]]:
+        return None
+    rank = q * buckets[bounds[-1]]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound in bounds:
+        if buckets[bound] >= rank:
+            if bound == float('inf'):
+                return lower_bound
+            if buckets[bound] == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (
+                (rank - lower_count) / (buckets[bound] - lower_count))
+        lower_bound, lower_count = bound, buckets[bound]
+    return lower_bound
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values, or None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(q * len(values))) - 1))]
+
+
+def _parse_time(timestamp):
+    return datetime.datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ').replace(
+        tzinfo=datetime.timezone.utc).timestamp()
+
+
+def pod_timings(pods):
+    """Creation, scheduling and start times of pods, as recorded by API server.
+
+    :param pods: Pod list, as printed by `kubectl get pods -o json`.
+    :type pods: dict
+    :returns: Timings of pods, with keys 'created', 'scheduled' and
+              'started', the latter two None until it happens.
+    :rtype: list
+    """
+    timings = []
+    for pod in pods.get('items', []):
+        status = pod.get('status', {})
+        scheduled = next((c['lastTransitionTime'] for c in status.get('conditions', [])
+                          if c.get('type') == 'PodScheduled' and c.get('status') == 'True'),
+                         None)
+        started = [s['state']['running']['startedAt']
+                   for s in status.get('containerStatuses', [])
+                   if 'running' in s.get('state', {})]
+        timings.append({
+            'created': _parse_time(pod['metadata']['creationTimestamp']),
+            'scheduled': _parse_time(scheduled) if scheduled else None,
+            'started': _parse_time(max(started)) if started else None,
+        })
+    return timings
+
+
+def _api_latencies(before, after):
+    """99th and 50th percentiles of API calls made in between two histogram reads."""
+    latencies = {}
+    for verb, resource in _api_calls:
+        key = (verb, resource)
+        delta = {bound: count - before.get(key, {}).get(bound, 0)
+                 for bound, count in after.get(key, {}).items()}
+        latencies['{}_{}'.format(verb.lower(), resource)] = {
+            'p50': histogram_quantile(0.5, delta),
+            'p99': histogram_quantile(0.99, delta),
+        }
+    return latencies
+
+
+def _summarize(rate, timings, api_latencies, duration):
+    scheduled = [t for t in timings if t['scheduled'] is not None]
+    startup = [t['started'] - t['created'] for t in timings if t['started'] is not None]
+    scheduling = [t['scheduled'] - t['created'] for t in scheduled]
+    if scheduled:
+        span = max(t['scheduled'] for t in scheduled) - min(t['created'] for t in timings)
+        # Timestamps have one second resolution
+        throughput = len(scheduled) / max(span, 1.0)
+    else:
+        throughput = 0.0
+    return {
+        'rate': rate,
+        'pods': len(timings),
+        'started': len(startup),
+        'duration': duration,
+        'scheduling_throughput': throughput,
+        'scheduling_latency': {'p50': percentile(scheduling, 0.5),
+                               'p99': percentile(scheduling, 0.99)},
+        'startup_latency': {'p50': percentile(startup, 0.5),
+                            'p90': percentile(startup, 0.9),
+                            'p99': percentile(startup, 0.99)},
+        'api_latency': api_latencies,
+    }
+
+
+def run_step(host, step, rate, count, timeout):
+    """Create `count` pods at `rate` pods per second, and wait for them to start.
+
+    :returns: Summary of the step.
+    :rtype: dict
+    """
+    selector = '-l {!s}={:d}'.format(_step_label, step)
+    items = pod_manifests(step, count)['items']
+    before = parse_histograms(_kubectl(host, 'get --raw /metrics'))
+    started = time.monotonic()
+    for batch, offset in enumerate(range(0, count, rate)):
+        delay = started + batch - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1:
+            logger.warning('Pod creation lags %.1fs behind rate %d/s', -delay, rate)
+        pods = {'apiVersion': 'v1', 'kind': 'List', 'items': items[offset:offset + rate]}
+        _kubectl(host, 'create -f -', stdin=json.dumps(pods).encode())
+
+    while True:
+        pods = json.loads(_kubectl(host, 'get pods -n {} {} -o json'.format(namespace, selector)))
+        timings = pod_timings(pods)
+        if all(t['started'] is not None for t in timings):
+            break
+        if time.monotonic() - started > timeout:
+            logger.warning('%d of %d pods did not start in %ds', sum(
+                t['started'] is None for t in timings), count, timeout)
+            break
+        time.sleep(1)
+    duration = time.monotonic() - started
+    after = parse_histograms(_kubectl(host, 'get --raw /metrics'))
+
+    _kubectl(host, 'delete pods -n {} {} --grace-period=0 --wait=true'.format(
+        namespace, selector), timeout=timeout)
+    return _summarize(rate, timings, _api_latencies(before, after), duration)
+
+
+def vm_profile(config_contents):
+    """Sizing of cluster VMs and nodes, as configured."""
+    backend_config = config_contents.get('vms_backend_config', {})
+    return {
+        'vms_backend': config_contents.get('vms_backend', 'k93s.vms.lightning'),
+        'k3s_version': config_contents.get('k3s_version'),
+        'masters': {k: v for k, v in config_contents.get('masters', {}).items()
+                    if k in _tier_keys},
+        'agents': {k: v for k, v in config_contents.get('agents', {}).items()
+                   if k in _tier_keys},
+        'backend': {k: v for k, v in backend_config.items() if k in _backend_keys},
+    }
+
+
+def run(host, config_contents, rates, count, timeout=300):
+    """Run benchmark steps of given rates on cluster, whose master is `host`.
+
+    :param host: First master of the cluster.
+    :type host: k93s.transport.SSHHost
+    :param config_contents: Configuration dictionary.
+    :type config_contents: dict
+    :param rates: Pod creation rates of steps, pods per second.
+    :type rates: list
+    :param count: Number of pods created in every step.
+    :type count: int
+    :param timeout: Seconds to wait for pods of a step to start.
+    :type timeout: float
+    :rtype: dict
+    """
+    result = {
+        'cluster': config_contents.get('name'),
+        'started': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'profile': vm_profile(config_contents),
+        'pods_per_step': count,
+        'steps': [],
+    }
+    k93s.transport.pool.run(host, 'kubectl create namespace {}'.format(namespace), check=False)
+    try:
+        for step, rate in enumerate(rates):
+            logger.warning('Benchmark step %d: %d pods at %d pods/s', step + 1, count, rate)
+            result['steps'].append(run_step(host, step, int(rate), count, timeout))
+    finally:
+        # Waited for, as a next run can not create pods in a terminating namespace
+        k93s.transport.pool.run(
+            host, 'kubectl delete namespace {} --wait=true --timeout={:d}s'.format(
+                namespace, int(timeout)), timeout=timeout + 60, check=False)
+    return result
+
+
+def save(state_dir, result):
+    """Store benchmark result in cluster state directory, return its path."""
+    directory = os.path.join(state_dir, results_directory_name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, result['started'].replace(':', '') + '.json')
+    with open(path, 'w') as fl:
+        json.dump(result, fl, indent=2, sort_keys=True)
+    return path
+
+
+def load_all(state_dir):
+    """Read stored benchmark results, oldest first."""
+    directory = os.path.join(state_dir, results_directory_name)
+    if not os.path.isdir(directory):
+        return []
+    results = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as fl:
+                results.append(json.load(fl))
+    return results
+
+
+def _sizing(tier):
+    return '{}x{}cpu/{}M'.format(tier.get('count', '-'), tier.get('vcpus', '-'),
+                                 tier.get('memory', '-'))
+
+
+def _seconds(value):
+    return '-' if value is None else '{:.3f}'.format(value)
+
+
+def format_table(results):
+    """Render steps of benchmark results as a plain text table."""
+    table = [['STARTED', 'MASTERS', 'AGENTS', 'PROFILE', 'RATE', 'SCHED/s',
+              'START p50', 'START p99', 'POST p99', 'LIST p99']]
+    for result in results:
+        profile = result['profile']
+        for step in result['steps']:
+            table.append([
+                result['started'],
+                _sizing(profile['masters']),
+                _sizing(profile['agents']),
+                profile['agents'].get('k3s_profile', 'default'),
+                str(step['rate']),
+                '{:.1f}'.format(step['scheduling_throughput']),
+                _seconds(step['startup_latency']['p50']),
+                _seconds(step['startup_latency']['p99']),
+                _seconds(step['api_latency']['post_pods']['p99']),
+                _seconds(step['api_latency']['list_pods']['p99']),
+            ])
+    widths = [max(len(line[i]) for line in table) for i in range(len(table[0]))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip()
+             for line in table]
+    return '\n'.join(lines + [_resolution_note])
+
+
+__all__ = ['namespace', 'pod_manifests', 'parse_histograms', 'histogram_quantile',
+           'percentile', 'pod_timings', 'run_step', 'vm_profile', 'run', 'save',
+           'load_all', 'format_table']
@@ -0,0 +1,184 @@
+"""Diagnostics of cluster nodes: k3s logs, service state and resource snapshots.
+
+Nodes are probed concurrently over pooled SSH connections, a bounded
+number at a time, so collecting from a cluster takes about as long as
+collecting from its slowest node. Every node gets its own deadline, so
+an unreachable or hanging node does not hold up the rest. Outputs of a
+node are written into one gzip compressed tar bundle as soon as the node
+is done, so outputs of finished nodes are not kept in memory.
+"""
+import concurrent.futures
+import datetime
+import io
+import json
+import logging
+import os
+import subprocess
+import tarfile
+import time
+
+import k93s.transport
+
+
+logger = logging.getLogger(__name__)
+
+bundles_directory_name = 'diagnostics'
+# Return code of ssh itself, when it can not reach a node
+_ssh_failure = 255
+_services = {
+    'kubernetes_master': 'k3s',
+    'kubernetes_agent': 'k3s-node',
+    'kubernetes_standby': 'k3s-node',
+}
+# File name in bundle, and shell command producing its contents
+_commands = (
+    ('journal-{service}.log', 'sudo -n journalctl -u {service} --no-pager -n {lines:d}'),
+    ('systemctl-{service}.txt', 'systemctl status {service} --no-pager --full'),
+    ('dmesg.txt', 'sudo -n dmesg -T'),
+    ('sysctl.txt', 'sudo -n sysctl -a'),
+    ('df.txt', 'df -h; df -i'),
+    ('memory.txt', 'free -m; cat /proc/meminfo'),
+    ('processes.txt', 'ps aux --sort=-%cpu'),
+    ('network.txt', 'ip addr; ip route'),
+    ('uptime.txt', 'uptime'),
+)
+# kubectl of k3s, as it reads the root owned kubeconfig of k3s
+_master_commands = (
+    ('nodes.txt', 'sudo -n k3s kubectl get nodes -o wide'),
+    ('pods.txt', 'sudo -n k3s kubectl get pods --all-namespaces -o wide'),
+    ('events.txt',
+     'sudo -n k3s kubectl get events --all-namespaces --sort-by=.lastTimestamp'),
+)
+
+
+def node_commands(groups, lines=5000):
+    """Files to collect from a node of given inventory groups.
+
+    :param groups: Inventory groups of the node.
+    :type groups: list
+    :param lines: Number of most recent journal lines to collect.
+    :type lines: int
+    :returns: Pairs of file name and shell command.
+    :rtype: list
+    """
+    service = next((_services[group] for group in groups if group in _services), None)
+    commands = [(name, command) for name, command in _commands
+                if service or '{service}' not in command]
+    if 'kubernetes_master' in groups:
+        commands += _master_commands
+    return [(name.format(service=service), command.format(service=service, lines=lines))
+            for name, command in commands]
+
+
+def collect_node(host, commands, timeout):
+    """Run commands on a node one after another, until its deadline passes.
+
+    :param host: Node to collect from.
+    :type host: k93s.transport.SSHHost
+    :param commands: Pairs of file name and shell command.
+    :type commands: list
+    :param timeout: Seconds to spend on the node in total.
+    :type timeout: float
+    :returns: Pairs of file name and its contents, and summary of the node.
+    :rtype: tuple
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    files = []
+    summary = {'name': host.name, 'collected': 0, 'failed': [], 'error': None}
+    for name, command in commands:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            summary['error'] = 'timed out'
+            break
+        try:
+            completed = k93s.transport.pool.run(host, command, timeout=remaining, check=False)
+        except subprocess.TimeoutExpired:
+            summary['error'] = 'timed out'
+            break
+        if completed.returncode == _ssh_failure:
+            summary['error'] = completed.stderr.decode(errors='replace').strip() or 'unreachable'
+            break
+        if completed.returncode:
+            summary['failed'].append(name)
+        files.append((name, completed.stdout + completed.stderr))
+        summary['collected'] += 1
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    return files, summary
+
+
+def _add_file(bundle, name, contents, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = len(contents)
+    info.mtime = mtime
+    info.mode = 0o644
+    bundle.addfile(info, io.BytesIO(contents))
+
+
+def collect(inventory, path, max_workers=16, timeout=60, lines=5000):
+    """Collect diagnostics of all nodes of a cluster into a bundle.
+
+    :param inventory: Ansible inventory of the cluster.
+    :type inventory: k93s.inventory.Inventory
+    :param path: Bundle file to write, a gzip compressed tar archive.
+    :type path: str
+    :param max_workers: Number of nodes to collect from at a time.
+    :type max_workers: int
+    :param timeout: Seconds to spend on any single node.
+    :type timeout: float
+    :param lines: Number of most recent journal lines to collect.
+    :type lines: int
+    :returns: Summaries of nodes, in order of inventory.
+    :rtype: list
+    """
+    groups = {name: [group for group, hosts in inventory.groups.items() if name in hosts]
+              for name in inventory.hosts}
+    mtime = time.time()
+    summaries = {}
+    try:
+        with tarfile.open(path + '.tmp', 'w:gz') as bundle:
+            _add_file(bundle, 'inventory.json',
+                      json.dumps(inventory.to_dynamic(), indent=2).encode(), mtime)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(collect_node,
+                                           k93s.transport.host_from_inventory(inventory, name),
+                                           node_commands(groups[name], lines), timeout)
+                           for name in inventory.hosts]
+                for future in concurrent.futures.as_completed(futures):
+                    files, summary = future.result()
+                    if summary['error']:
+                        logger.warning('Diagnostics of %s are incomplete: %s',
+                                       summary['name'], summary['error'])
+                    for name, contents in files:
+                        _add_file(bundle, os.path.join(summary['name'], name), contents, mtime)
+                    summaries[summary['name']] = summary
+            summaries = [summaries[name] for name in inventory.hosts]
+            _add_file(bundle, 'summary.json', json.dumps(summaries, indent=2).encode(), mtime)
+    except BaseException:
+        # Opening the bundle may have failed before it was created
+        if os.path.exists(path + '.tmp'):
+            os.unlink(path + '.tmp')
+        raise
+    os.replace(path + '.tmp', path)
+    return summaries
+
+
+def bundle_path(state_dir):
+    """Default location of a new bundle in cluster state directory."""
+    directory = os.path.join(state_dir, bundles_directory_name)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, datetime.datetime.now().strftime('%Y%m%dT%H%M%S') + '.tar.gz')
+
+
+def format_table(summaries):
+    """Render summaries of nodes as a plain text table."""
+    table = [['NAME', 'FILES', 'FAILED', 'SECONDS', 'ERROR']]
+    table.extend([summary['name'], str(summary['collected']),
+                  ','.join(summary['failed']) or '-', '{:.1f}'.format(summary['seconds']),
+                  summary['error'] or '-'] for summary in summaries)
+    widths = [max(len(line[i]) for line in table) for i in range(len(table[0]))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip()
+                     for line in table)
+
+
+__all__ = ['node_commands', 'collect_node', 'collect', 'bundle_path', 'format_table']
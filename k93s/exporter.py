@@ -0,0 +1,155 @@
+"""Prometheus exporter of cluster VM resource usage and k93s operation metrics.
+
+Every scrape reads stats of all VMs with one libvirt call per host, so
+scraping stays cheap for clusters of many nodes. Metrics of k93s
+operations come from the cluster state directory, where every k93s
+command leaves them.
+"""
+import http.server
+import logging
+import threading
+import time
+
+import k93s.metrics
+
+
+logger = logging.getLogger(__name__)
+
+content_type = 'text/plain; version=0.0.4; charset=utf-8'
+# Metric families of domains: name, type, help and how to read values from a status row
+_domain_families = (
+    ('k93s_domain_running', 'gauge', 'Whether domain is running.',
+     lambda row: [({}, int(row.get('state') == 'running'))]),
+    ('k93s_domain_vcpus', 'gauge', 'Number of vCPUs of domain.',
+     lambda row: [({}, row['vcpus'])] if 'vcpus' in row else []),
+    ('k93s_domain_cpu_seconds_total', 'counter', 'CPU time used by domain.',
+     lambda row: [({}, row['cpu_time'])] if 'cpu_time' in row else []),
+    ('k93s_domain_memory_balloon_bytes', 'gauge', 'Current balloon size of domain.',
+     lambda row: [({}, row['balloon_bytes'])] if 'balloon_bytes' in row else []),
+    ('k93s_domain_memory_rss_bytes', 'gauge', 'Resident memory of domain on the host.',
+     lambda row: [({}, row['rss_bytes'])] if 'rss_bytes' in row else []),
+)
+_device_families = (
+    ('disks', 'device', 'k93s_domain_block_read_bytes_total', 'read_bytes',
+     'Bytes read from domain disk.'),
+    ('disks', 'device', 'k93s_domain_block_write_bytes_total', 'write_bytes',
+     'Bytes written to domain disk.'),
+    ('disks', 'device', 'k93s_domain_block_read_requests_total', 'read_requests',
+     'Read requests of domain disk.'),
+    ('disks', 'device', 'k93s_domain_block_write_requests_total', 'write_requests',
+     'Write requests of domain disk.'),
+    ('nics', 'interface', 'k93s_domain_network_receive_bytes_total', 'rx_bytes',
+     'Bytes received by domain NIC.'),
+    ('nics', 'interface', 'k93s_domain_network_transmit_bytes_total', 'tx_bytes',
+     'Bytes sent by domain NIC.'),
+    ('nics', 'interface', 'k93s_domain_network_receive_packets_total', 'rx_packets',
+     'Packets received by domain NIC.'),
+    ('nics', 'interface', 'k93s_domain_network_transmit_packets_total', 'tx_packets',
+     'Packets sent by domain NIC.'),
+    ('nics', 'interface', 'k93s_domain_network_receive_drops_total', 'rx_drops',
+     'Received packets of domain NIC, which were dropped.'),
+    ('nics', 'interface', 'k93s_domain_network_transmit_drops_total', 'tx_drops',
+     'Sent packets of domain NIC, which were dropped.'),
+)
+
+
+def _domain_labels(row):
+    labels = {'domain': row['name'], 'role': row['role']}
+    if row.get('host'):
+        labels['host'] = row['host']
+    return labels
+
+
+def domain_samples(rows):
+    """Samples of VM resource usage, for :func:`k93s.metrics.format_samples`.
+
+    :param rows: Status rows of VMs, as returned by backend `stats` action
+                 with devices.
+    :type rows: list
+    :rtype: list
+    """
+    samples = []
+    for family, kind, description, read in _domain_families:
+        for row in rows:
+            for labels, value in read(row):
+                samples.append((family, kind, description, family,
+                                dict(_domain_labels(row), **labels), value))
+    for devices, label, family, key, description in _device_families:
+        for row in rows:
+            for device in row.get(devices, []):
+                samples.append((family, 'counter', description, family,
+                                dict(_domain_labels(row), **{label: device['name']}),
+                                device[key]))
+    return samples
+
+
+class Exporter:
+    """Scrape metrics of a cluster, one scrape at a time."""
+
+    def __init__(self, invoke, state_dir):
+        """
+        :param invoke: Action invoker of a VMs session, see :func:`k93s.vms.session`.
+        :type invoke: callable
+        :param state_dir: Cluster state directory.
+        :type state_dir: str
+        """
+        self._invoke = invoke
+        self._state_dir = state_dir
+        self._lock = threading.Lock()
+
+    def scrape(self):
+        """Render all metrics in Prometheus text format."""
+        with self._lock:
+            started = time.monotonic()
+            # Not timed, as every scrape would add a stats operation to stored metrics
+            rows = self._invoke('stats', True, quiet=True, timed=False)
+            samples = domain_samples(rows)
+            samples.extend(k93s.metrics.samples(*k93s.metrics.load(self._state_dir)))
+            samples.append(('k93s_exporter_scrape_duration_seconds', 'gauge',
+                            'Duration of the scrape.', 'k93s_exporter_scrape_duration_seconds',
+                            {}, time.monotonic() - started))
+            return k93s.metrics.format_samples(samples)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    exporter = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        try:
+            body = self.exporter.scrape().encode()
+        except Exception:
+            logger.exception('Scrape failed')
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - ' + format, self.address_string(), *args)
+
+
+def serve(exporter, address='127.0.0.1', port=9693):
+    """Serve metrics over HTTP until interrupted.
+
+    :param exporter: Exporter of the cluster.
+    :type exporter: Exporter
+    """
+    handler = type('Handler', (_Handler,), {'exporter': exporter})
+    server = http.server.ThreadingHTTPServer((address, port), handler)
+    logger.warning('Serving metrics on http://%s:%d/metrics', address, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+__all__ = ['Exporter', 'domain_samples', 'serve']
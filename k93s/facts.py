@@ -0,0 +1,80 @@
+"""Persistent cache of Ansible facts of cluster nodes.
+
+Facts are cached by Ansible's jsonfile plugin in the cluster state
+directory, and are only gathered for nodes which have no cached facts.
+A node's cache is dropped when its VM is recreated, as identified by
+libvirt domain UUID.
+"""
+import json
+import logging
+import os
+
+import k93s.utils
+
+
+logger = logging.getLogger(__name__)
+
+_identities_file_name = '.identities.json'
+
+
+class FactCache:
+    """Directory with cached facts of cluster nodes."""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    @classmethod
+    def for_config(cls, config_file):
+        """Fact cache of a cluster, kept in state directory of its config."""
+        return cls(os.path.join(k93s.utils.state_directory(config_file), 'facts'))
+
+    def _read_identities(self):
+        try:
+            with open(os.path.join(self.directory, _identities_file_name)) as fl:
+                return json.load(fl)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_identities(self, identities):
+        with open(os.path.join(self.directory, _identities_file_name), 'w') as fl:
+            json.dump(identities, fl)
+
+    def forget(self, node):
+        """Drop cached facts of given node."""
+        try:
+            os.unlink(os.path.join(self.directory, node))
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, rows):
+        """Drop cached facts of nodes, whose VMs have been recreated or removed.
+
+        :param rows: Status rows of VMs, as returned by backend `stats` action.
+        :type rows: list
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        identities = self._read_identities()
+        for row in rows:
+            uuid = row.get('uuid')
+            if identities.get(row['name']) != uuid or uuid is None:
+                if os.path.exists(os.path.join(self.directory, row['name'])):
+                    logger.warning('Dropping cached facts of recreated node %s', row['name'])
+                self.forget(row['name'])
+            if uuid is None:
+                identities.pop(row['name'], None)
+            else:
+                identities[row['name']] = uuid
+        self._write_identities(identities)
+
+    def ansible_env(self):
+        """Environment variables, which make Ansible use this cache."""
+        return {
+            'ANSIBLE_GATHERING': 'smart',
+            'ANSIBLE_CACHE_PLUGIN': 'jsonfile',
+            'ANSIBLE_CACHE_PLUGIN_CONNECTION': self.directory,
+            # Cached facts never expire, they are dropped with their VMs
+            'ANSIBLE_CACHE_PLUGIN_TIMEOUT': '0',
+        }
+
+
+__all__ = ['FactCache']
@@ -0,0 +1,83 @@
+"""Ansible inventory of cluster nodes."""
+import collections
+import shlex
+
+
+class Inventory:
+    """Hosts with their variables, and groups of host names."""
+
+    def __init__(self, hosts=None, groups=None):
+        self.hosts = collections.OrderedDict(hosts or {})
+        self.groups = collections.OrderedDict(groups or {})
+
+    @classmethod
+    def from_ini(cls, contents):
+        """Parse INI inventory, e.g. as printed by virt-lightning."""
+        inventory = cls()
+        group = None
+        for line in contents.splitlines():
+            line = line.strip()
+            if not line or line.startswith(('#', ';')):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                group = line[1:-1]
+                inventory.groups.setdefault(group, [])
+                continue
+            name, *assignments = shlex.split(line)
+            hostvars = inventory.hosts.setdefault(name, {})
+            hostvars.update(a.split('=', 1) for a in assignments if '=' in a)
+            if group is not None:
+                inventory.groups[group].append(name)
+        return inventory
+
+    def add_host(self, name, hostvars, groups=()):
+        """Add host with given variables to given groups."""
+        self.hosts[name] = dict(hostvars)
+        for group in groups:
+            self.groups.setdefault(group, []).append(name)
+
+    def to_dynamic(self):
+        """Represent inventory in the JSON format of Ansible dynamic inventory scripts."""
+        grouped = {name for hosts in self.groups.values() for name in hosts}
+        result = {
+            '_meta': {'hostvars': {name: dict(hostvars) for name, hostvars in self.hosts.items()}},
+            'all': {'children': list(self.groups) + ['ungrouped']},
+            'ungrouped': {'hosts': [name for name in self.hosts if name not in grouped]},
+        }
+        result.update((group, {'hosts': list(hosts)}) for group, hosts in self.groups.items())
+        return result
+
+    def to_yaml(self):
+        """Represent inventory in the format of Ansible YAML inventory plugin."""
+        return {
+            'all': {
+                'hosts': {name: dict(hostvars) for name, hostvars in self.hosts.items()},
+                'children': {group: {'hosts': {name: None for name in hosts}}
+                             for group, hosts in self.groups.items()},
+            },
+        }
+
+    def group_hosts(self, group):
+        """Names of hosts in given group."""
+        return list(self.groups.get(group, []))
+
+    def host(self, name):
+        """Variables of given host, empty for unknown hosts, as Ansible expects."""
+        return self.hosts.get(name, {})
+
+    def remove_host(self, name):
+        """Remove host from inventory and from all its groups."""
+        self.hosts.pop(name, None)
+        for hosts in self.groups.values():
+            if name in hosts:
+                hosts.remove(name)
+
+
+def as_inventory(inventory):
+    """Accept both Inventory, and INI inventory contents."""
+    if isinstance(inventory, Inventory):
+        return inventory
+    return Inventory.from_ini(inventory)
+
+
+__all__ = ['Inventory', 'as_inventory']
@@ -0,0 +1,98 @@
+"""Journal of cluster bring-up phases, completed per node.
+
+The journal lives in the cluster state directory, one file per node with
+one completed phase per line, so Ansible forks can append to it
+concurrently. Reruns of `k93s kubernetes` consult it to redo only the
+work, which has not been completed yet.
+"""
+import logging
+import os
+import shutil
+
+import k93s.utils
+
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('created', 'booted', 'prepared', 'installed', 'joined')
+
+
+class Journal:
+    """Completed bring-up phases of cluster nodes."""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    @classmethod
+    def for_config(cls, config_file):
+        """Journal of a cluster, kept in state directory of its config."""
+        return cls(os.path.join(k93s.utils.state_directory(config_file), 'journal'))
+
+    def _node_file(self, node):
+        return os.path.join(self.directory, node)
+
+    def phases(self, node):
+        """Phases completed by given node, in order of completion."""
+        try:
+            with open(self._node_file(node)) as fl:
+                return [line.strip() for line in fl if line.strip() in PHASES]
+        except FileNotFoundError:
+            return []
+
+    def done(self, node, phase):
+        return phase in self.phases(node)
+
+    def pending(self, nodes, phase):
+        """Names of given nodes, which have not completed given phase yet."""
+        return [node for node in nodes if not self.done(node, phase)]
+
+    def mark(self, node, *phases):
+        """Record given phases as completed by a node."""
+        os.makedirs(self.directory, exist_ok=True)
+        completed = self.phases(node)
+        with open(self._node_file(node), 'a') as fl:
+            for phase in phases:
+                if phase not in PHASES:
+                    raise RuntimeError('Unknown bring-up phase: {!s}'.format(phase))
+                if phase not in completed:
+                    fl.write(phase + '\n')
+
+    def forget(self, node, *phases):
+        """Forget given phases of a node, or the node entirely without phases."""
+        kept = [p for p in self.phases(node) if phases and p not in phases]
+        if kept:
+            with open(self._node_file(node), 'w') as fl:
+                fl.writelines(p + '\n' for p in kept)
+        elif os.path.exists(self._node_file(node)):
+            os.unlink(self._node_file(node))
+
+    def clear(self):
+        """Forget all nodes."""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+
+    def reconcile(self, rows):
+        """Drop journal entries, which do not match actual VM state any more.
+
+        :param rows: Status rows of VMs, as returned by backend `stats` action.
+        :type rows: list
+        """
+        for row in rows:
+            if row.get('state') == 'missing' and self.phases(row['name']):
+                logger.warning('%s does not exist any more, it will be set up again.',
+                               row['name'])
+                self.forget(row['name'])
+            elif row.get('state') not in ('running', 'suspended') and \
+                    self.done(row['name'], 'booted'):
+                self.forget(row['name'], 'booted')
+
+    def extra_vars(self, nodes):
+        """Ansible extra variables, which let playbooks skip completed phases
+        of given nodes, and record newly completed ones."""
+        return {
+            'k93s_journal_dir': self.directory,
+            'k93s_journal': {node: self.phases(node) for node in nodes},
+        }
+
+
+__all__ = ['Journal', 'PHASES']
@@ -0,0 +1,170 @@
+"""Counters and histograms of k93s operations, kept across CLI runs.
+
+Operations record metrics in memory of the process, which are merged into
+a file in the cluster state directory when a command is done, so the
+exporter serves totals of all runs, including those of background jobs.
+"""
+import collections
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+metrics_file_name = 'metrics.json'
+# Upper bounds of duration buckets, in seconds: operations take from seconds to many minutes
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, float('inf'))
+
+_lock = threading.Lock()
+_counters = collections.defaultdict(float)
+_histograms = {}
+_help = {
+    'k93s_operation_duration_seconds': ('histogram', 'Duration of k93s operations.'),
+    'k93s_operation_failures_total': ('counter', 'Number of failed k93s operations.'),
+    'k93s_image_fetch_bytes_total': ('counter', 'Bytes of VM images fetched.'),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter of this process."""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name, value, **labels):
+    """Record a value in a histogram of this process."""
+    with _lock:
+        histogram = _histograms.setdefault(_key(name, labels), {
+            'buckets': [0] * len(DURATION_BUCKETS), 'sum': 0.0, 'count': 0})
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+@contextlib.contextmanager
+def timed(operation, **labels):
+    """Record duration of the enclosed operation, and whether it failed."""
+    started = time.monotonic()
+    try:
+        yield
+    except BaseException:
+        inc('k93s_operation_failures_total', operation=operation, **labels)
+        raise
+    finally:
+        observe('k93s_operation_duration_seconds', time.monotonic() - started,
+                operation=operation, **labels)
+
+
+def _read(metrics_file):
+    try:
+        with open(metrics_file, 'r') as fl:
+            stored = json.load(fl)
+    except (OSError, ValueError):
+        return {}, {}
+    counters = {_key(name, labels): value for name, labels, value in stored.get('counters', [])}
+    histograms = {_key(name, labels): value
+                  for name, labels, value in stored.get('histograms', [])}
+    return counters, histograms
+
+
+def load(state_dir):
+    """Read metrics stored by all runs of k93s for a cluster.
+
+    :returns: Counters and histograms, keyed by (name, labels).
+    :rtype: tuple
+    """
+    return _read(os.path.join(state_dir, metrics_file_name))
+
+
+def flush(state_dir):
+    """Merge metrics of this process into metrics stored for a cluster."""
+    with _lock:
+        counters, histograms = dict(_counters), dict(_histograms)
+        _counters.clear()
+        _histograms.clear()
+    if not (counters or histograms):
+        return
+    metrics_file = os.path.join(state_dir, metrics_file_name)
+    # Background pool refills may flush at the same time
+    with open(metrics_file + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        stored_counters, stored_histograms = _read(metrics_file)
+        for key, value in counters.items():
+            stored_counters[key] = stored_counters.get(key, 0) + value
+        for key, value in histograms.items():
+            stored = stored_histograms.setdefault(key, {
+                'buckets': [0] * len(DURATION_BUCKETS), 'sum': 0.0, 'count': 0})
+            stored['buckets'] = [a + b for a, b in zip(stored['buckets'], value['buckets'])]
+            stored['sum'] += value['sum']
+            stored['count'] += value['count']
+        with open(metrics_file + '.tmp', 'w') as fl:
+            json.dump({
+                'counters': [[name, dict(labels), value]
+                             for (name, labels), value in sorted(stored_counters.items())],
+                'histograms': [[name, dict(labels), value]
+                               for (name, labels), value in sorted(stored_histograms.items())],
+            }, fl)
+        os.replace(metrics_file + '.tmp', metrics_file)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_samples(samples):
+    """Render samples in Prometheus text exposition format.
+
+    :param samples: Tuples of (family, type, help, name, labels, value),
+                    with samples of a family next to each other.
+    :type samples: list
+    :rtype: str
+    """
+    lines = []
+    last_family = None
+    for family, kind, description, name, labels, value in samples:
+        if family != last_family:
+            lines.append('# HELP {} {}'.format(family, description))
+            lines.append('# TYPE {} {}'.format(family, kind))
+            last_family = family
+        lines.append('{}{} {}'.format(name, _labels(sorted(labels.items())), _number(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def samples(counters, histograms):
+    """Samples of stored counters and histograms, for :func:`format_samples`."""
+    result = []
+    for (name, labels), value in sorted(counters.items()):
+        kind, description = _help.get(name, ('counter', name))
+        result.append((name, kind, description, name, dict(labels), value))
+    for (name, labels), value in sorted(histograms.items()):
+        kind, description = _help.get(name, ('histogram', name))
+        for bound, count in zip(DURATION_BUCKETS, value['buckets']):
+            result.append((name, kind, description, name + '_bucket',
+                           dict(labels, le=_number(bound)), count))
+        result.append((name, kind, description, name + '_sum', dict(labels), value['sum']))
+        result.append((name, kind, description, name + '_count', dict(labels), value['count']))
+    return result
+
+
+__all__ = ['DURATION_BUCKETS', 'inc', 'observe', 'timed', 'load', 'flush', 'format_samples',
+           'samples']
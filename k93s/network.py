@@ -1,8 +1,11 @@
 """IP Addresses for nodes."""
 import ipaddress
+import socket
+import zlib
 
 
 _state = {'master': 10, 'agent': 110}
+_isolated_networks = ipaddress.ip_network('10.93.0.0/16')
 
 
 def get_next_ip_address(cidr, host_type):
@@ -18,4 +21,33 @@ def get_next_ip_address(cidr, host_type):
     return str(current_host)
 
 
-__all__ = ['get_next_ip_address', ]
+def cluster_cidr(cluster_name):
+    """Derive a /24 network for the cluster, stable across runs."""
+    subnets = list(_isolated_networks.subnets(new_prefix=24))
+    return str(subnets[zlib.crc32(cluster_name.encode()) % len(subnets)])
+
+
+def cluster_network_name(cluster_name):
+    """Name of own libvirt network of the cluster, short enough for a bridge name.
+
+    Bridge names take 15 characters at most, so the network is named after
+    a hash of the whole cluster name, rather than after a prefix of it.
+    """
+    return 'k93s-{:08x}'.format(zlib.crc32(cluster_name.encode()))
+
+
+def gateway_address(cidr):
+    """Address of the host on a libvirt NAT network, its first host address."""
+    return str(next(ipaddress.ip_network(cidr).hosts()))
+
+
+def local_address(destination):
+    """Address of this host, which packets to given destination are sent from."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        # Connecting a datagram socket only picks a route, nothing is sent
+        sock.connect((destination, 9))
+        return sock.getsockname()[0]
+
+
+__all__ = ['get_next_ip_address', 'cluster_cidr', 'cluster_network_name', 'gateway_address',
+           'local_address']
@@ -0,0 +1,106 @@
+"""Profiles of k3s settings, which trade bundled features for node footprint.
+
+A profile is chosen per node tier with `k3s_profile` key of `masters`
+and `agents` config sections, and may be adjusted with `k3s_options`
+key of the same section. Profiles are rendered into command line
+arguments of k3s service units.
+"""
+import copy
+
+
+PROFILES = {
+    # Plain k3s, as it comes.
+    'default': {},
+    # Smallest footprint, e.g. for nodes with 512 MB of memory.
+    'minimal': {
+        'disable': ['traefik', 'servicelb', 'metrics-server', 'local-storage'],
+        'kube_reserved': 'cpu=50m,memory=64Mi',
+        'system_reserved': 'cpu=50m,memory=64Mi',
+        'image_gc_high_threshold': 70,
+        'image_gc_low_threshold': 50,
+    },
+    # Room for workloads to perform, on larger nodes.
+    'perf': {
+        'disable': ['traefik', 'servicelb'],
+        'kube_reserved': 'cpu=250m,memory=256Mi',
+        'system_reserved': 'cpu=250m,memory=256Mi',
+        'image_gc_high_threshold': 90,
+        'image_gc_low_threshold': 80,
+        'kubelet_args': ['serialize-image-pulls=false'],
+    },
+}
+
+_OPTIONS = {'disable', 'datastore_endpoint', 'data_dir', 'kube_reserved', 'system_reserved',
+            'image_gc_high_threshold', 'image_gc_low_threshold', 'kubelet_args'}
+_SERVER_ONLY_OPTIONS = {'disable', 'datastore_endpoint'}
+
+
+def tier_options(tier_config):
+    """Resolve profile and overrides of a node tier into k3s options.
+
+    :param tier_config: A `masters` or `agents` config section.
+    :type tier_config: dict
+    :rtype: dict
+    """
+    profile_name = tier_config.get('k3s_profile', 'default')
+    if profile_name not in PROFILES:
+        raise RuntimeError('Unknown k3s profile {!s}, choose one of: {!s}'.format(
+            profile_name, ', '.join(sorted(PROFILES))))
+    options = copy.deepcopy(PROFILES[profile_name])
+    overrides = tier_config.get('k3s_options') or {}
+    unknown = set(overrides) - _OPTIONS
+    if unknown:
+        raise RuntimeError('Unknown k3s options: {!s}'.format(', '.join(sorted(unknown))))
+    options.update(overrides)
+    return options
+
+
+def k3s_args(options, server):
+    """Render k3s options into command line arguments of k3s server or agent.
+
+    Options, which only apply to servers, are left out of agent arguments.
+
+    :param options: k3s options, as resolved by :func:`tier_options`.
+    :type options: dict
+    :param server: Whether arguments are for `k3s server`, or for `k3s agent`.
+    :type server: bool
+    :rtype: list
+    """
+    if not server:
+        options = {k: v for k, v in options.items() if k not in _SERVER_ONLY_OPTIONS}
+    args = []
+    for component in options.get('disable', []):
+        args += ['--no-deploy', component]
+    if options.get('datastore_endpoint'):
+        args += ['--datastore-endpoint', options['datastore_endpoint']]
+    if options.get('data_dir'):
+        args += ['--data-dir', options['data_dir']]
+
+    kubelet_args = []
+    for option in ('kube_reserved', 'system_reserved',
+                   'image_gc_high_threshold', 'image_gc_low_threshold'):
+        if options.get(option) is not None:
+            kubelet_args.append('{!s}={!s}'.format(option.replace('_', '-'), options[option]))
+    kubelet_args += options.get('kubelet_args', [])
+    for kubelet_arg in kubelet_args:
+        args += ['--kubelet-arg', kubelet_arg]
+    return args
+
+
+def ansible_vars(config_contents):
+    """Ansible variables with k3s arguments and data directories of master and agent units."""
+    master_options = tier_options(config_contents.get('masters', {}))
+    agent_options = tier_options(config_contents.get('agents', {}))
+    result = {
+        'k3s_server_args': k3s_args(master_options, True),
+        'k3s_agent_args': k3s_args(agent_options, False),
+    }
+    # Each tier may keep its data elsewhere, so nodes pick theirs by group
+    if master_options.get('data_dir'):
+        result['k3s_server_data_dir'] = master_options['data_dir']
+    if agent_options.get('data_dir'):
+        result['k3s_agent_data_dir'] = agent_options['data_dir']
+    return result
+
+
+__all__ = ['PROFILES', 'tier_options', 'k3s_args', 'ansible_vars']
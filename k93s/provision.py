@@ -2,17 +2,25 @@
 import contextlib
 import datetime
 import getpass
+import json
 import logging
 import os
-import shlex
 import shutil
 import subprocess
+import yaml
 
 import k93s
+import k93s.inventory
+import k93s.metrics
+import k93s.profiles
+import k93s.registry
+import k93s.transport
 
 
 logger = logging.getLogger(__name__)
 _ansible_directory_prefix = 'ansible_temp/'
+_extra_vars_file_name = 'k93s_vars.json'
+_inventory_file_name = 'inventory.yml'
 
 
 @contextlib.contextmanager
@@ -24,8 +32,9 @@ def _ansible_directory(inventory_contents, tmpdirname):
             os.path.join(k93s.curdir, 'k93s/ansible/'),
             ansible_dir_name,
         )
-        with open(os.path.join(ansible_dir_name, 'inventory.ini'), 'w') as fl:
-            fl.write(inventory_contents)
+        with open(os.path.join(ansible_dir_name, _inventory_file_name), 'w') as fl:
+            inventory = k93s.inventory.as_inventory(inventory_contents)
+            yaml.safe_dump(inventory.to_yaml(), fl, default_flow_style=False)
         yield ansible_dir_name  # pragma: no cover
     finally:
         logger.warning('Done Ansible, removing directory now')
@@ -34,65 +43,144 @@ def _ansible_directory(inventory_contents, tmpdirname):
         os.chdir(k93s.curdir)
 
 
-def ansible_kubernetes(inventory_contents, config_contents, tmpdirname):
+def ansible_kubernetes(inventory_contents, config_contents, tmpdirname, playbook=None,
+                       limit=None, extra_vars=None, fact_cache=None):
     """Copy all necessary files into temporary directory.
 
     Create Ansible inventory.
 
     Invoke playbook as subprocess.
 
-    :param inventory_contents: Ansible inventory contents as string.
-    :type inventory_contents: str
+    :param inventory_contents: Ansible inventory, or its INI contents.
+    :type inventory_contents: k93s.inventory.Inventory
     :param config_contents: Configuration dictionary.
     :type config_contents: dict
     :param tmpdirname: A temporary operation directory.
     :type tmpdirname: str
+    :param playbook: Playbook to run instead of configured one.
+    :type playbook: str
+    :param limit: Names of hosts to run playbook on, instead of all.
+    :type limit: list
+    :param extra_vars: Extra variables for playbook.
+    :type extra_vars: dict
+    :param fact_cache: Cache to keep gathered facts in between runs.
+    :type fact_cache: k93s.facts.FactCache
     """
+    # Let Ansible open pooled SSH connections, so later k93s commands,
+    # e.g. fetching kubeconfig, reuse them without a handshake.
+    env = dict(os.environ, ANSIBLE_SSH_ARGS=' '.join(k93s.transport.pool.ssh_options()))
+    if fact_cache is not None:
+        env.update(fact_cache.ansible_env())
     with _ansible_directory(inventory_contents, tmpdirname) as ansible_dir_name:
         os.chdir(ansible_dir_name)  # pragma: no cover
-        subprocess.check_call(['ansible-playbook', '-i',
-                               'inventory.ini', '-vv',
-                               '-e', 'k_93_flavor={!s}'.format(
-                                   config_contents.get('flavor', 'k3s'),
-                               ),
-                               config_contents.get('playbook', 'k8s.yml')])  # pragma: no cover
+        command = ['ansible-playbook', '-i',
+                   _inventory_file_name, '-vv',
+                   '-e', 'k_93_flavor={!s}'.format(
+                       config_contents.get('flavor', 'k3s'),
+                   )]
+        if config_contents.get('k3s_version'):
+            command += ['-e', 'k3s_version={!s}'.format(config_contents['k3s_version'])]
+        playbook_vars = k93s.profiles.ansible_vars(config_contents)
+        playbook_vars.update(k93s.registry.ansible_vars(config_contents))
+        playbook_vars.update(extra_vars or {})
+        with open(_extra_vars_file_name, 'w') as fl:
+            json.dump(playbook_vars, fl)
+        command += ['-e', '@' + _extra_vars_file_name]
+        if limit:
+            command += ['--limit', ','.join(limit)]
+        command.append(playbook or config_contents.get('playbook', 'k8s.yml'))
+        with k93s.metrics.timed('provision', playbook=command[-1]):
+            subprocess.check_call(command, env=env)  # pragma: no cover
 
 
 kubeconfig_file = os.path.expanduser('~/.kube/config')
 kubeconfig_new_file = os.path.expanduser('~/.kube/config-new.k93s')
 _kubeconfig_backup_tpl = os.path.expanduser('~/.kube/config-old.k93s.{date}')
-_copy_node_cmd = 'ansible -i inventory.ini kubernetes_master[0]' + \
-                 ' -m fetch -a "src={src} dest={dest} flat=true"'
+_kubeconfig_lists = ('clusters', 'users', 'contexts')
 
 
-def configure_kubectl(inventory_contents, tmpdirname, switch_to_new):
+def _rename_kubeconfig(kubeconfig, name):
+    """Give cluster, user and context of k3s generated kubeconfig given name."""
+    cluster = dict(kubeconfig['clusters'][0], name=name)
+    user = dict(kubeconfig['users'][0], name=name)
+    context = {'name': name, 'context': {'cluster': name, 'user': name}}
+    return {'clusters': [cluster], 'users': [user], 'contexts': [context]}
+
+
+def merge_kubeconfig(base, new, name, switch_to_new):
+    """Merge kubeconfig of a cluster into existing one as a named context.
+
+    Entries of base kubeconfig with the same name are replaced.
+
+    :param base: Existing kubeconfig contents, or None.
+    :type base: dict
+    :param new: Kubeconfig, as generated by k3s on master.
+    :type new: dict
+    :param name: Name for cluster, user and context.
+    :type name: str
+    :param switch_to_new: Whether to make the new context current.
+    :type switch_to_new: bool
+    :rtype: dict
+    """
+    merged = {'apiVersion': 'v1', 'kind': 'Config', 'preferences': {}}
+    merged.update(base or {})
+    renamed = _rename_kubeconfig(new, name)
+    for key in _kubeconfig_lists:
+        merged[key] = [entry for entry in merged.get(key) or []
+                       if entry.get('name') != name] + renamed[key]
+    if switch_to_new or not merged.get('current-context'):
+        merged['current-context'] = name
+    return merged
+
+
+def fetch_kubeconfig(inventory_contents):
+    """Read kubeconfig from first master over pooled SSH connection."""
+    inventory = k93s.inventory.as_inventory(inventory_contents)
+    master = k93s.transport.host_from_inventory(
+        inventory, inventory.group_hosts('kubernetes_master')[0])
+    src = '/home/{!s}/.kube/config'.format(master.user or getpass.getuser())
+    logger.warning('Copying kubectl from remote %s:%s', master.name, src)
+    return yaml.safe_load(k93s.transport.pool.fetch(master, src))
+
+
+def configure_kubectl(inventory_contents, tmpdirname, switch_to_new, context_name='k93s'):
     """Set up kubectl on local host to point to remote cluster.
 
-    Usually this means to retrieve ./.kube/config from master.
+    Usually this means to retrieve ./.kube/config from master, and merge
+    it into local one as a context named after the cluster.
+    Otherwise, the cluster kubeconfig is saved to a separate file.
 
-    :param inventory_contents: Ansible inventory contents as string.
-    :type inventory_contents: str
+    :param inventory_contents: Ansible inventory, or its INI contents.
+    :type inventory_contents: k93s.inventory.Inventory
     :param tmpdirname: A temporary operation directory.
     :type tmpdirname: str
     :param switch_to_new: Whether to switch to new kube env with kubectl or not.
     :type switch_to_new: bool
+    :param context_name: Name of kubectl context for the cluster.
+    :type context_name: str
     """
-    with _ansible_directory(inventory_contents, tmpdirname) as ansible_dir_name:
-        os.chdir(ansible_dir_name)
-        src = "/home/{!s}/.kube/config".format(getpass.getuser())
-        logger.warning('Copying kubectl from remote %s', src)
-        copy_args = shlex.split(_copy_node_cmd.format(
-            src=src,
-            dest=ansible_dir_name),
-        )
-        subprocess.check_call(copy_args)
-        if switch_to_new:
+    remote_kubeconfig = fetch_kubeconfig(inventory_contents)
+    base = None
+    target_file = kubeconfig_new_file
+    if switch_to_new:
+        target_file = kubeconfig_file
+        if os.path.exists(kubeconfig_file):
             kubeconfig_backup_file = _kubeconfig_backup_tpl.format(
                 date=datetime.datetime.now().isoformat())
             logger.warning('Old kubectl will be saved as %s.', kubeconfig_backup_file)
             shutil.copyfile(kubeconfig_file, kubeconfig_backup_file)
-            shutil.copyfile(os.path.join(ansible_dir_name, 'config'), kubeconfig_file)
-            logger.warning('Run kubectl cluster-info to see the cluster status.')
+            with open(kubeconfig_file) as fl:
+                base = yaml.safe_load(fl)
+
+    merged = merge_kubeconfig(base, remote_kubeconfig, context_name, switch_to_new)
+    os.makedirs(os.path.dirname(target_file), exist_ok=True)
+    with open(target_file, 'w') as fl:
+        os.chmod(target_file, 0o600)
+        yaml.safe_dump(merged, fl, default_flow_style=False)
+    if switch_to_new:
+        logger.warning('Run kubectl cluster-info to see the cluster status.')
+    else:
+        logger.warning('Cluster kubeconfig is saved as %s.', target_file)
 
 
-__all__ = ['ansible_kubernetes', 'configure_kubectl']
+__all__ = ['ansible_kubernetes', 'configure_kubectl', 'fetch_kubeconfig', 'merge_kubeconfig']
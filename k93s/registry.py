@@ -0,0 +1,184 @@
+"""Container registry mirror, which runs on the host and is shared by all clusters.
+
+The mirror is a pull-through cache of Docker Hub, run as a `registry:2`
+container with podman or docker. Its storage is a named volume, which
+outlives clusters, so images pulled by one cluster are served locally
+to the next one. The mirror is published only on addresses, which nodes
+reach the host on, e.g. the gateway of their network, rather than on the
+whole LAN. k3s is pointed at it with a rendered `registries.yaml`.
+
+Enabled with `registry` section of config, e.g.::
+
+    registry:
+      enabled: yes
+      port: 5000
+      airgap_images: ~/Downloads/k3s-airgap-images-amd64.tar
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+
+import k93s.utils
+
+
+logger = logging.getLogger(__name__)
+
+container_name = 'k93s-registry'
+volume_name = 'k93s-registry'
+_image = 'docker.io/library/registry:2'
+_engines = ('podman', 'docker')
+_defaults = {
+    'port': 5000,
+    'upstream': 'https://registry-1.docker.io',
+    'airgap_images': None,
+}
+
+
+def settings(config_contents):
+    """Registry settings of given config, or None, if mirror is not enabled.
+
+    :param config_contents: Configuration dictionary.
+    :type config_contents: dict
+    :rtype: dict
+    """
+    section = config_contents.get('registry') or {}
+    if not k93s.utils.as_bool(section.get('enabled', False)):
+        return None
+    result = dict(_defaults)
+    result.update({k: v for k, v in section.items() if k in _defaults})
+    result['port'] = int(result['port'])
+    if result['airgap_images']:
+        result['airgap_images'] = os.path.abspath(os.path.expanduser(result['airgap_images']))
+        if not os.path.isfile(result['airgap_images']):
+            raise RuntimeError('Airgap images {!s} do not exist.'.format(
+                result['airgap_images']))
+    return result
+
+
+def container_engine():
+    """Locate podman or docker executable."""
+    for engine in _engines:
+        path = shutil.which(engine)
+        if path:
+            return path
+    raise RuntimeError('Registry mirror needs podman or docker, neither is installed.')
+
+
+def _inspect(engine):
+    """Description of registry container, or None, if it does not exist."""
+    completed = subprocess.run([engine, 'container', 'inspect', container_name],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if completed.returncode != 0:
+        return None
+    return json.loads(completed.stdout.decode())[0]
+
+
+def _container_state(engine):
+    """State of registry container, e.g. "running", or None, if it does not exist."""
+    container = _inspect(engine)
+    return None if container is None else container['State']['Status'].lower()
+
+
+def _published_addresses(container):
+    """Host addresses, which registry container is published on."""
+    bindings = (container.get('HostConfig') or {}).get('PortBindings') or {}
+    return {binding.get('HostIp') or '0.0.0.0'
+            for binding in bindings.get('5000/tcp') or []}
+
+
+def _is_local(address):
+    """Whether given address is assigned to this host, e.g. its network still exists."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.bind((address, 0))
+        except OSError:
+            return False
+    return True
+
+
+def bind_addresses(inventory):
+    """Host addresses, which nodes of given inventory reach host services on.
+
+    :param inventory: Ansible inventory of the cluster.
+    :type inventory: k93s.inventory.Inventory
+    :rtype: list
+    """
+    return sorted({hostvars['k93s_gateway'] for hostvars in inventory.hosts.values()
+                   if hostvars.get('k93s_gateway')})
+
+
+def ensure_running(registry_settings, addresses=()):
+    """Start registry container, creating it when missing.
+
+    The container is published on given host addresses only, and on
+    those of other clusters, which still exist. It is recreated, when
+    a cluster with a new address comes up, the cached images are kept
+    in its volume.
+
+    :param registry_settings: Registry settings, as returned by :func:`settings`.
+    :type registry_settings: dict
+    :param addresses: Addresses, which nodes reach the host on, e.g. network gateways.
+    :type addresses: list
+    """
+    engine = container_engine()
+    container = _inspect(engine)
+    if container is not None:
+        published = _published_addresses(container)
+        wanted = {address for address in published
+                  if address != '0.0.0.0' and _is_local(address)}.union(addresses)
+        if not addresses or wanted == published:
+            if container['State']['Status'].lower() == 'running':
+                return
+            logger.warning('Starting registry mirror %s', container_name)
+            subprocess.check_call([engine, 'start', container_name], stdout=subprocess.DEVNULL)
+            return
+        logger.warning('Recreating registry mirror %s on %s', container_name,
+                       ', '.join(sorted(wanted)))
+        subprocess.check_call([engine, 'rm', '--force', container_name],
+                              stdout=subprocess.DEVNULL)
+        addresses = wanted
+    logger.warning('Creating registry mirror %s of %s on port %d', container_name,
+                   registry_settings['upstream'], registry_settings['port'])
+    publish = []
+    for address in sorted(addresses):
+        publish += ['--publish', '{!s}:{:d}:5000'.format(address, registry_settings['port'])]
+    if not publish:
+        # Backend does not tell, which address nodes reach the host on
+        logger.warning('Registry mirror %s is published on all addresses of the host',
+                       container_name)
+        publish = ['--publish', '{:d}:5000'.format(registry_settings['port'])]
+    subprocess.check_call([
+        engine, 'run', '--detach', '--name', container_name, '--restart', 'always',
+        *publish,
+        '--volume', '{!s}:/var/lib/registry'.format(volume_name),
+        '--env', 'REGISTRY_PROXY_REMOTEURL={!s}'.format(registry_settings['upstream']),
+        _image,
+    ], stdout=subprocess.DEVNULL)
+
+
+def remove(purge=False):
+    """Remove registry container, and with `purge`, its cached images too."""
+    engine = container_engine()
+    if _container_state(engine) is not None:
+        subprocess.check_call([engine, 'rm', '--force', container_name], stdout=subprocess.DEVNULL)
+    if purge:
+        subprocess.run([engine, 'volume', 'rm', volume_name],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def ansible_vars(config_contents):
+    """Ansible variables, which point k3s of cluster nodes at the mirror."""
+    registry_settings = settings(config_contents)
+    if registry_settings is None:
+        return {}
+    result = {'k93s_registry_port': registry_settings['port']}
+    if registry_settings['airgap_images']:
+        result['k93s_airgap_images'] = registry_settings['airgap_images']
+    return result
+
+
+__all__ = ['settings', 'container_engine', 'bind_addresses', 'ensure_running', 'remove',
+           'ansible_vars']
@@ -0,0 +1,293 @@
+"""Typed model of k93s config, which is validated as a whole when loaded.
+
+Config files are plain YAML, written by hand or by `k93s config`, and
+numbers often come as strings. Compiling a config casts every value to
+its type once, and reports unknown keys and invalid values all together,
+before any VM is touched. The rest of k93s keeps working with plain
+dictionaries, as produced by :meth:`ClusterConfig.to_dict`.
+"""
+import dataclasses
+import pydoc
+import typing
+
+import k93s.profiles
+
+
+# Bumped whenever compiled config changes, so cached configs are recompiled
+VERSION = 1
+
+_default_backend = 'k93s.vms.lightning'
+_true = ('1', 'yes', 'true', 'on')
+_false = ('0', 'no', 'false', 'off')
+
+
+class _Invalid(Exception):
+    pass
+
+
+def _int(value):
+    if isinstance(value, bool):
+        raise _Invalid('expected an integer, got {!r}'.format(value))
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    raise _Invalid('expected an integer, got {!r}'.format(value))
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in _true:
+        return True
+    if str(value).strip().lower() in _false:
+        return False
+    raise _Invalid('expected yes or no, got {!r}'.format(value))
+
+
+def _str(value):
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise _Invalid('expected a string, got {!r}'.format(value))
+
+
+def _mapping(value):
+    if isinstance(value, dict):
+        return value
+    raise _Invalid('expected a mapping, got {!r}'.format(value))
+
+
+def _nic_queues(value):
+    return 'auto' if str(value) == 'auto' else _int(value)
+
+
+def _hosts(value):
+    # Imported here, as k93s.vms needs k93s.utils, which needs this module
+    from k93s.vms import scheduler
+    if not isinstance(value, list):
+        raise _Invalid('expected a list of hosts, got {!r}'.format(value))
+    try:
+        hosts = scheduler.hosts_from_config(value)
+    except (RuntimeError, TypeError, ValueError) as e:
+        raise _Invalid(str(e))
+    return [{k: v for k, v in host._asdict().items() if v is not None} for host in hosts]
+
+
+def _placement(value):
+    from k93s.vms import scheduler
+    policies = scheduler.POLICIES
+    if value not in policies:
+        raise _Invalid('expected one of {!s}, got {!r}'.format(', '.join(policies), value))
+    return value
+
+
+def _field(cast):
+    return dataclasses.field(default=None, metadata={'cast': cast})
+
+
+def _slotted(cls):
+    """Give a dataclass __slots__, as `dataclass(slots=True)` of Python 3.10 does."""
+    names = tuple(f.name for f in dataclasses.fields(cls))
+    namespace = {k: v for k, v in cls.__dict__.items()
+                 if k not in names + ('__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@_slotted
+@dataclasses.dataclass
+class TierConfig:
+    """Settings of master or agent VMs and of k3s on them."""
+
+    count: typing.Optional[int] = _field(_int)
+    distro: typing.Optional[str] = _field(_str)
+    vcpus: typing.Optional[int] = _field(_int)
+    memory: typing.Optional[int] = _field(_int)
+    root_disk_size: typing.Optional[int] = _field(_int)
+    root_password: typing.Optional[str] = _field(_str)
+    username: typing.Optional[str] = _field(_str)
+    python_interpreter: typing.Optional[str] = _field(_str)
+    ssh_key_file: typing.Optional[str] = _field(_str)
+    storage_pool: typing.Optional[str] = _field(_str)
+    warm_pool: typing.Optional[int] = _field(_int)
+    k3s_profile: typing.Optional[str] = _field(_str)
+    k3s_options: typing.Optional[dict] = _field(_mapping)
+
+
+@_slotted
+@dataclasses.dataclass
+class BackendConfig:
+    """Settings of VMs backend, shared by all VMs.
+
+    Keys, which k93s does not know of, are kept in `extra`. They are
+    accepted for third-party backends, and for the default backend only
+    if it offers them in its `common_properties`, e.g. settings of
+    virt-lightning, which `k93s config` asks about.
+    """
+
+    libvirt_uri: typing.Optional[str] = _field(_str)
+    root_password: typing.Optional[str] = _field(_str)
+    ssh_key_file: typing.Optional[str] = _field(_str)
+    storage_pool: typing.Optional[str] = _field(_str)
+    network_name: typing.Optional[str] = _field(_str)
+    network_cidr: typing.Optional[str] = _field(_str)
+    network_bridge: typing.Optional[str] = _field(_str)
+    network_auto_clean_up: typing.Optional[bool] = _field(_bool)
+    private_hub: typing.Optional[str] = _field(_str)
+    custom_image_list: typing.Optional[str] = _field(_str)
+    isolated_network: typing.Optional[bool] = _field(_bool)
+    mtu: typing.Optional[int] = _field(_int)
+    nic_queues: typing.Union[int, str, None] = _field(_nic_queues)
+    vhost_net: typing.Optional[bool] = _field(_bool)
+    cpu_pinning: typing.Optional[bool] = _field(_bool)
+    cpu_pinning_reserved_cores: typing.Optional[int] = _field(_int)
+    hosts: typing.Optional[list] = _field(_hosts)
+    placement: typing.Optional[str] = _field(_placement)
+    extra: typing.Optional[dict] = None
+
+
+@_slotted
+@dataclasses.dataclass
+class RegistryConfig:
+    """Settings of registry mirror on the host."""
+
+    enabled: typing.Optional[bool] = _field(_bool)
+    port: typing.Optional[int] = _field(_int)
+    upstream: typing.Optional[str] = _field(_str)
+    airgap_images: typing.Optional[str] = _field(_str)
+
+
+@_slotted
+@dataclasses.dataclass
+class GcConfig:
+    """Settings of storage garbage collection."""
+
+    image_budget: typing.Optional[int] = _field(_int)
+
+
+@_slotted
+@dataclasses.dataclass
+class ClusterConfig:
+    """Section `k93s` of config file."""
+
+    name: typing.Optional[str] = _field(_str)
+    flavor: typing.Optional[str] = _field(_str)
+    k3s_version: typing.Optional[str] = _field(_str)
+    playbook: typing.Optional[str] = _field(_str)
+    vms_backend: typing.Optional[str] = _field(_str)
+    vms_backend_config: typing.Optional[BackendConfig] = None
+    masters: typing.Optional[TierConfig] = None
+    agents: typing.Optional[TierConfig] = None
+    registry: typing.Optional[RegistryConfig] = None
+    gc: typing.Optional[GcConfig] = None
+
+    def to_dict(self):
+        """Plain dictionary of config, without keys, which are not set."""
+        return _to_dict(self)
+
+
+_sections = {
+    'vms_backend_config': BackendConfig,
+    'masters': TierConfig,
+    'agents': TierConfig,
+    'registry': RegistryConfig,
+    'gc': GcConfig,
+}
+
+
+def _to_dict(section):
+    result = {}
+    for f in dataclasses.fields(section):
+        value = getattr(section, f.name)
+        if value is None:
+            continue
+        if f.name == 'extra':
+            result.update(value)
+        elif dataclasses.is_dataclass(value):
+            result[f.name] = _to_dict(value)
+        else:
+            result[f.name] = value
+    return result
+
+
+def _build(cls, data, path, errors, allow_extra=False):
+    """Cast values of a config section into given dataclass, collecting errors.
+
+    :param allow_extra: Whether to keep unknown keys, or names of unknown
+        keys to keep.
+    :type allow_extra: bool or set
+    """
+    try:
+        data = _mapping(data)
+    except _Invalid as e:
+        errors.append('{!s}: {!s}'.format(path, e))
+        return cls()
+    fields = {f.name: f for f in dataclasses.fields(cls) if 'cast' in f.metadata}
+    values, extra = {}, {}
+    for key, value in data.items():
+        if key not in fields:
+            if allow_extra is True or (allow_extra and key in allow_extra):
+                extra[key] = value
+            else:
+                errors.append('{!s}.{!s}: unknown key'.format(path, key))
+            continue
+        if value is None:
+            continue
+        try:
+            values[key] = fields[key].metadata['cast'](value)
+        except _Invalid as e:
+            errors.append('{!s}.{!s}: {!s}'.format(path, key, e))
+    if extra:
+        values['extra'] = extra
+    return cls(**values)
+
+
+def _backend_properties(backend):
+    """Settings a backend accepts besides known ones, True for any of them."""
+    # Third-party backends may take settings k93s does not know of
+    if backend != _default_backend:
+        return True
+    return set(getattr(pydoc.locate(backend + '.backend'), 'common_properties', {}))
+
+
+def compile_config(data):
+    """Validate and type section `k93s` of config file.
+
+    :param data: Section `k93s`, as parsed from YAML.
+    :type data: dict
+    :raises RuntimeError: With all problems found, if config is invalid.
+    :rtype: ClusterConfig
+    """
+    errors = []
+    if not isinstance(data, dict):
+        raise RuntimeError('Config has no k93s section.')
+    config = _build(ClusterConfig, {k: v for k, v in data.items() if k not in _sections},
+                    'k93s', errors)
+    for key, cls in _sections.items():
+        if data.get(key) is None:
+            continue
+        allow_extra = False
+        if key == 'vms_backend_config':
+            allow_extra = _backend_properties(config.vms_backend or _default_backend)
+        setattr(config, key, _build(cls, data[key], 'k93s.' + key, errors, allow_extra))
+
+    if config.masters is not None and config.masters.warm_pool is not None:
+        errors.append('k93s.masters.warm_pool: only agents have a warm pool')
+    for key in ('masters', 'agents'):
+        tier = getattr(config, key)
+        if tier is None:
+            continue
+        try:
+            k93s.profiles.tier_options(_to_dict(tier))
+        except RuntimeError as e:
+            errors.append('k93s.{!s}: {!s}'.format(key, e))
+
+    if errors:
+        raise RuntimeError('Invalid config:\n  ' + '\n  '.join(errors))
+    return config
+
+
+__all__ = ['VERSION', 'TierConfig', 'BackendConfig', 'RegistryConfig', 'GcConfig',
+           'ClusterConfig', 'compile_config']
@@ -0,0 +1,170 @@
+"""Cluster health: VM state, SSH reachability, k3s services and node readiness.
+
+All probes run concurrently, so gathering status of a cluster takes about
+as long as the slowest single probe. Results are cached for a short time
+in the cluster state directory, so repeated calls stay cheap.
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import subprocess
+import time
+
+import k93s.transport
+import k93s.utils
+
+
+logger = logging.getLogger(__name__)
+
+cache_file_name = 'status.json'
+_ssh_args = ('-o', 'UserKnownHostsFile=/dev/null', '-o', 'StrictHostKeyChecking=no')
+_services = {'master': 'k3s', 'agent': 'k3s-node'}
+_columns = (
+    ('name', 'NAME'),
+    ('role', 'ROLE'),
+    ('state', 'STATE'),
+    ('address', 'ADDRESS'),
+    ('vcpus', 'VCPUS'),
+    ('cpu_time', 'CPU(s)'),
+    ('memory', 'MEM(MiB)'),
+    ('ssh', 'SSH'),
+    ('service', 'SERVICE'),
+    ('ready', 'READY'),
+)
+
+
+def _host(row):
+    return k93s.transport.SSHHost(row['name'], row['address'], row.get('user'), _ssh_args)
+
+
+def _probe_node(row, timeout):
+    """Check SSH reachability of a node and state of its k3s service."""
+    result = {'ssh': False, 'service': None}
+    if row.get('state') != 'running' or not row.get('address'):
+        return result
+    result['ssh'] = k93s.utils.wait_for_ssh(row['address'], timeout=0)
+    service = _services.get(row['role'])
+    if result['ssh'] and service:
+        try:
+            completed = k93s.transport.pool.run(_host(row), 'systemctl is-active ' + service,
+                                                timeout=timeout, check=False)
+            result['service'] = completed.stdout.decode().strip() or 'unknown'
+        except subprocess.TimeoutExpired:
+            result['service'] = 'unknown'
+    return result
+
+
+def _probe_readiness(row, timeout):
+    """Ask Kubernetes API on a master node about readiness of all nodes.
+
+    :returns: Mapping of node name to whether it is ready.
+    :rtype: dict
+    """
+    try:
+        completed = k93s.transport.pool.run(_host(row), 'kubectl get nodes -o json',
+                                            timeout=timeout, check=False)
+    except subprocess.TimeoutExpired:
+        return {}
+    if completed.returncode:
+        return {}
+    readiness = {}
+    for node in json.loads(completed.stdout.decode()).get('items', []):
+        conditions = node.get('status', {}).get('conditions', [])
+        readiness[node['metadata']['name']] = any(
+            c.get('type') == 'Ready' and c.get('status') == 'True' for c in conditions)
+    return readiness
+
+
+def gather(rows, timeout=5):
+    """Probe all nodes concurrently and complete their status rows.
+
+    :param rows: Status rows of VMs, as returned by backend `stats` action.
+    :type rows: list
+    :param timeout: Seconds to wait for any single probe.
+    :type timeout: float
+    :returns: Status rows, extended with 'ssh', 'service' and 'ready' keys.
+    :rtype: list
+    """
+    rows = [dict(row) for row in rows]
+    probes = [functools.partial(_probe_node, row, timeout) for row in rows]
+    master = next((r for r in rows if r['role'] == 'master' and r.get('state') == 'running'), None)
+    if master is not None:
+        probes.append(functools.partial(_probe_readiness, master, timeout))
+    results = k93s.utils.parallel(lambda probe: probe(), probes)
+
+    readiness = results[len(rows)] if master is not None else {}
+    for row, result in zip(rows, results):
+        row.update(result)
+        row['ready'] = readiness.get(row['name'])
+    return rows
+
+
+def wait_ready(read_rows, timeout, interval=2):
+    """Gather status of nodes until all of them are ready, or timeout passes.
+
+    :param read_rows: Callable, which returns status rows of VMs.
+    :type read_rows: callable
+    :param timeout: Seconds to wait for nodes to become ready.
+    :type timeout: float
+    :returns: Last gathered status rows.
+    :rtype: list
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        rows = gather(read_rows())
+        # Standby agents of the warm pool have not joined the cluster
+        if all(row['ready'] for row in rows if row['role'] != 'standby'):
+            return rows
+        if time.monotonic() >= deadline:
+            return rows
+        time.sleep(interval)
+
+
+def read_cache(state_dir, ttl):
+    """Read cached status rows, unless they are older than ttl seconds."""
+    cache_file = os.path.join(state_dir, cache_file_name)
+    try:
+        if time.time() - os.path.getmtime(cache_file) > ttl:
+            return None
+        with open(cache_file, 'r') as fl:
+            return json.load(fl)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(state_dir, rows):
+    """Store status rows for later calls."""
+    cache_file = os.path.join(state_dir, cache_file_name)
+    with open(cache_file + '.tmp', 'w') as fl:
+        json.dump(rows, fl)
+    os.replace(cache_file + '.tmp', cache_file)
+
+
+def clear_cache(state_dir):
+    """Drop cached status rows, e.g. after VMs changed their state."""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(os.path.join(state_dir, cache_file_name))
+
+
+def _format_value(value):
+    if value is None:
+        return '-'
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    if isinstance(value, float):
+        return '{:.1f}'.format(value)
+    return str(value)
+
+
+def format_table(rows):
+    """Render status rows as a plain text table."""
+    table = [[title for _, title in _columns]]
+    table.extend([_format_value(row.get(key)) for key, _ in _columns] for row in rows)
+    widths = [max(len(line[i]) for line in table) for i in range(len(_columns))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip()
+                     for line in table)
+
+
+__all__ = ['gather', 'wait_ready', 'read_cache', 'write_cache', 'clear_cache', 'format_table']
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import subprocess
+import unittest
+from unittest import mock
+
+import k93s.bench
+import k93s.transport
+
+
+_LABELS = 'resource="pods",scope="namespace",subresource="{}",verb="POST",le="{}"'
+_METRICS = """# HELP apiserver_request_duration_seconds Response latency distribution
+# TYPE apiserver_request_duration_seconds histogram
+apiserver_request_duration_seconds_bucket{%s} {fast}
+apiserver_request_duration_seconds_bucket{%s} {medium}
+apiserver_request_duration_seconds_bucket{%s} {medium}
+apiserver_request_duration_seconds_bucket{%s} 1000
+apiserver_request_count{resource="pods",verb="POST"} 10
+""" % (_LABELS.format('', '0.05'), _LABELS.format('', '0.1'), _LABELS.format('', '+Inf'),
+       _LABELS.format('binding', '0.05'))
+
+
+def _metrics(fast, medium):
+    return _METRICS.replace('{fast}', str(fast)).replace('{medium}', str(medium))
+
+
+def _pod(created, scheduled=None, started=None):
+    pod = {'metadata': {'creationTimestamp': created}, 'status': {'conditions': []}}
+    if scheduled:
+        pod['status']['conditions'].append(
+            {'type': 'PodScheduled', 'status': 'True', 'lastTransitionTime': scheduled})
+    if started:
+        pod['status']['containerStatuses'] = [{'state': {'running': {'startedAt': started}}}]
+    return pod
+
+
+class BenchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def test_parse_histograms(self):
+        histograms = k93s.bench.parse_histograms(_metrics(2, 4))
+        self.assertEqual({0.05: 2, 0.1: 4, float('inf'): 4}, histograms[('POST', 'pods')])
+        self.assertEqual([('POST', 'pods')], list(histograms))
+
+    def test_histogram_quantile(self):
+        buckets = {0.05: 2, 0.1: 4, float('inf'): 4}
+        self.assertAlmostEqual(0.05, k93s.bench.histogram_quantile(0.5, buckets))
+        self.assertAlmostEqual(0.075, k93s.bench.histogram_quantile(0.75, buckets))
+        self.assertEqual(0.1, k93s.bench.histogram_quantile(1, {0.1: 4, float('inf'): 8}))
+        self.assertIsNone(k93s.bench.histogram_quantile(0.5, {0.1: 0, float('inf'): 0}))
+
+    def test_percentile(self):
+        self.assertEqual(5, k93s.bench.percentile(range(1, 11), 0.5))
+        self.assertEqual(10, k93s.bench.percentile(range(1, 11), 0.99))
+        self.assertIsNone(k93s.bench.percentile([], 0.5))
+
+    def test_pod_timings(self):
+        timings = k93s.bench.pod_timings({'items': [
+            _pod('2020-01-01T00:00:00Z', '2020-01-01T00:00:01Z', '2020-01-01T00:00:03Z'),
+            _pod('2020-01-01T00:00:00Z'),
+        ]})
+        self.assertEqual([1, 3], [timings[0]['scheduled'] - timings[0]['created'],
+                                  timings[0]['started'] - timings[0]['created']])
+        self.assertEqual((None, None), (timings[1]['scheduled'], timings[1]['started']))
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(k93s.transport.pool, 'run')
+    def test_run_step(self, run_patched, sleep_patched):
+        pods = {'items': [
+            _pod('2020-01-01T00:00:00Z', '2020-01-01T00:00:01Z', '2020-01-01T00:00:02Z'),
+            _pod('2020-01-01T00:00:01Z', '2020-01-01T00:00:02Z', '2020-01-01T00:00:05Z'),
+        ]}
+        outputs = {'get --raw /metrics': [_metrics(0, 0), _metrics(1, 2)],
+                   'get pods': [json.dumps(pods)]}
+
+        def run(host, command, stdin=None, timeout=None, check=True):
+            for prefix, values in outputs.items():
+                if command.startswith('kubectl ' + prefix):
+                    return subprocess.CompletedProcess([], 0, stdout=values.pop(0).encode())
+            return subprocess.CompletedProcess([], 0, stdout=b'')
+
+        run_patched.side_effect = run
+        summary = k93s.bench.run_step('master', 0, 1, 2, timeout=60)
+
+        creates = [c for c in run_patched.call_args_list if c[0][1] == 'kubectl create -f -']
+        self.assertEqual(2, len(creates))
+        self.assertEqual(1, len(json.loads(creates[0][1]['stdin'].decode())['items']))
+        self.assertEqual(2, summary['started'])
+        self.assertEqual(1.0, summary['scheduling_throughput'])
+        self.assertEqual({'p50': 2, 'p90': 4, 'p99': 4}, summary['startup_latency'])
+        self.assertAlmostEqual(0.05, summary['api_latency']['post_pods']['p50'])
+        self.assertIsNone(summary['api_latency']['list_pods']['p99'])
+        self.assertIn('delete pods -n k93s-bench -l k93s-bench-step=0',
+                      run_patched.call_args_list[-1][0][1])
+
+    def test_vm_profile(self):
+        profile = k93s.bench.vm_profile({
+            'masters': {'vcpus': 2, 'memory': 1024, 'root_password': 'secret'},
+            'agents': {'count': 3, 'k3s_profile': 'minimal'},
+            'vms_backend_config': {'cpu_pinning': True, 'libvirt_uri': 'qemu:///system'},
+        })
+        self.assertEqual({'vcpus': 2, 'memory': 1024}, profile['masters'])
+        self.assertEqual({'cpu_pinning': True}, profile['backend'])
+
+    def test_save_load_format(self):
+        step = {'rate': 5, 'scheduling_throughput': 4.5,
+                'startup_latency': {'p50': 2, 'p90': 3, 'p99': 4},
+                'api_latency': {'post_pods': {'p50': 0.01, 'p99': 0.05},
+                                'list_pods': {'p50': None, 'p99': None}}}
+        result = {'started': '2020-01-01T00:00:00Z', 'steps': [step],
+                  'profile': k93s.bench.vm_profile({'agents': {'count': 3, 'vcpus': 1,
+                                                               'memory': 512}})}
+        path = k93s.bench.save(self.testtempdir, result)
+        self.assertTrue(path.endswith('2020-01-01T000000Z.json'))
+        self.assertEqual([result], k93s.bench.load_all(self.testtempdir))
+        table = k93s.bench.format_table([result]).splitlines()
+        self.assertEqual(['2020-01-01T00:00:00Z', '-x-cpu/-M', '3x1cpu/512M', 'default', '5',
+                          '4.5', '2.000', '4.000', '0.050', '-'], table[1].split())
+        self.assertIn('resolution of one second', table[-1])
+
+    @mock.patch.object(k93s.bench, 'run_step', return_value={})
+    @mock.patch.object(k93s.transport.pool, 'run')
+    def test_run_waits_for_namespace_deletion(self, run_patched, run_step_patched):
+        result = k93s.bench.run('master', {'name': 'test'}, [5, 10], 20, timeout=120)
+        self.assertEqual([{}, {}], result['steps'])
+        command = run_patched.call_args_list[-1][0][1]
+        self.assertTrue(command.startswith('kubectl delete namespace k93s-bench'))
+        self.assertIn('--wait=true --timeout=120s', command)
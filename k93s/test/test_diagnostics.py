@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import unittest
+from unittest import mock
+
+import k93s.diagnostics
+import k93s.inventory
+import k93s.transport
+
+
+def _run(host, command, stdin=None, timeout=None, check=True):
+    if host.name == 'testcluster-agent-2':
+        return subprocess.CompletedProcess([], 255, stdout=b'', stderr=b'No route to host')
+    if command.startswith('sudo -n sysctl'):
+        return subprocess.CompletedProcess([], 1, stdout=b'', stderr=b'sudo: password required')
+    return subprocess.CompletedProcess([], 0, stdout=command.encode(), stderr=b'')
+
+
+class DiagnosticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+        self.inventory = k93s.inventory.Inventory()
+        self.inventory.add_host('testcluster-master-1', {'ansible_host': '192.168.123.11'},
+                                ['kubernetes_master'])
+        for i in (1, 2):
+            self.inventory.add_host('testcluster-agent-{:d}'.format(i),
+                                    {'ansible_host': '192.168.123.2{:d}'.format(i)},
+                                    ['kubernetes_agent'])
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def test_node_commands(self):
+        master = dict(k93s.diagnostics.node_commands(['kubernetes_master'], lines=10))
+        self.assertEqual('sudo -n journalctl -u k3s --no-pager -n 10', master['journal-k3s.log'])
+        self.assertEqual('sudo -n k3s kubectl get nodes -o wide', master['nodes.txt'])
+        agent = dict(k93s.diagnostics.node_commands(['kubernetes_agent']))
+        self.assertIn('systemctl-k3s-node.txt', agent)
+        self.assertNotIn('nodes.txt', agent)
+        other = dict(k93s.diagnostics.node_commands([]))
+        self.assertNotIn('None', ''.join(other))
+        self.assertIn('df.txt', other)
+
+    @mock.patch.object(k93s.transport.pool, 'run', side_effect=subprocess.TimeoutExpired('', 1))
+    def test_collect_node_timeout(self, run_patched):
+        host = k93s.transport.SSHHost('testcluster-agent-1', '192.168.123.21', None, ())
+        files, summary = k93s.diagnostics.collect_node(host, [('df.txt', 'df'),
+                                                              ('uptime.txt', 'uptime')], 1)
+        self.assertEqual([], files)
+        self.assertEqual('timed out', summary['error'])
+        run_patched.assert_called_once()
+        self.assertLessEqual(run_patched.call_args[1]['timeout'], 1)
+
+    @mock.patch.object(k93s.transport.pool, 'run', side_effect=_run)
+    def test_collect(self, run_patched):
+        path = os.path.join(self.testtempdir, 'bundle.tar.gz')
+        summaries = k93s.diagnostics.collect(self.inventory, path, max_workers=2)
+
+        self.assertEqual(['testcluster-master-1', 'testcluster-agent-1', 'testcluster-agent-2'],
+                         [summary['name'] for summary in summaries])
+        self.assertEqual(['sysctl.txt'], summaries[0]['failed'])
+        self.assertEqual((0, 'No route to host'),
+                         (summaries[2]['collected'], summaries[2]['error']))
+        # Unreachable node is given up after first command
+        self.assertEqual(1, len([c for c in run_patched.call_args_list
+                                 if c[0][0].name == 'testcluster-agent-2']))
+        self.assertFalse(os.path.exists(path + '.tmp'))
+
+        with tarfile.open(path) as bundle:
+            names = bundle.getnames()
+            self.assertIn('testcluster-master-1/nodes.txt', names)
+            self.assertIn('testcluster-agent-1/journal-k3s-node.log', names)
+            self.assertFalse([name for name in names if name.startswith('testcluster-agent-2')])
+            self.assertEqual(b'sudo: password required',
+                             bundle.extractfile('testcluster-master-1/sysctl.txt').read())
+            self.assertEqual(summaries, json.load(bundle.extractfile('summary.json')))
+            self.assertIn('kubernetes_agent', json.load(bundle.extractfile('inventory.json')))
+
+    @mock.patch.object(k93s.transport.pool, 'run', side_effect=_run)
+    def test_collect_no_directory(self, run_patched):
+        path = os.path.join(self.testtempdir, 'missing', 'bundle.tar.gz')
+        with self.assertRaises(FileNotFoundError) as raised:
+            k93s.diagnostics.collect(self.inventory, path)
+        self.assertEqual(path + '.tmp', raised.exception.filename)
+        run_patched.assert_not_called()
+
+    @mock.patch.object(k93s.transport.pool, 'run', side_effect=KeyboardInterrupt)
+    def test_collect_interrupted(self, run_patched):
+        path = os.path.join(self.testtempdir, 'bundle.tar.gz')
+        with self.assertRaises(KeyboardInterrupt):
+            k93s.diagnostics.collect(self.inventory, path)
+        self.assertEqual([], os.listdir(self.testtempdir))
+
+    def test_format_table(self):
+        lines = k93s.diagnostics.format_table([
+            {'name': 'testcluster-master-1', 'collected': 12, 'failed': ['sysctl.txt'],
+             'error': None, 'seconds': 1.25},
+        ]).splitlines()
+        self.assertEqual(['NAME', 'FILES', 'FAILED', 'SECONDS', 'ERROR'], lines[0].split())
+        self.assertEqual(['testcluster-master-1', '12', 'sysctl.txt', '1.2', '-'],
+                         lines[1].split())
@@ -0,0 +1,54 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+import k93s.exporter
+import k93s.metrics
+
+
+_ROWS = [
+    {'name': 'testcluster-master-1', 'role': 'master', 'state': 'running',
+     'host': 'qemu:///system', 'vcpus': 2, 'cpu_time': 1.5, 'balloon_bytes': 536870912,
+     'rss_bytes': 268435456,
+     'disks': [{'name': 'vda', 'read_bytes': 4096, 'write_bytes': 8192,
+                'read_requests': 1, 'write_requests': 2}],
+     'nics': [{'name': 'vnet0', 'rx_bytes': 100, 'tx_bytes': 200, 'rx_packets': 3,
+               'tx_packets': 4, 'rx_drops': 0, 'tx_drops': 0}]},
+    {'name': 'testcluster-agent-1', 'role': 'agent', 'state': 'missing'},
+]
+
+
+class ExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def test_domain_samples(self):
+        lines = k93s.metrics.format_samples(k93s.exporter.domain_samples(_ROWS)).splitlines()
+        master = 'domain="testcluster-master-1",host="qemu:///system",role="master"'
+        self.assertIn('k93s_domain_running{%s} 1' % master, lines)
+        self.assertIn('k93s_domain_running{domain="testcluster-agent-1",role="agent"} 0', lines)
+        self.assertIn('k93s_domain_cpu_seconds_total{%s} 1.5' % master, lines)
+        self.assertIn('k93s_domain_memory_rss_bytes{%s} 268435456' % master, lines)
+        self.assertIn('k93s_domain_block_write_bytes_total{device="vda",%s} 8192' % master,
+                      lines)
+        self.assertIn('k93s_domain_network_transmit_bytes_total{domain="testcluster-master-1",'
+                      'host="qemu:///system",interface="vnet0",role="master"} 200', lines)
+        self.assertEqual(1, lines.count('# TYPE k93s_domain_running gauge'))
+        self.assertFalse([line for line in lines if 'agent' in line and 'vcpus' in line])
+
+    def test_scrape(self):
+        invoke = mock.Mock(return_value=_ROWS)
+        k93s.metrics.inc('k93s_image_fetch_bytes_total', 100, distro='centos-8')
+        k93s.metrics.flush(self.testtempdir)
+        text = k93s.exporter.Exporter(invoke, self.testtempdir).scrape()
+
+        invoke.assert_called_once_with('stats', True, quiet=True, timed=False)
+        self.assertIn('k93s_image_fetch_bytes_total{distro="centos-8"} 100.0', text)
+        self.assertIn('k93s_domain_vcpus{', text)
+        self.assertIn('k93s_exporter_scrape_duration_seconds ', text)
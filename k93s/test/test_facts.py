@@ -0,0 +1,58 @@
+import os
+import shutil
+import unittest
+
+from k93s.facts import FactCache
+
+
+class FactCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+        self.cache = FactCache(os.path.join(self.testtempdir, 'facts'))
+        self.rows = [
+            {'name': 'master-1', 'uuid': 'uuid-m1'},
+            {'name': 'agent-1', 'uuid': 'uuid-a1'},
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def _cache_facts(self, *nodes):
+        for node in nodes:
+            with open(os.path.join(self.cache.directory, node), 'w') as fl:
+                fl.write('{}')
+
+    def _cached(self):
+        return sorted(n for n in os.listdir(self.cache.directory) if not n.startswith('.'))
+
+    def test_invalidate_keeps_same_vms(self):
+        self.cache.invalidate(self.rows)
+        self._cache_facts('master-1', 'agent-1')
+        self.cache.invalidate(self.rows)
+        self.assertEqual(['agent-1', 'master-1'], self._cached())
+
+    def test_invalidate_recreated_and_missing_vms(self):
+        self.cache.invalidate(self.rows)
+        self._cache_facts('master-1', 'agent-1')
+        self.cache.invalidate([
+            {'name': 'master-1', 'uuid': 'uuid-m1'},
+            {'name': 'agent-1', 'uuid': 'uuid-a1-new'},
+        ])
+        self.assertEqual(['master-1'], self._cached())
+        self.cache.invalidate([{'name': 'master-1', 'state': 'missing'}])
+        self.assertEqual([], self._cached())
+
+    def test_invalidate_unknown_identity(self):
+        os.makedirs(self.cache.directory)
+        self._cache_facts('master-1')
+        self.cache.invalidate(self.rows[0:1])
+        self.assertEqual([], self._cached())
+
+    def test_ansible_env(self):
+        env = self.cache.ansible_env()
+        self.assertEqual('jsonfile', env['ANSIBLE_CACHE_PLUGIN'])
+        self.assertEqual('smart', env['ANSIBLE_GATHERING'])
+        self.assertEqual(os.path.abspath(self.cache.directory),
+                         env['ANSIBLE_CACHE_PLUGIN_CONNECTION'])
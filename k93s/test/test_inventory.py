@@ -0,0 +1,70 @@
+import unittest
+
+from k93s.inventory import Inventory, as_inventory
+
+
+_INVENTORY = """testcluster-master-1 ansible_host=192.168.123.11 ansible_user=user \
+ansible_ssh_common_args="-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
+testcluster-agent-1 ansible_host=192.168.123.111 ansible_user=user
+
+[kubernetes_master]
+testcluster-master-1
+
+[kubernetes_agent]
+testcluster-agent-1
+"""
+
+
+class InventoryTest(unittest.TestCase):
+
+    def test_from_ini(self):
+        inventory = Inventory.from_ini(_INVENTORY)
+        self.assertEqual(['testcluster-master-1', 'testcluster-agent-1'], list(inventory.hosts))
+        self.assertEqual(
+            {
+                'ansible_host': '192.168.123.11',
+                'ansible_user': 'user',
+                'ansible_ssh_common_args': '-o UserKnownHostsFile=/dev/null '
+                                           '-o StrictHostKeyChecking=no',
+            },
+            inventory.host('testcluster-master-1'),
+        )
+        self.assertEqual(['testcluster-master-1'], inventory.group_hosts('kubernetes_master'))
+        self.assertEqual(['testcluster-agent-1'], inventory.group_hosts('kubernetes_agent'))
+        self.assertEqual([], inventory.group_hosts('kubernetes_standby'))
+
+    def test_unknown_host(self):
+        self.assertEqual({}, Inventory.from_ini(_INVENTORY).host('unknown'))
+
+    def test_remove_host(self):
+        inventory = Inventory.from_ini(_INVENTORY)
+        inventory.remove_host('testcluster-agent-1')
+        self.assertEqual(['testcluster-master-1'], list(inventory.hosts))
+        self.assertEqual([], inventory.group_hosts('kubernetes_agent'))
+
+    def test_to_dynamic(self):
+        inventory = Inventory.from_ini(_INVENTORY)
+        inventory.add_host('extra', {'ansible_host': '192.168.123.200'})
+        dynamic = inventory.to_dynamic()
+        self.assertEqual(inventory.host('testcluster-agent-1'),
+                         dynamic['_meta']['hostvars']['testcluster-agent-1'])
+        self.assertEqual({'hosts': ['testcluster-master-1']}, dynamic['kubernetes_master'])
+        self.assertEqual({'hosts': ['extra']}, dynamic['ungrouped'])
+        self.assertEqual(['kubernetes_master', 'kubernetes_agent', 'ungrouped'],
+                         dynamic['all']['children'])
+
+    def test_to_yaml(self):
+        inventory = Inventory()
+        inventory.add_host('master-1', {'ansible_host': '192.168.123.11'}, ['kubernetes_master'])
+        self.assertEqual({
+            'all': {
+                'hosts': {'master-1': {'ansible_host': '192.168.123.11'}},
+                'children': {'kubernetes_master': {'hosts': {'master-1': None}}},
+            },
+        }, inventory.to_yaml())
+
+    def test_as_inventory(self):
+        inventory = Inventory()
+        self.assertIs(inventory, as_inventory(inventory))
+        self.assertEqual(['testcluster-agent-1'],
+                         as_inventory(_INVENTORY).group_hosts('kubernetes_agent'))
@@ -0,0 +1,64 @@
+import os
+import shutil
+import unittest
+
+from k93s.journal import Journal
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+        self.journal = Journal(os.path.join(self.testtempdir, 'journal'))
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def test_mark(self):
+        self.journal.mark('master-1', 'created', 'booted')
+        self.journal.mark('master-1', 'booted', 'prepared')
+        self.assertEqual(['created', 'booted', 'prepared'], self.journal.phases('master-1'))
+        self.assertTrue(self.journal.done('master-1', 'booted'))
+        self.assertEqual([], self.journal.phases('agent-1'))
+
+    def test_mark_unknown_phase(self):
+        with self.assertRaises(RuntimeError):
+            self.journal.mark('master-1', 'deployed')
+
+    def test_ansible_appended_lines(self):
+        os.makedirs(self.journal.directory)
+        with open(os.path.join(self.journal.directory, 'agent-1'), 'a') as fl:
+            fl.write('prepared\ninstalled\n')
+        self.assertEqual(['agent-2'], self.journal.pending(['agent-1', 'agent-2'], 'installed'))
+        self.assertEqual(['agent-1', 'agent-2'],
+                         self.journal.pending(['agent-1', 'agent-2'], 'joined'))
+
+    def test_reconcile(self):
+        for node in ('master-1', 'agent-1', 'agent-2'):
+            self.journal.mark(node, 'created', 'booted', 'prepared')
+        self.journal.reconcile([
+            {'name': 'master-1', 'state': 'running'},
+            {'name': 'agent-1', 'state': 'shutoff'},
+            {'name': 'agent-2', 'state': 'missing'},
+        ])
+        self.assertEqual(['created', 'booted', 'prepared'], self.journal.phases('master-1'))
+        self.assertEqual(['created', 'prepared'], self.journal.phases('agent-1'))
+        self.assertEqual([], self.journal.phases('agent-2'))
+
+    def test_reconcile_suspended(self):
+        self.journal.mark('agent-1', 'created', 'booted')
+        self.journal.reconcile([{'name': 'agent-1', 'state': 'suspended'}])
+        self.assertEqual(['created', 'booted'], self.journal.phases('agent-1'))
+
+    def test_extra_vars(self):
+        self.journal.mark('master-1', 'created')
+        self.assertEqual({
+            'k93s_journal_dir': os.path.abspath(self.journal.directory),
+            'k93s_journal': {'master-1': ['created'], 'agent-1': []},
+        }, self.journal.extra_vars(['master-1', 'agent-1']))
+
+    def test_clear(self):
+        self.journal.mark('master-1', 'created')
+        self.journal.clear()
+        self.assertEqual([], self.journal.phases('master-1'))
@@ -1,5 +1,7 @@
 import os
 import shutil
+import subprocess
+import sys
 from unittest import mock
 import unittest
 import yaml
@@ -8,6 +10,8 @@ from click.testing import CliRunner
 
 # Import test commands
 from k93s.__main__ import cli
+import k93s.inventory
+import k93s.journal
 
 
 class TestVMBackend(mock.MagicMock):
@@ -20,6 +24,13 @@ class TestVMBackend(mock.MagicMock):
 
 backend = TestVMBackend()
 
+_STATS = [
+    {'name': 'testcluster-master-1', 'role': 'master', 'state': 'running'},
+    {'name': 'testcluster-agent-1', 'role': 'agent', 'state': 'running'},
+    {'name': 'testcluster-agent-2', 'role': 'standby', 'state': 'missing'},
+]
+_MISSING = [dict(row, state='missing') for row in _STATS]
+
 
 class MainModuleTest(unittest.TestCase):
 
@@ -27,6 +38,8 @@ class MainModuleTest(unittest.TestCase):
         self.runner = CliRunner()
         self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
         os.makedirs(self.testtempdir)
+        mock.patch('k93s.utils.state_directory', return_value=self.testtempdir).start()
+        self.addCleanup(mock.patch.stopall)
 
     def tearDown(self):
         shutil.rmtree(self.testtempdir)
@@ -44,6 +57,10 @@ class MainModuleTest(unittest.TestCase):
         )
         self.assertEqual(4, res.exit_code)
 
+    def test_import_without_libvirt(self):
+        subprocess.check_call([sys.executable, '-c',
+                               'import sys; sys.modules["libvirt"] = None; import k93s.__main__'])
+
     def test_config_already_exists_recreate(self):
         test_config_path = 'k93s/test/_temp/.k93s.main'
         with open(test_config_path, 'w') as fl:
@@ -121,12 +138,326 @@ centos-8
         self.assertEqual(res.exit_code, 0)
         self.assertIn('Going to invoke action teardown on VMs', res.output)
 
-    def test_kubernetes(self):
+    def test_snapshot(self):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'snapshot', 'clean'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn('Going to invoke action snapshot on VMs', res.output)
+
+    def test_reset(self):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'reset', 'clean'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn('Going to invoke action reset on VMs', res.output)
+
+    def test_suspend(self):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'suspend'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn('Going to invoke action suspend on VMs', res.output)
+
+    @mock.patch('k93s.status.wait_ready')
+    @mock.patch('k93s.test.test_main.backend.backend.resume')
+    def test_resume(self, resume_patched, wait_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        wait_patched.return_value = [dict(row, ready=row['role'] != 'standby')
+                                     for row in _STATS]
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'resume'])
+        self.assertEqual(res.exit_code, 0)
+        resume_patched.assert_called_once_with(mock.ANY)
+        self.assertEqual(120.0, wait_patched.call_args[0][1])
+        self.assertIn('testcluster-agent-1', res.output)
+
+    @mock.patch('k93s.status.wait_ready')
+    @mock.patch('k93s.test.test_main.backend.backend.resume')
+    def test_resume_not_ready(self, resume_patched, wait_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        wait_patched.return_value = [dict(row, ready=False) for row in _STATS]
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'resume',
+                                       '--timeout', '5'])
+        self.assertEqual(res.exit_code, 8)
+
+    @mock.patch('k93s.test.test_main.backend.backend.stats')
+    def test_kubernetes_suspended(self, stats_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        stats_patched.return_value = [dict(row, state='suspended') for row in _STATS]
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubernetes'])
+        self.assertEqual(res.exit_code, 8)
+        self.assertNotIn('Going to invoke action spinup on VMs', res.output)
+
+    @mock.patch('k93s.test.test_main.backend.backend.reset',
+                side_effect=RuntimeError('Snapshot clean does not exist on testcluster-agent-1.'))
+    def test_reset_missing_snapshot(self, reset_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        journal = k93s.journal.Journal.for_config(test_config_path)
+        journal.mark('testcluster-master-1', 'created')
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'reset', 'clean'])
+        self.assertEqual(10, res.exit_code)
+        self.assertEqual(['created'], journal.phases('testcluster-master-1'))
+
+    def test_pool(self):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'pool'])
+        self.assertIn('Going to invoke action fill_pool on VMs', res.output)
+
+    @mock.patch('k93s.provision.ansible_kubernetes')
+    @mock.patch('k93s.test.test_main.backend.backend.inventory')
+    @mock.patch('k93s.test.test_main.backend.backend.stats', return_value=_STATS)
+    @mock.patch('k93s.test.test_main.backend.backend.fill_pool')
+    def test_pool_prepares_created(self, fill_pool_patched, stats_patched, inventory_patched,
+                                   ansible_patched):
+        created = mock.Mock()
+        created.name = 'testcluster-agent-2'
+        fill_pool_patched.return_value = [created]
+        inventory_patched.return_value = k93s.inventory.Inventory()
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'pool'])
+        self.assertEqual(0, res.exit_code, res.output)
+        self.assertEqual('standby.yml', ansible_patched.call_args[1]['playbook'])
+        self.assertEqual(['testcluster-agent-2'], ansible_patched.call_args[1]['limit'])
+
+    @mock.patch('k93s.provision.ansible_kubernetes')
+    @mock.patch('k93s.test.test_main.backend.backend.fill_pool', return_value=[])
+    def test_pool_full(self, fill_pool_patched, ansible_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'pool'])
+        self.assertEqual(0, res.exit_code, res.output)
+        ansible_patched.assert_not_called()
+
+    @mock.patch('k93s.test.test_main.backend.backend.inventory')
+    def test_inventory(self, inventory_patched):
+        inventory_patched.return_value = k93s.inventory.Inventory()
+        inventory_patched.return_value.add_host('testcluster-master-1',
+                                                {'ansible_host': '192.168.123.11'},
+                                                ['kubernetes_master'])
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'inventory', '--list'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn('"kubernetes_master": {', res.output)
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'inventory',
+                                       '--host', 'testcluster-master-1'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn('"ansible_host": "192.168.123.11"', res.output)
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'inventory',
+                                       '--host', 'unknown'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual('{}', res.output.strip().splitlines()[-1])
+
+    @mock.patch('k93s.test.test_main.backend.backend.inventory')
+    def test_inventory_without_missing_standby(self, inventory_patched):
+        inventory_patched.return_value = k93s.inventory.Inventory()
+        for row in _STATS + [{'name': 'testcluster-agent-3', 'role': 'standby'}]:
+            inventory_patched.return_value.add_host(row['name'], {},
+                                                    ['kubernetes_' + row['role']])
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        k93s.journal.Journal.for_config(test_config_path).mark('testcluster-agent-3',
+                                                               'prepared')
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'inventory'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertNotIn('Going to invoke action stats', res.output)
+        self.assertIn('"testcluster-agent-1"', res.output)
+        self.assertIn('"testcluster-agent-3"', res.output)
+        # Standby agent of the warm pool was not created yet
+        self.assertNotIn('"testcluster-agent-2"', res.output)
+
+    def test_status(self):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'status', '--json'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn('Going to invoke action stats on VMs', res.output)
+        # Second call is served from cache
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'status'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertNotIn('Going to invoke action stats on VMs', res.output)
+        self.assertIn('NAME', res.output)
+
+    @mock.patch('k93s.test.test_main.backend.backend.collect_garbage')
+    def test_gc(self, collect_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        collect_patched.return_value = [{'host': 'qemu:///system', 'action': 'orphan',
+                                         'name': 'gone.qcow2', 'reclaimed': 2 ** 20}]
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'gc',
+                                       '--image-budget', '2048', '--dry-run'])
+        self.assertEqual(res.exit_code, 0)
+        collect_patched.assert_called_once_with(mock.ANY, 2048, False, True)
+        self.assertIn('Would reclaim 1.0 MiB', res.output)
+
+    @mock.patch('k93s.test.test_main.backend.backend.stats',
+                side_effect=[_MISSING, _STATS])
+    def test_kubernetes(self, stats_patched):
         test_config_path = 'k93s/test/test_config/.k93s.main'
         res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubernetes'])
+        self.assertIn('Going to invoke action spinup on VMs', res.output)
         self.assertIn('Done Ansible, removing directory now', res.output)
 
-    def test_kubectl(self):
+    @mock.patch('k93s.provision.ansible_kubernetes')
+    @mock.patch('k93s.provision.configure_kubectl')
+    @mock.patch('k93s.test.test_main.backend.backend.stats',
+                side_effect=[_MISSING, _STATS])
+    def test_kubernetes_kubectl(self, stats_patched, configure_kubectl_patched,
+                                ansible_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubernetes',
+                                       '--kubectl'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(1, res.output.count('Going to invoke action spinup on VMs'))
+        self.assertEqual(1, res.output.count('Going to invoke action inventory on VMs'))
+        inventory_contents = ansible_patched.call_args[0][0]
+        configure_kubectl_patched.assert_called_once_with(
+            inventory_contents, mock.ANY, True, context_name='testcluster')
+
+    @mock.patch('k93s.provision.ansible_kubernetes')
+    @mock.patch('k93s.test.test_main.backend.backend.resume')
+    @mock.patch('k93s.test.test_main.backend.backend.spinup')
+    @mock.patch('k93s.test.test_main.backend.backend.stats')
+    def test_kubernetes_shutoff(self, stats_patched, spinup_patched, resume_patched,
+                                ansible_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        journal = k93s.journal.Journal.for_config(test_config_path)
+        journal.mark('testcluster-master-1', 'created', 'booted', 'prepared', 'installed',
+                     'joined')
+        journal.mark('testcluster-agent-1', 'created', 'booted', 'prepared', 'installed',
+                     'joined')
+        shutoff = [dict(row) for row in _STATS]
+        shutoff[1]['state'] = 'shutoff'
+        stats_patched.side_effect = [shutoff, _STATS]
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubernetes'])
+        self.assertEqual(0, res.exit_code)
+        spinup_patched.assert_not_called()
+        self.assertIn('Going to invoke action resume on VMs', res.output)
+        resume_patched.assert_called_once()
+        self.assertTrue(journal.done('testcluster-agent-1', 'booted'))
+
+    @mock.patch('k93s.provision.ansible_kubernetes')
+    @mock.patch('k93s.test.test_main.backend.backend.stats')
+    def test_kubernetes_spinup_failed(self, stats_patched, ansible_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        stats_patched.return_value = [dict(row, state='missing') for row in _STATS]
+        stats_patched.return_value[0]['state'] = 'running'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubernetes'])
+        self.assertEqual(9, res.exit_code)
+        ansible_patched.assert_not_called()
+        journal = k93s.journal.Journal.for_config(test_config_path)
+        self.assertEqual(['created', 'booted'], journal.phases('testcluster-master-1'))
+        self.assertEqual([], journal.phases('testcluster-agent-1'))
+
+    @mock.patch('k93s.provision.ansible_kubernetes')
+    @mock.patch('k93s.test.test_main.backend.backend.stats', return_value=_STATS)
+    def test_kubernetes_resume(self, stats_patched, ansible_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        journal = k93s.journal.Journal.for_config(test_config_path)
+        journal.mark('testcluster-master-1', 'created', 'booted', 'prepared', 'installed',
+                     'joined')
+        journal.mark('testcluster-agent-1', 'created', 'booted', 'prepared')
+
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubernetes'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertNotIn('Going to invoke action spinup on VMs', res.output)
+        self.assertEqual(['testcluster-agent-1', 'testcluster-master-1'],
+                         ansible_patched.call_args[1]['limit'])
+        self.assertEqual(['created', 'booted', 'prepared'],
+                         ansible_patched.call_args[1]['extra_vars']['k93s_journal'][
+                             'testcluster-agent-1'])
+
+        journal.mark('testcluster-agent-1', 'installed', 'joined')
+        ansible_patched.reset_mock()
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubernetes'])
+        self.assertIn('nothing to provision', res.output)
+        ansible_patched.assert_not_called()
+
+    @mock.patch('k93s.provision.ansible_kubernetes')
+    def test_upgrade(self, ansible_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'upgrade',
+                                       '--batch-size', '2'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual('upgrade.yml', ansible_patched.call_args[1]['playbook'])
+        self.assertEqual({'k93s_upgrade_batch': 2}, ansible_patched.call_args[1]['extra_vars'])
+
+    @mock.patch('k93s.registry.ensure_running')
+    def test_registry_not_enabled(self, ensure_running_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'registry'])
+        self.assertEqual(6, res.exit_code)
+        ensure_running_patched.assert_not_called()
+
+    @mock.patch('k93s.registry.ensure_running')
+    @mock.patch('k93s.registry.settings', return_value={'port': 5000})
+    @mock.patch('k93s.test.test_main.backend.backend.inventory')
+    def test_registry(self, inventory_patched, settings_patched, ensure_running_patched):
+        inventory_patched.return_value = k93s.inventory.Inventory()
+        inventory_patched.return_value.add_host('testcluster-master-1',
+                                                {'k93s_gateway': '10.93.1.1'})
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'registry'])
+        self.assertEqual(0, res.exit_code)
+        ensure_running_patched.assert_called_once_with({'port': 5000}, ['10.93.1.1'])
+
+    @mock.patch('k93s.registry.remove')
+    def test_registry_remove(self, remove_patched):
+        res = self.runner.invoke(cli, ['registry', '--remove', '--purge'])
+        self.assertEqual(0, res.exit_code)
+        remove_patched.assert_called_once_with(purge=True)
+
+    @mock.patch('k93s.bench.save')
+    @mock.patch('k93s.bench.run')
+    @mock.patch('k93s.test.test_main.backend.backend.inventory')
+    def test_bench(self, inventory_patched, run_patched, save_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        inventory_patched.return_value = k93s.inventory.Inventory()
+        inventory_patched.return_value.add_host('testcluster-master-1',
+                                                {'ansible_host': '192.168.123.11'},
+                                                ['kubernetes_master'])
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'bench',
+                                       '--rates', '2,4', '--pods', '10'])
+        self.assertEqual(res.exit_code, 0)
+        host, config_contents, rates, pods = run_patched.call_args[0]
+        self.assertEqual(('testcluster-master-1', '192.168.123.11'), (host.name, host.address))
+        self.assertEqual(([2, 4], 10), (rates, pods))
+        save_patched.assert_called_once_with(self.testtempdir, run_patched.return_value)
+
+    @mock.patch('k93s.bench.run')
+    def test_bench_invalid_rates(self, run_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        for rates in ('0', '5,-1', '5,fast'):
+            res = self.runner.invoke(cli, ['--config-file', test_config_path, 'bench',
+                                           '--rates', rates])
+            self.assertEqual(2, res.exit_code)
+            self.assertIn("Invalid value for '--rates'", res.output)
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'bench', '--pods', '0'])
+        self.assertEqual(2, res.exit_code)
+        run_patched.assert_not_called()
+
+    @mock.patch('k93s.diagnostics.collect', return_value=[])
+    @mock.patch('k93s.test.test_main.backend.backend.inventory')
+    def test_collect(self, inventory_patched, collect_patched):
+        inventory_patched.return_value = k93s.inventory.Inventory()
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'collect',
+                                       '--max-workers', '4'])
+        self.assertEqual(res.exit_code, 0)
+        cluster_inventory, path = collect_patched.call_args[0]
+        self.assertEqual(inventory_patched.return_value, cluster_inventory)
+        self.assertTrue(path.startswith(os.path.join(self.testtempdir, 'diagnostics')))
+        self.assertEqual({'max_workers': 4, 'timeout': 60.0, 'lines': 5000},
+                         collect_patched.call_args[1])
+
+    @mock.patch('k93s.exporter.serve')
+    def test_exporter(self, serve_patched):
+        test_config_path = 'k93s/test/test_config/.k93s.main'
+        res = self.runner.invoke(cli, ['--config-file', test_config_path, 'exporter',
+                                       '--port', '9100'])
+        self.assertEqual(res.exit_code, 0)
+        exporter, address, port = serve_patched.call_args[0]
+        self.assertEqual(('127.0.0.1', 9100), (address, port))
+        with mock.patch('k93s.test.test_main.backend.backend.stats', return_value=_STATS):
+            self.assertIn('k93s_domain_running{domain="testcluster-master-1",role="master"} 1',
+                          exporter.scrape())
+
+    @mock.patch('k93s.provision.configure_kubectl')
+    def test_kubectl(self, configure_kubectl_patched):
         test_config_path = 'k93s/test/test_config/.k93s.main'
         res = self.runner.invoke(cli, ['--config-file', test_config_path, 'kubectl'], input='n\n')
-        self.assertIn('Done Ansible, removing directory now', res.output)
+        self.assertEqual(res.exit_code, 0)
+        configure_kubectl_patched.assert_called_once_with(
+            mock.ANY, mock.ANY, False, context_name='testcluster')
@@ -0,0 +1,76 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+import k93s.metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+        mock.patch.object(k93s.metrics, '_counters', k93s.metrics.collections.defaultdict(
+            float)).start()
+        mock.patch.object(k93s.metrics, '_histograms', {}).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    @mock.patch('time.monotonic', side_effect=[10.0, 52.5])
+    def test_timed(self, monotonic_patched):
+        with k93s.metrics.timed('spinup'):
+            pass
+        k93s.metrics.flush(self.testtempdir)
+        counters, histograms = k93s.metrics.load(self.testtempdir)
+        self.assertEqual({}, counters)
+        histogram = histograms[('k93s_operation_duration_seconds', (('operation', 'spinup'),))]
+        self.assertEqual(1, histogram['count'])
+        self.assertEqual(42.5, histogram['sum'])
+        self.assertEqual([0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1], histogram['buckets'])
+
+    def test_timed_failure(self):
+        with self.assertRaises(RuntimeError):
+            with k93s.metrics.timed('teardown'):
+                raise RuntimeError()
+        k93s.metrics.flush(self.testtempdir)
+        counters, _ = k93s.metrics.load(self.testtempdir)
+        self.assertEqual(
+            {('k93s_operation_failures_total', (('operation', 'teardown'),)): 1}, counters)
+
+    def test_flush_merges(self):
+        k93s.metrics.inc('k93s_image_fetch_bytes_total', 100, distro='centos-8')
+        k93s.metrics.observe('k93s_operation_duration_seconds', 3, operation='stats')
+        k93s.metrics.flush(self.testtempdir)
+        k93s.metrics.inc('k93s_image_fetch_bytes_total', 50, distro='centos-8')
+        k93s.metrics.observe('k93s_operation_duration_seconds', 0.5, operation='stats')
+        k93s.metrics.flush(self.testtempdir)
+
+        counters, histograms = k93s.metrics.load(self.testtempdir)
+        self.assertEqual(150, counters[('k93s_image_fetch_bytes_total',
+                                        (('distro', 'centos-8'),))])
+        histogram = histograms[('k93s_operation_duration_seconds', (('operation', 'stats'),))]
+        self.assertEqual(2, histogram['count'])
+        self.assertEqual([1, 2, 2], histogram['buckets'][:3])
+
+    def test_load_missing(self):
+        self.assertEqual(({}, {}), k93s.metrics.load(self.testtempdir))
+
+    def test_format(self):
+        k93s.metrics.inc('k93s_image_fetch_bytes_total', 100, distro='centos-8')
+        k93s.metrics.observe('k93s_operation_duration_seconds', 3, operation='stats')
+        k93s.metrics.flush(self.testtempdir)
+        text = k93s.metrics.format_samples(
+            k93s.metrics.samples(*k93s.metrics.load(self.testtempdir)))
+        lines = text.splitlines()
+        self.assertIn('# TYPE k93s_image_fetch_bytes_total counter', lines)
+        self.assertIn('k93s_image_fetch_bytes_total{distro="centos-8"} 100.0', lines)
+        self.assertEqual(1, lines.count('# TYPE k93s_operation_duration_seconds histogram'))
+        self.assertIn('k93s_operation_duration_seconds_bucket{le="1",operation="stats"} 0',
+                      lines)
+        self.assertIn('k93s_operation_duration_seconds_bucket{le="+Inf",operation="stats"} 1',
+                      lines)
+        self.assertIn('k93s_operation_duration_seconds_sum{operation="stats"} 3.0', lines)
+        self.assertIn('k93s_operation_duration_seconds_count{operation="stats"} 1', lines)
@@ -0,0 +1,60 @@
+import unittest
+
+import k93s.profiles
+
+
+class ProfilesTest(unittest.TestCase):
+
+    def test_default(self):
+        options = k93s.profiles.tier_options({})
+        self.assertEqual([], k93s.profiles.k3s_args(options, True))
+        self.assertEqual([], k93s.profiles.k3s_args(options, False))
+
+    def test_minimal_server(self):
+        args = k93s.profiles.k3s_args(k93s.profiles.tier_options({'k3s_profile': 'minimal'}), True)
+        self.assertEqual(['--no-deploy', 'traefik'], args[:2])
+        self.assertIn('kube-reserved=cpu=50m,memory=64Mi', args)
+        self.assertIn('image-gc-high-threshold=70', args)
+
+    def test_minimal_agent(self):
+        args = k93s.profiles.k3s_args(k93s.profiles.tier_options({'k3s_profile': 'minimal'}), False)
+        self.assertNotIn('--no-deploy', args)
+        self.assertIn('system-reserved=cpu=50m,memory=64Mi', args)
+
+    def test_overrides(self):
+        options = k93s.profiles.tier_options({
+            'k3s_profile': 'perf',
+            'k3s_options': {'disable': ['traefik'], 'data_dir': '/srv/k3s'},
+        })
+        args = k93s.profiles.k3s_args(options, True)
+        self.assertEqual(['--no-deploy', 'traefik', '--data-dir', '/srv/k3s'], args[:4])
+        self.assertIn('serialize-image-pulls=false', args)
+        # profiles themselves are left intact
+        self.assertEqual(['traefik', 'servicelb'], k93s.profiles.PROFILES['perf']['disable'])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(RuntimeError):
+            k93s.profiles.tier_options({'k3s_profile': 'tiny'})
+
+    def test_unknown_option(self):
+        with self.assertRaises(RuntimeError):
+            k93s.profiles.tier_options({'k3s_options': {'disable_agent': True}})
+
+    def test_ansible_vars(self):
+        result = k93s.profiles.ansible_vars({
+            'masters': {'k3s_profile': 'minimal', 'k3s_options': {'data_dir': '/srv/k3s'}},
+            'agents': {},
+        })
+        self.assertIn('--no-deploy', result['k3s_server_args'])
+        self.assertEqual([], result['k3s_agent_args'])
+        self.assertEqual('/srv/k3s', result['k3s_server_data_dir'])
+        self.assertNotIn('k3s_agent_data_dir', result)
+
+    def test_ansible_vars_agent_data_dir(self):
+        result = k93s.profiles.ansible_vars({
+            'masters': {},
+            'agents': {'k3s_options': {'data_dir': '/srv/k3s-agent'}},
+        })
+        self.assertEqual(['--data-dir', '/srv/k3s-agent'], result['k3s_agent_args'])
+        self.assertEqual('/srv/k3s-agent', result['k3s_agent_data_dir'])
+        self.assertNotIn('k3s_server_data_dir', result)
@@ -1,12 +1,48 @@
-import getpass
+import glob
 import os
 import shutil
 import subprocess
 import unittest
 from unittest import mock
+import yaml
 
 import k93s
+import k93s.facts
 import k93s.provision
+import k93s.transport
+
+
+_INVENTORY = """testcluster-master-1 ansible_host=192.168.123.11 ansible_user=user \
+ansible_ssh_common_args="-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
+testcluster-agent-1 ansible_host=192.168.123.111 ansible_user=user
+
+[kubernetes_master]
+testcluster-master-1
+
+[kubernetes_agent]
+testcluster-agent-1
+"""
+
+_K3S_KUBECONFIG = """apiVersion: v1
+clusters:
+- cluster:
+    certificate-authority-data: Q0E=
+    server: https://192.168.123.11:6443
+  name: default
+contexts:
+- context:
+    cluster: default
+    user: default
+  name: default
+current-context: default
+kind: Config
+preferences: {}
+users:
+- name: default
+  user:
+    password: secret
+    username: admin
+"""
 
 
 class ProvisionTest(unittest.TestCase):
@@ -22,6 +58,12 @@ class ProvisionTest(unittest.TestCase):
             os.path.join(self.testtempdir, 'config'),
         )
         self.kubeconfig_mock = self.kubeconfig_patch.start()
+        mock.patch('k93s.provision.kubeconfig_new_file',
+                   os.path.join(self.testtempdir, 'config-new')).start()
+        mock.patch('k93s.provision._kubeconfig_backup_tpl',
+                   os.path.join(self.testtempdir, 'config-old.{date}')).start()
+        self.fetch_mock = mock.patch.object(k93s.transport.pool, 'fetch',
+                                            return_value=_K3S_KUBECONFIG.encode()).start()
 
         self.addCleanup(mock.patch.stopall)
 
@@ -29,36 +71,120 @@ class ProvisionTest(unittest.TestCase):
         shutil.rmtree(self.testtempdir)
         os.chdir(k93s.curdir)
 
+    def _write_kubeconfig(self, contents):
+        with open(os.path.join(self.testtempdir, 'config'), 'w') as fl:
+            yaml.safe_dump(contents, fl)
+
+    def _read_kubeconfig(self, name='config'):
+        with open(os.path.join(self.testtempdir, name)) as fl:
+            return yaml.safe_load(fl)
+
+    def test_ansible_kubernetes_limit(self):
+        k93s.provision.ansible_kubernetes(_INVENTORY, {}, self.testtempdir,
+                                          limit=['testcluster-agent-1', 'testcluster-master-1'],
+                                          extra_vars={'k93s_journal': {}},
+                                          fact_cache=k93s.facts.FactCache(self.testtempdir))
+        command = self.subprocess_mock.call_args[0][0]
+        self.assertEqual(['--limit', 'testcluster-agent-1,testcluster-master-1', 'k8s.yml'],
+                         command[-3:])
+        self.assertIn('@k93s_vars.json', command)
+        self.assertNotIn('k3s_version', ' '.join(command))
+        env = self.subprocess_mock.call_args[1]['env']
+        self.assertIn('ControlMaster=auto', env['ANSIBLE_SSH_ARGS'])
+        self.assertEqual('jsonfile', env['ANSIBLE_CACHE_PLUGIN'])
+
+    def test_ansible_kubernetes_k3s_version(self):
+        k93s.provision.ansible_kubernetes(_INVENTORY, {'k3s_version': 'v0.9.1'},
+                                          self.testtempdir, playbook='upgrade.yml')
+        command = self.subprocess_mock.call_args[0][0]
+        self.assertEqual(['-e', 'k3s_version=v0.9.1', '-e', '@k93s_vars.json', 'upgrade.yml'],
+                         command[-5:])
+
     def test_configure_kubectl_noswitch(self):
-        k93s.provision.configure_kubectl('', self.testtempdir, switch_to_new=False)
-        self.subprocess_mock.assert_called_once_with(
-                [
-                    'ansible', '-i', 'inventory.ini', 'kubernetes_master[0]', '-m',
-                    'fetch', '-a',
-                    'src=/home/{}/.kube/config dest=./k93s/test/_temp/ansible_temp/ '
-                    'flat=true'.format(
-                        getpass.getuser())]
-        )
+        k93s.provision.configure_kubectl(_INVENTORY, self.testtempdir, switch_to_new=False,
+                                         context_name='testcluster')
+        host = self.fetch_mock.call_args[0][0]
+        self.assertEqual(('testcluster-master-1', '192.168.123.11', 'user'),
+                         (host.name, host.address, host.user))
+        self.fetch_mock.assert_called_once_with(host, '/home/user/.kube/config')
+        kubeconfig = self._read_kubeconfig('config-new')
+        self.assertEqual('testcluster', kubeconfig['current-context'])
+        self.assertEqual('https://192.168.123.11:6443',
+                         kubeconfig['clusters'][0]['cluster']['server'])
+        self.assertFalse(os.path.exists(os.path.join(self.testtempdir, 'config')))
 
     def test_configure_kubectl_switch(self):
-        # Pre-fill 'kubeconfig' value
-
-        def side_effect_ansible(*args):
-            self.shutil_patch = mock.patch.object(shutil, 'copyfile')
-            self.shutil_mock = self.shutil_patch.start()
-
-        self.subprocess_mock.side_effect = side_effect_ansible
-        k93s.provision.configure_kubectl('', self.testtempdir, switch_to_new=True)
-        self.subprocess_mock.assert_called_once_with(
-                [
-                    'ansible', '-i', 'inventory.ini', 'kubernetes_master[0]', '-m',
-                    'fetch', '-a',
-                    'src=/home/{}/.kube/config dest=./k93s/test/_temp/ansible_temp/ '
-                    'flat=true'.format(
-                        getpass.getuser())]
-        )
-        self.assertEqual(self.shutil_mock.call_count, 2)
-        self.shutil_mock.assert_called_with(
-            './k93s/test/_temp/ansible_temp/config',
-            './k93s/test/_temp/config',
+        self._write_kubeconfig({
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'clusters': [{'name': 'other', 'cluster': {'server': 'https://other'}},
+                         {'name': 'testcluster', 'cluster': {'server': 'https://old'}}],
+            'users': [{'name': 'other', 'user': {}}],
+            'contexts': [{'name': 'other', 'context': {'cluster': 'other', 'user': 'other'}}],
+            'current-context': 'other',
+        })
+        k93s.provision.configure_kubectl(_INVENTORY, self.testtempdir, switch_to_new=True,
+                                         context_name='testcluster')
+        kubeconfig = self._read_kubeconfig()
+        self.assertEqual('testcluster', kubeconfig['current-context'])
+        self.assertEqual(
+            [('other', 'https://other'), ('testcluster', 'https://192.168.123.11:6443')],
+            [(c['name'], c['cluster']['server']) for c in kubeconfig['clusters']],
         )
+        self.assertEqual(['other', 'testcluster'], [u['name'] for u in kubeconfig['users']])
+        self.assertEqual({'cluster': 'testcluster', 'user': 'testcluster'},
+                         kubeconfig['contexts'][1]['context'])
+        backups = [f for f in os.listdir(self.testtempdir) if f.startswith('config-old.')]
+        self.assertEqual(1, len(backups))
+
+    def test_configure_kubectl_switch_no_config(self):
+        k93s.provision.configure_kubectl(_INVENTORY, self.testtempdir, switch_to_new=True)
+        kubeconfig = self._read_kubeconfig()
+        self.assertEqual('k93s', kubeconfig['current-context'])
+        self.assertEqual('Config', kubeconfig['kind'])
+
+    def test_merge_kubeconfig_keeps_current_context(self):
+        merged = k93s.provision.merge_kubeconfig(
+            {'current-context': 'other'}, yaml.safe_load(_K3S_KUBECONFIG), 'testcluster',
+            switch_to_new=False)
+        self.assertEqual('other', merged['current-context'])
+        self.assertEqual(['testcluster'], [c['name'] for c in merged['contexts']])
+
+
+class PlaybooksTest(unittest.TestCase):
+
+    ansible_dir = os.path.join(os.path.dirname(k93s.__file__), 'ansible')
+    playbooks = ('k8s.yml', 'standby.yml', 'upgrade.yml')
+
+    def test_common_imports_are_role_qualified(self):
+        # Common tasks are imported into other roles, where bare paths resolve
+        # against the importing role and may import the common tasks again.
+        for path in glob.glob(os.path.join(self.ansible_dir, 'roles/k8s-common/tasks/*.yml')):
+            with open(path) as fl:
+                tasks = yaml.safe_load(fl) or []
+            for task in tasks:
+                if 'import_tasks' in task:
+                    self.assertTrue(task['import_tasks'].startswith('roles/k8s-common/tasks/'),
+                                    '{}: {}'.format(path, task['import_tasks']))
+
+    @unittest.skipUnless(shutil.which('ansible-playbook'), 'Ansible is not installed')
+    def test_playbooks_list_tasks(self):
+        for playbook in self.playbooks:
+            completed = subprocess.run(
+                ['ansible-playbook', '-i', 'localhost,', '--list-tasks', playbook],
+                cwd=self.ansible_dir, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.assertEqual(0, completed.returncode, completed.stdout.decode())
+
+    @unittest.skipUnless(shutil.which('ansible'), 'Ansible is not installed')
+    def test_registries_supported_since_k3s_1_0(self):
+        with open(os.path.join(self.ansible_dir, 'roles/k8s-common/tasks/registry.yml')) as fl:
+            check = next(task for task in yaml.safe_load(fl) if 'set_fact' in task)
+        expression = check['set_fact']['k93s_registries_supported']
+        for version, supported in (('v0.8.1', 'False'), ('v1.0.0', 'True'),
+                                   ('v1.17.4+k3s1', 'True')):
+            completed = subprocess.run(
+                ['ansible', 'localhost', '-m', 'debug', '-a', 'msg=' + expression,
+                 '-e', 'k3s_version=' + version],
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self.assertIn('"msg": {}'.format(supported.lower()), completed.stdout.decode().lower())
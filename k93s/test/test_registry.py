@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import subprocess
+import unittest
+from unittest import mock
+
+import k93s.inventory
+import k93s.registry
+
+
+def _inspect(status, addresses=('',)):
+    bindings = [{'HostIp': address, 'HostPort': '5000'} for address in addresses]
+    return subprocess.CompletedProcess([], 0, stdout=json.dumps(
+        [{'State': {'Status': status}, 'HostConfig': {'PortBindings': {'5000/tcp': bindings}}}]
+    ).encode())
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+        mock.patch('shutil.which', side_effect=lambda name: '/usr/bin/' + name).start()
+        self.run_mock = mock.patch.object(subprocess, 'run').start()
+        self.check_call_mock = mock.patch.object(subprocess, 'check_call').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def test_settings_disabled(self):
+        self.assertIsNone(k93s.registry.settings({}))
+        self.assertIsNone(k93s.registry.settings({'registry': {'enabled': 'no'}}))
+        self.assertEqual({}, k93s.registry.ansible_vars({}))
+
+    def test_settings(self):
+        images = os.path.join(self.testtempdir, 'k3s-airgap-images-amd64.tar')
+        open(images, 'w').close()
+        settings = k93s.registry.settings({'registry': {'enabled': 'yes', 'port': '5001',
+                                                        'airgap_images': images}})
+        self.assertEqual(5001, settings['port'])
+        self.assertEqual('https://registry-1.docker.io', settings['upstream'])
+        self.assertEqual({'k93s_registry_port': 5001,
+                          'k93s_airgap_images': os.path.abspath(images)},
+                         k93s.registry.ansible_vars({'registry': {'enabled': True, 'port': 5001,
+                                                                  'airgap_images': images}}))
+
+    def test_settings_missing_airgap_images(self):
+        with self.assertRaises(RuntimeError):
+            k93s.registry.settings({'registry': {'enabled': True, 'airgap_images': '/nonexistent'}})
+
+    def test_no_container_engine(self):
+        with mock.patch('shutil.which', return_value=None):
+            with self.assertRaises(RuntimeError):
+                k93s.registry.container_engine()
+
+    def test_ensure_running_creates(self):
+        self.run_mock.return_value = subprocess.CompletedProcess([], 125, stdout=b'')
+        k93s.registry.ensure_running(k93s.registry.settings({'registry': {'enabled': True}}))
+        command = self.check_call_mock.call_args[0][0]
+        self.assertEqual(['/usr/bin/podman', 'run'], command[:2])
+        self.assertIn('5000:5000', command)
+        self.assertIn('k93s-registry:/var/lib/registry', command)
+
+    def test_ensure_running_creates_on_addresses(self):
+        self.run_mock.return_value = subprocess.CompletedProcess([], 125, stdout=b'')
+        k93s.registry.ensure_running(k93s.registry.settings({'registry': {'enabled': True}}),
+                                     ['10.93.1.1', '192.168.123.1'])
+        command = self.check_call_mock.call_args[0][0]
+        self.assertIn('10.93.1.1:5000:5000', command)
+        self.assertIn('192.168.123.1:5000:5000', command)
+        self.assertNotIn('5000:5000', command)
+
+    @mock.patch.object(k93s.registry, '_is_local',
+                       side_effect=lambda address: address != '10.0.0.1')
+    def test_ensure_running_recreates_on_new_address(self, is_local_patched):
+        self.run_mock.return_value = _inspect('running', ['192.168.123.1', '10.0.0.1'])
+        k93s.registry.ensure_running(k93s.registry.settings({'registry': {'enabled': True}}),
+                                     ['10.93.1.1'])
+        self.assertEqual(['/usr/bin/podman', 'rm', '--force', 'k93s-registry'],
+                         self.check_call_mock.call_args_list[0][0][0])
+        command = self.check_call_mock.call_args[0][0]
+        # Addresses of other clusters are kept, unless their networks are gone
+        self.assertIn('192.168.123.1:5000:5000', command)
+        self.assertIn('10.93.1.1:5000:5000', command)
+        self.assertNotIn('10.0.0.1:5000:5000', command)
+
+    def test_ensure_running_recreates_published_on_all_addresses(self):
+        self.run_mock.return_value = _inspect('running')
+        k93s.registry.ensure_running(k93s.registry.settings({'registry': {'enabled': True}}),
+                                     ['10.93.1.1'])
+        command = self.check_call_mock.call_args[0][0]
+        self.assertEqual(['/usr/bin/podman', 'run'], command[:2])
+        self.assertIn('10.93.1.1:5000:5000', command)
+        self.assertNotIn('5000:5000', command)
+
+    def test_bind_addresses(self):
+        inventory = k93s.inventory.Inventory()
+        inventory.add_host('master', {'k93s_gateway': '10.93.1.1'})
+        inventory.add_host('agent', {'k93s_gateway': '10.93.1.1'})
+        inventory.add_host('other', {})
+        self.assertEqual(['10.93.1.1'], k93s.registry.bind_addresses(inventory))
+
+    def test_ensure_running_starts_stopped(self):
+        self.run_mock.return_value = _inspect('exited')
+        k93s.registry.ensure_running(k93s.registry.settings({'registry': {'enabled': True}}))
+        self.check_call_mock.assert_called_once_with(
+            ['/usr/bin/podman', 'start', 'k93s-registry'], stdout=subprocess.DEVNULL)
+
+    def test_ensure_running_running(self):
+        self.run_mock.return_value = _inspect('running')
+        k93s.registry.ensure_running(k93s.registry.settings({'registry': {'enabled': True}}))
+        self.check_call_mock.assert_not_called()
+
+    @mock.patch.object(k93s.registry, '_is_local', return_value=True)
+    def test_ensure_running_running_on_addresses(self, is_local_patched):
+        self.run_mock.return_value = _inspect('running', ['10.93.1.1'])
+        k93s.registry.ensure_running(k93s.registry.settings({'registry': {'enabled': True}}),
+                                     ['10.93.1.1'])
+        self.check_call_mock.assert_not_called()
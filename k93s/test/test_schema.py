@@ -0,0 +1,84 @@
+import unittest
+from unittest import mock
+
+import k93s.config
+import k93s.schema
+import k93s.vms.lightning
+
+
+class SchemaTest(unittest.TestCase):
+
+    def test_compile_casts_values(self):
+        config = k93s.schema.compile_config({
+            'name': 'testcluster',
+            'masters': {'count': '1', 'memory': '1024', 'vcpus': 2.0},
+            'agents': {'warm_pool': '2', 'k3s_profile': 'minimal'},
+            'vms_backend_config': {'cpu_pinning': 'yes', 'nic_queues': 'auto', 'mtu': '9000'},
+            'registry': {'enabled': 'no'},
+            'gc': {'image_budget': '4096'},
+        })
+        self.assertEqual((1, 1024, 2), (config.masters.count, config.masters.memory,
+                                        config.masters.vcpus))
+        self.assertEqual({
+            'name': 'testcluster',
+            'masters': {'count': 1, 'memory': 1024, 'vcpus': 2},
+            'agents': {'warm_pool': 2, 'k3s_profile': 'minimal'},
+            'vms_backend_config': {'cpu_pinning': True, 'nic_queues': 'auto', 'mtu': 9000},
+            'registry': {'enabled': False},
+            'gc': {'image_budget': 4096},
+        }, config.to_dict())
+
+    def test_compile_collects_errors(self):
+        with self.assertRaises(RuntimeError) as raised:
+            k93s.schema.compile_config({
+                'masters': {'memroy': 1024, 'vcpus': 0.5, 'warm_pool': 1},
+                'agents': {'k3s_options': {'disable_agent': True}},
+                'vms_backend_config': {'vhost_net': 'maybe', 'placement': 'random'},
+            })
+        message = str(raised.exception)
+        for problem in ('k93s.masters.memroy: unknown key',
+                        'k93s.masters.vcpus: expected an integer, got 0.5',
+                        'k93s.masters.warm_pool: only agents have a warm pool',
+                        'k93s.agents: Unknown k3s options: disable_agent',
+                        "k93s.vms_backend_config.vhost_net: expected yes or no, got 'maybe'",
+                        'k93s.vms_backend_config.placement'):
+            self.assertIn(problem, message)
+
+    def test_compile_no_section(self):
+        with self.assertRaises(RuntimeError):
+            k93s.schema.compile_config(None)
+
+    def test_compile_third_party_backend(self):
+        data = {'vms_backend': 'mybackend', 'vms_backend_config': {'api_token': 'secret'}}
+        self.assertEqual(data, k93s.schema.compile_config(data).to_dict())
+        with self.assertRaises(RuntimeError):
+            k93s.schema.compile_config({'vms_backend_config': {'api_token': 'secret'}})
+
+    @mock.patch('click.prompt', side_effect=lambda text, default: default)
+    def test_compile_new_config(self, prompt_patched):
+        k93s.config.create_new_config_file()
+        self.assertEqual('testcluster', k93s.schema.compile_config(k93s.config.k93s).name)
+
+    def test_compile_default_backend_properties(self):
+        common_properties = dict(k93s.vms.lightning.backend.common_properties,
+                                 network_auto_clean_up=True, private_hub='', custom_image_list='',
+                                 future_setting='value')
+        with mock.patch.object(k93s.vms.lightning.backend, 'common_properties',
+                               common_properties):
+            config = k93s.schema.compile_config({'vms_backend_config': common_properties})
+            self.assertEqual({'future_setting': 'value'}, config.vms_backend_config.extra)
+            self.assertTrue(config.vms_backend_config.network_auto_clean_up)
+            with self.assertRaises(RuntimeError):
+                k93s.schema.compile_config({'vms_backend_config': {'other_setting': 1}})
+
+    def test_compile_hosts(self):
+        config = k93s.schema.compile_config({'vms_backend_config': {
+            'hosts': ['qemu:///box1', {'uri': 'qemu:///box2', 'memory': '4096'}]}})
+        self.assertEqual([{'uri': 'qemu:///box1'}, {'uri': 'qemu:///box2', 'memory': 4096}],
+                         config.vms_backend_config.hosts)
+
+    def test_slotted(self):
+        tier = k93s.schema.TierConfig(count=1)
+        self.assertFalse(hasattr(tier, '__dict__'))
+        with self.assertRaises(AttributeError):
+            tier.cuont = 2
@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import subprocess
+import unittest
+from unittest import mock
+
+import k93s.status
+
+
+_NODES = {
+    'items': [
+        {'metadata': {'name': 'testcluster-master-1'},
+         'status': {'conditions': [{'type': 'Ready', 'status': 'True'}]}},
+        {'metadata': {'name': 'testcluster-agent-1'},
+         'status': {'conditions': [{'type': 'Ready', 'status': 'False'}]}},
+    ],
+}
+
+
+def _run(host, command, **kwargs):
+    if command.startswith('kubectl'):
+        return subprocess.CompletedProcess(command, 0, json.dumps(_NODES).encode(), b'')
+    return subprocess.CompletedProcess(command, 0, b'active\n', b'')
+
+
+class StatusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            {'name': 'testcluster-master-1', 'role': 'master', 'state': 'running',
+             'address': '192.168.123.11', 'user': 'user', 'cpu_time': 12.345},
+            {'name': 'testcluster-agent-1', 'role': 'agent', 'state': 'running',
+             'address': '192.168.123.111', 'user': 'user'},
+            {'name': 'testcluster-agent-2', 'role': 'agent', 'state': 'missing',
+             'address': '192.168.123.112', 'user': 'user'},
+        ]
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    @mock.patch('k93s.transport.pool.run', side_effect=_run)
+    @mock.patch('k93s.utils.wait_for_ssh', return_value=True)
+    def test_gather(self, wait_patched, run_patched):
+        rows = k93s.status.gather(self.rows)
+
+        self.assertEqual({'ssh': True, 'service': 'active', 'ready': True},
+                         {k: rows[0][k] for k in ('ssh', 'service', 'ready')})
+        self.assertEqual({'ssh': True, 'service': 'active', 'ready': False},
+                         {k: rows[1][k] for k in ('ssh', 'service', 'ready')})
+        self.assertEqual({'ssh': False, 'service': None, 'ready': None},
+                         {k: rows[2][k] for k in ('ssh', 'service', 'ready')})
+        self.assertEqual(2, wait_patched.call_count)
+        commands = sorted(c[0][1] for c in run_patched.call_args_list)
+        self.assertEqual(['kubectl get nodes -o json', 'systemctl is-active k3s',
+                          'systemctl is-active k3s-node'], commands)
+
+    @mock.patch('k93s.transport.pool.run',
+                side_effect=subprocess.TimeoutExpired('ssh', 5))
+    @mock.patch('k93s.utils.wait_for_ssh', return_value=True)
+    def test_gather_timeout(self, wait_patched, run_patched):
+        rows = k93s.status.gather(self.rows[0:1])
+        self.assertEqual('unknown', rows[0]['service'])
+        self.assertIsNone(rows[0]['ready'])
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(k93s.status, 'gather')
+    def test_wait_ready(self, gather_patched, sleep_patched):
+        standby = {'name': 'testcluster-agent-2', 'role': 'standby', 'ready': None}
+        gather_patched.side_effect = [
+            [dict(self.rows[0], ready=True), dict(self.rows[1], ready=False), standby],
+            [dict(self.rows[0], ready=True), dict(self.rows[1], ready=True), standby],
+        ]
+        rows = k93s.status.wait_ready(lambda: self.rows, 60)
+        self.assertTrue(rows[1]['ready'])
+        self.assertEqual(2, gather_patched.call_count)
+        sleep_patched.assert_called_once_with(2)
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(k93s.status, 'gather')
+    def test_wait_ready_timeout(self, gather_patched, sleep_patched):
+        gather_patched.return_value = [dict(self.rows[0], ready=None)]
+        rows = k93s.status.wait_ready(lambda: self.rows, 0)
+        self.assertIsNone(rows[0]['ready'])
+        sleep_patched.assert_not_called()
+
+    def test_cache(self):
+        self.assertIsNone(k93s.status.read_cache(self.testtempdir, 10))
+        k93s.status.write_cache(self.testtempdir, self.rows)
+        self.assertEqual(self.rows, k93s.status.read_cache(self.testtempdir, 10))
+        self.assertIsNone(k93s.status.read_cache(self.testtempdir, -1))
+        k93s.status.clear_cache(self.testtempdir)
+        self.assertIsNone(k93s.status.read_cache(self.testtempdir, 10))
+        k93s.status.clear_cache(self.testtempdir)
+
+    def test_format_table(self):
+        lines = k93s.status.format_table([dict(self.rows[0], ssh=True, ready=None)]).splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual(['NAME', 'ROLE', 'STATE', 'ADDRESS', 'VCPUS', 'CPU(s)', 'MEM(MiB)',
+                          'SSH', 'SERVICE', 'READY'], lines[0].split())
+        self.assertEqual(['testcluster-master-1', 'master', 'running', '192.168.123.11', '-',
+                          '12.3', '-', 'yes', '-', '-'], lines[1].split())
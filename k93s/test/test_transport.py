@@ -0,0 +1,59 @@
+import subprocess
+import unittest
+from unittest import mock
+
+from k93s import transport
+from k93s.inventory import Inventory
+
+
+class SSHPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = transport.SSHPool(control_dir='/tmp/k93s-test-ssh', persist='1m')
+        self.host = transport.SSHHost('master', '192.168.123.11', 'user',
+                                      ('-o', 'StrictHostKeyChecking=no'))
+        self.run_patch = mock.patch.object(subprocess, 'run')
+        self.run_mock = self.run_patch.start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _ssh(self, *args):
+        return [
+            'ssh',
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPath=/tmp/k93s-test-ssh/%C',
+            '-o', 'ControlPersist=1m',
+            '-o', 'ConnectTimeout=5',
+            '-o', 'BatchMode=yes',
+            '-o', 'StrictHostKeyChecking=no',
+        ] + list(args)
+
+    def test_run(self):
+        self.pool.run(self.host, 'uptime', timeout=3)
+        self.run_mock.assert_called_once_with(
+            self._ssh('user@192.168.123.11', '--', 'uptime'),
+            input=b'', stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            timeout=3, check=True,
+        )
+
+    def test_fetch(self):
+        self.run_mock.return_value.stdout = b'contents'
+        self.assertEqual(b'contents', self.pool.fetch(self.host, '/etc/my file', sudo=True))
+        self.assertEqual("sudo -n cat -- '/etc/my file'", self.run_mock.call_args[0][0][-1])
+
+    def test_put(self):
+        self.pool.put(self.host, b'contents', '/tmp/file')
+        self.assertEqual('cat > /tmp/file', self.run_mock.call_args[0][0][-1])
+        self.assertEqual(b'contents', self.run_mock.call_args[1]['input'])
+
+    def test_close(self):
+        self.pool.close(self.host)
+        self.assertEqual(self._ssh('-O', 'exit', 'user@192.168.123.11'),
+                         self.run_mock.call_args[0][0])
+
+    def test_host_from_inventory(self):
+        inventory = Inventory({'master': {
+            'ansible_host': '192.168.123.11',
+            'ansible_user': 'user',
+            'ansible_ssh_common_args': '-o StrictHostKeyChecking=no',
+        }})
+        self.assertEqual(self.host, transport.host_from_inventory(inventory, 'master'))
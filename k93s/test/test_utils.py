@@ -0,0 +1,82 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+import k93s.metrics
+import k93s.schema
+import k93s.utils
+
+
+_CONFIG = """k93s:
+  name: testcluster
+  masters:
+    memory: "1024"
+"""
+
+
+class ReadConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.join(os.curdir, 'k93s/test/_temp')
+        os.makedirs(self.testtempdir)
+        self.config_file = os.path.join(self.testtempdir, '.k93s.test')
+        with open(self.config_file, 'w') as fl:
+            fl.write(_CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def test_read_config(self):
+        self.assertEqual({'name': 'testcluster', 'masters': {'memory': 1024}},
+                         k93s.utils.read_config(self.config_file))
+        self.assertTrue(os.path.exists(os.path.join(self.config_file + '.state', 'config.json')))
+
+    def test_read_config_cached(self):
+        k93s.utils.read_config(self.config_file)
+        with mock.patch.object(k93s.schema, 'compile_config') as compile_patched:
+            self.assertEqual('testcluster', k93s.utils.read_config(self.config_file)['name'])
+            # Same contents with a new modification time are not compiled again
+            os.utime(self.config_file, ns=(0, 0))
+            self.assertEqual('testcluster', k93s.utils.read_config(self.config_file)['name'])
+            compile_patched.assert_not_called()
+
+    def test_read_config_changed(self):
+        k93s.utils.read_config(self.config_file)
+        with open(self.config_file, 'w') as fl:
+            fl.write(_CONFIG.replace('testcluster', 'othercluster'))
+        os.utime(self.config_file, ns=(0, 0))
+        self.assertEqual('othercluster', k93s.utils.read_config(self.config_file)['name'])
+
+    def test_read_config_invalid(self):
+        with open(self.config_file, 'w') as fl:
+            fl.write(_CONFIG.replace('memory', 'memroy'))
+        with self.assertRaises(RuntimeError):
+            k93s.utils.read_config(self.config_file)
+
+
+class VMsSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.abspath(os.path.join(os.curdir, 'k93s/test/_temp'))
+        os.makedirs(self.testtempdir)
+        self.backend = mock.Mock()
+        self.backend.compute_vms_configuration.return_value = []
+        mock.patch.object(k93s.utils, 'find_vms_backend', return_value=self.backend).start()
+        self.histograms = mock.patch.object(k93s.metrics, '_histograms', {}).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def test_invoke_timed(self):
+        with k93s.utils.vms_session(self.testtempdir, config_contents={}) as invoke:
+            invoke('stats')
+        self.backend.stats.assert_called_once_with([])
+        self.assertEqual(['stats'], [dict(labels)['operation'] for _, labels in self.histograms])
+
+    def test_invoke_untimed(self):
+        with k93s.utils.vms_session(self.testtempdir, config_contents={}) as invoke:
+            self.assertEqual(self.backend.stats.return_value, invoke('stats', True, timed=False))
+        self.backend.stats.assert_called_once_with([], True)
+        self.assertEqual({}, self.histograms)
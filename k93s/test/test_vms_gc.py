@@ -0,0 +1,160 @@
+import os
+import shutil
+import time
+import unittest
+from unittest import mock
+
+import libvirt
+
+from k93s.vms import gc
+
+
+_VOLUME_XML = '''<volume type='file'>
+  <name>{name}</name>
+  <allocation unit='bytes'>{allocation}</allocation>
+  <target>
+    <path>/pool/{name}</path>
+    <timestamps><ctime>{created}</ctime><mtime>{created}</mtime></timestamps>
+  </target>
+  {backing}
+</volume>'''
+_DOMAIN_XML = '''<domain>
+  <devices>
+    <disk type='file'><source file='/pool/{name}.qcow2'/></disk>
+    <disk type='file'><source file='/pool/{name}-cloud-init.iso'/></disk>
+  </devices>
+</domain>'''
+
+
+def _volume(name, allocation=1024, created=0.0, backing=None):
+    vol = mock.Mock()
+    vol.name.return_value = name
+    vol.XMLDesc.return_value = _VOLUME_XML.format(
+        name=name, allocation=allocation, created=created,
+        backing='<backingStore><path>{}</path></backingStore>'.format(backing) if backing else '')
+    return vol
+
+
+def _domain(name):
+    dom = mock.Mock()
+    dom.name.return_value = name
+    dom.XMLDesc.return_value = _DOMAIN_XML.format(name=name)
+    return dom
+
+
+class GcTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testtempdir = os.path.abspath(os.path.join(os.curdir, 'k93s/test/_temp'))
+        self.images = os.path.join(self.testtempdir, 'upstream')
+        os.makedirs(self.images)
+        self.conn = mock.Mock()
+        self.pool = self.conn.storagePoolLookupByName.return_value
+        self.pool.XMLDesc.return_value = '<pool><target><path>{}</path></target></pool>'.format(
+            self.testtempdir)
+        mock.patch.object(gc.hypervisor, 'connect', return_value=self.conn).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def tearDown(self):
+        shutil.rmtree(self.testtempdir)
+
+    def _image(self, name, size, age):
+        path = os.path.join(self.images, name)
+        with open(path, 'wb') as fl:
+            fl.write(b'\1' * size)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_pool_volumes_skip_directories(self):
+        directory = mock.Mock()
+        directory.XMLDesc.return_value = "<volume type='dir'><name>upstream</name></volume>"
+        self.pool.listAllVolumes.return_value = [_volume('a.qcow2', backing='/base'), directory]
+        volumes = gc.pool_volumes(self.pool)
+        self.assertEqual([gc.Volume('a.qcow2', '/pool/a.qcow2', 1024, '/base', 0.0)],
+                         [volume for _, volume in volumes])
+
+    def test_used_paths(self):
+        volumes = [gc.Volume('snap', '/pool/snap', 0, '/pool/disk', 0),
+                   gc.Volume('disk', '/pool/disk', 0, '/base.qcow2', 0),
+                   gc.Volume('other', '/pool/other', 0, None, 0)]
+        self.assertEqual({'/pool/snap', '/pool/disk', '/base.qcow2'},
+                         gc.used_paths({'/pool/snap'}, volumes))
+
+    def test_lru_evictions(self):
+        images = [gc.Image('/old', 300, 1), gc.Image('/used', 300, 0), gc.Image('/new', 300, 5)]
+        self.assertEqual([], gc.lru_evictions(images, set(), None))
+        self.assertEqual([], gc.lru_evictions(images, set(), 900))
+        self.assertEqual([images[0]], gc.lru_evictions(images, {'/used'}, 600))
+        self.assertEqual([images[0], images[2]], gc.lru_evictions(images, {'/used'}, 100))
+
+    def test_collect_orphans(self):
+        orphan, young = _volume('gone.qcow2', 4096), _volume('new.qcow2', created=time.time())
+        used = _volume('testcluster-master-1.qcow2')
+        self.pool.listAllVolumes.return_value = [orphan, young, used]
+        self.conn.listAllDomains.return_value = [_domain('testcluster-master-1')]
+
+        report = gc.collect('qemu:///system', 'virt-lightning')
+        self.assertEqual([{'host': 'qemu:///system', 'action': 'orphan', 'name': 'gone.qcow2',
+                           'reclaimed': 4096}], report)
+        orphan.delete.assert_called_once_with(0)
+        young.delete.assert_not_called()
+        used.delete.assert_not_called()
+        self.conn.storagePoolLookupByName.assert_called_once_with('virt-lightning')
+
+    def test_collect_dry_run(self):
+        orphan = _volume('gone.qcow2', 4096)
+        self.pool.listAllVolumes.return_value = [orphan]
+        self.conn.listAllDomains.return_value = []
+        self.assertEqual(1, len(gc.collect('qemu:///system', 'virt-lightning', dry_run=True)))
+        orphan.delete.assert_not_called()
+
+    def test_collect_no_pool(self):
+        error = libvirt.libvirtError('no pool')
+        error.get_error_code = mock.Mock(return_value=libvirt.VIR_ERR_NO_STORAGE_POOL)
+        self.conn.storagePoolLookupByName.side_effect = error
+        self.assertEqual([], gc.collect('qemu:///system', 'virt-lightning'))
+
+    def test_collect_images(self):
+        old = self._image('fedora-30.qcow2', 2 ** 20, 3600)
+        self._image('fedora-30.yaml', 10, 3600)
+        based = self._image('centos-8.qcow2', 2 ** 20, 7200)
+        partial = self._image('ubuntu-20.04.temp', 4096, 3600)
+        self.pool.listAllVolumes.return_value = [
+            _volume('testcluster-master-1.qcow2', backing=based)]
+        self.conn.listAllDomains.return_value = [_domain('testcluster-master-1')]
+
+        report = gc.collect('qemu:///system', 'virt-lightning', image_budget=1)
+        self.assertEqual([('partial', 'ubuntu-20.04.temp'), ('evict', 'fedora-30.qcow2')],
+                         [(row['action'], row['name']) for row in report])
+        self.assertEqual(['centos-8.qcow2'], os.listdir(self.images))
+        self.assertFalse(os.path.exists(old) or os.path.exists(partial))
+
+    @mock.patch.object(gc, 'compact_image', return_value=512)
+    def test_collect_compact(self, compact_patched):
+        unused = self._image('fedora-30.qcow2', 4096, 0)
+        based = self._image('centos-8.qcow2', 4096, 0)
+        self.pool.listAllVolumes.return_value = [
+            _volume('testcluster-master-1.qcow2', backing=based)]
+        self.conn.listAllDomains.return_value = [_domain('testcluster-master-1')]
+
+        report = gc.collect('qemu:///system', 'virt-lightning', compact=True)
+        compact_patched.assert_called_once_with(unused)
+        self.assertEqual([{'host': 'qemu:///system', 'action': 'compact',
+                           'name': 'fedora-30.qcow2', 'reclaimed': 512}], report)
+
+    def test_collect_remote_skips_images(self):
+        self._image('fedora-30.qcow2', 4096, 3600)
+        self.pool.listAllVolumes.return_value = []
+        self.conn.listAllDomains.return_value = []
+        self.assertEqual([], gc.collect('qemu+ssh://box1/system', 'virt-lightning',
+                                        image_budget=0))
+        self.assertEqual(['fedora-30.qcow2'], os.listdir(self.images))
+
+    def test_format_report(self):
+        lines = gc.format_report([{'host': 'qemu:///system', 'action': 'orphan',
+                                   'name': 'gone.qcow2', 'reclaimed': 3 * 2 ** 20}]).splitlines()
+        self.assertEqual(['ACTION', 'HOST', 'NAME', 'RECLAIMED(MiB)'], lines[0].split())
+        self.assertEqual(['orphan', 'qemu:///system', 'gone.qcow2', '3.0'], lines[1].split())
+        self.assertEqual('Reclaimed 3.0 MiB', lines[2])
+        self.assertEqual('Would reclaim 0.0 MiB',
+                         gc.format_report([], dry_run=True).splitlines()[1])
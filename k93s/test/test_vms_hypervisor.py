@@ -0,0 +1,261 @@
+import ipaddress
+import unittest
+from unittest import mock
+import xml.etree.ElementTree as ET
+
+import libvirt
+
+from k93s.vms import hypervisor
+
+
+_DOMAIN_XML = """
+<domain type='kvm'>
+  <name>testcluster-agent-1</name>
+  <devices>
+    <interface type='network'>
+      <source network='virt-lightning'/>
+      <model type='virtio'/>
+    </interface>
+    <interface type='network'>
+      <source network='other'/>
+      <model type='virtio'/>
+    </interface>
+  </devices>
+</domain>
+"""
+
+
+class NicTuningTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dom = mock.Mock()
+        self.dom.XMLDesc.return_value = _DOMAIN_XML
+
+    def _defined_interfaces(self):
+        xml = self.dom.connect.return_value.defineXML.call_args[0][0]
+        return ET.fromstring(xml).findall('./devices/interface')
+
+    def test_apply_nic_tuning(self):
+        self.assertTrue(hypervisor.apply_nic_tuning(
+            self.dom, 'virt-lightning', queues=4, vhost=True, mtu=9000))
+        tuned, other = self._defined_interfaces()
+        self.assertEqual({'name': 'vhost', 'queues': '4'}, tuned.find('./driver').attrib)
+        self.assertEqual({'size': '9000'}, tuned.find('./mtu').attrib)
+        self.assertIsNone(other.find('./driver'))
+        self.assertIsNone(other.find('./mtu'))
+
+    def test_apply_nic_tuning_unchanged(self):
+        self.assertTrue(hypervisor.apply_nic_tuning(self.dom, 'virt-lightning', queues=2))
+        self.dom.XMLDesc.return_value = self.dom.connect.return_value.defineXML.call_args[0][0]
+        self.dom.connect.return_value.defineXML.reset_mock()
+        self.assertFalse(hypervisor.apply_nic_tuning(self.dom, 'virt-lightning', queues=2))
+        self.dom.connect.return_value.defineXML.assert_not_called()
+
+    def test_apply_nic_tuning_single_queue(self):
+        self.assertFalse(hypervisor.apply_nic_tuning(self.dom, 'virt-lightning', queues=1))
+
+
+class GroupsTest(unittest.TestCase):
+
+    def test_domain_groups(self):
+        dom = mock.Mock()
+        dom.metadata.return_value = "<groups name='kubernetes_agent,extra' />"
+        self.assertEqual(['kubernetes_agent', 'extra'], hypervisor.domain_groups(dom))
+
+    def test_set_domain_groups(self):
+        dom = mock.Mock()
+        dom.isActive.return_value = True
+        hypervisor.set_domain_groups(dom, ['kubernetes_agent'])
+        dom.setMetadata.assert_called_once_with(
+            libvirt.VIR_DOMAIN_METADATA_ELEMENT,
+            '<groups name="kubernetes_agent" />',
+            'vl', 'groups',
+            libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_AFFECT_LIVE,
+        )
+
+
+class NetworkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = mock.Mock()
+        connect_patch = mock.patch.object(hypervisor, 'connect', return_value=self.conn)
+        connect_patch.start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _no_network(self, *args):
+        error = libvirt.libvirtError('no network')
+        error.get_error_code = mock.Mock(return_value=libvirt.VIR_ERR_NO_NETWORK)
+        raise error
+
+    def _network(self, name, cidr):
+        net = mock.Mock()
+        net.name.return_value = name
+        net.XMLDesc.return_value = "<network><ip address='{}' netmask='{}'/></network>".format(
+            cidr[1], cidr.netmask)
+        return net
+
+    def test_ensure_network_creates(self):
+        self.conn.networkLookupByName.side_effect = self._no_network
+        self.conn.listAllNetworks.return_value = [
+            self._network('default', ipaddress.ip_network('192.168.122.0/24'))]
+        hypervisor.ensure_network('qemu:///system', 'k93s-test', '10.93.4.0/24', mtu=9000)
+        root = ET.fromstring(self.conn.networkCreateXML.call_args[0][0])
+        self.assertEqual('k93s-test', root.find('./name').text)
+        self.assertEqual('k93s-test', root.find('./bridge').attrib['name'])
+        self.assertEqual({'address': '10.93.4.1', 'netmask': '255.255.255.0'},
+                         root.find('./ip').attrib)
+        self.assertEqual('9000', root.find('./mtu').attrib['size'])
+
+    def test_ensure_network_bridge(self):
+        self.conn.networkLookupByName.side_effect = self._no_network
+        hypervisor.ensure_network('qemu:///system', 'k93s-test', '10.93.4.0/24', bridge='br0')
+        root = ET.fromstring(self.conn.networkCreateXML.call_args[0][0])
+        self.assertEqual('bridge', root.find('./forward').attrib['mode'])
+        self.assertEqual('br0', root.find('./bridge').attrib['name'])
+        self.assertIsNone(root.find('./ip'))
+
+    def test_ensure_network_overlaps(self):
+        self.conn.networkLookupByName.side_effect = self._no_network
+        self.conn.listAllNetworks.return_value = [
+            self._network('other', ipaddress.ip_network('10.93.0.0/16'))]
+        with self.assertRaises(RuntimeError):
+            hypervisor.ensure_network('qemu:///system', 'k93s-test', '10.93.4.0/24')
+        self.conn.networkCreateXML.assert_not_called()
+
+    def test_ensure_network_exists_other_cidr(self):
+        self.conn.networkLookupByName.return_value = self._network(
+            'k93s-test', ipaddress.ip_network('10.93.5.0/24'))
+        with self.assertRaises(RuntimeError):
+            hypervisor.ensure_network('qemu:///system', 'k93s-test', '10.93.4.0/24')
+
+    def test_ensure_network_exists(self):
+        net = self._network('k93s-test', ipaddress.ip_network('10.93.4.0/24'))
+        self.conn.networkLookupByName.return_value = net
+        net.isActive.return_value = False
+        self.assertIs(net, hypervisor.ensure_network('qemu:///system', 'k93s-test',
+                                                     '10.93.4.0/24'))
+        net.create.assert_called_once_with()
+        self.conn.networkCreateXML.assert_not_called()
+
+    def test_ensure_network_exists_other_mtu(self):
+        net = self._network('k93s-test', ipaddress.ip_network('10.93.4.0/24'))
+        self.conn.networkLookupByName.return_value = net
+        with self.assertLogs(hypervisor.logger) as logs:
+            hypervisor.ensure_network('qemu:///system', 'k93s-test', '10.93.4.0/24', mtu=9000)
+        self.assertIn('rather than 9000', logs.output[0])
+        self.conn.networkCreateXML.assert_not_called()
+
+    def test_remove_network(self):
+        net = self.conn.networkLookupByName.return_value
+        net.isActive.return_value = True
+        net.isPersistent.return_value = False
+        hypervisor.remove_network('qemu:///system', 'k93s-test')
+        net.destroy.assert_called_once_with()
+        net.undefine.assert_not_called()
+
+    def test_remove_network_missing(self):
+        self.conn.networkLookupByName.side_effect = self._no_network
+        hypervisor.remove_network('qemu:///system', 'k93s-test')
+
+
+class DomainStatsTest(unittest.TestCase):
+
+    @mock.patch.object(hypervisor, 'connect')
+    def test_domain_stats(self, connect_patched):
+        wanted, other = mock.Mock(), mock.Mock()
+        wanted.name.return_value = 'testcluster-master-1'
+        wanted.UUIDString.return_value = '3f1c6d2e-0c36-4c1b-9a4e-6a0d1b2c3d4e'
+        other.name.return_value = 'unrelated'
+        connect_patched.return_value.getAllDomainStats.return_value = [
+            (wanted, {'state.state': libvirt.VIR_DOMAIN_RUNNING, 'vcpu.current': 2,
+                      'cpu.time': 1500000000, 'balloon.current': 524288,
+                      'balloon.rss': 262144}),
+            (other, {'state.state': libvirt.VIR_DOMAIN_RUNNING}),
+        ]
+        self.assertEqual(
+            {'testcluster-master-1': {'uuid': '3f1c6d2e-0c36-4c1b-9a4e-6a0d1b2c3d4e',
+                                      'state': 'running', 'vcpus': 2, 'cpu_time': 1.5,
+                                      'memory': 512, 'rss': 256}},
+            hypervisor.domain_stats('qemu:///system',
+                                    ['testcluster-master-1', 'testcluster-agent-1']))
+        connect_patched.assert_called_once_with('qemu:///system', read_only=True)
+
+    @mock.patch.object(hypervisor, 'connect')
+    def test_domain_stats_devices(self, connect_patched):
+        dom = mock.Mock()
+        dom.name.return_value = 'testcluster-master-1'
+        connect_patched.return_value.getAllDomainStats.return_value = [
+            (dom, {'state.state': libvirt.VIR_DOMAIN_RUNNING, 'balloon.current': 524288,
+                   'balloon.rss': 262144, 'block.count': 1, 'block.0.name': 'vda',
+                   'block.0.rd.bytes': 4096, 'block.0.wr.bytes': 8192, 'block.0.rd.reqs': 1,
+                   'block.0.wr.reqs': 2, 'net.count': 1, 'net.0.name': 'vnet0',
+                   'net.0.rx.bytes': 100, 'net.0.tx.bytes': 200, 'net.0.rx.pkts': 3,
+                   'net.0.tx.pkts': 4, 'net.0.rx.drop': 5, 'net.0.tx.drop': 6}),
+        ]
+        stats = hypervisor.domain_stats('qemu:///system', ['testcluster-master-1'],
+                                        devices=True)['testcluster-master-1']
+        flags = connect_patched.return_value.getAllDomainStats.call_args[0][0]
+        self.assertTrue(flags & libvirt.VIR_DOMAIN_STATS_BLOCK)
+        self.assertEqual(536870912, stats['balloon_bytes'])
+        self.assertEqual(268435456, stats['rss_bytes'])
+        self.assertEqual([{'name': 'vda', 'read_bytes': 4096, 'write_bytes': 8192,
+                           'read_requests': 1, 'write_requests': 2}], stats['disks'])
+        self.assertEqual([{'name': 'vnet0', 'rx_bytes': 100, 'tx_bytes': 200, 'rx_packets': 3,
+                           'tx_packets': 4, 'rx_drops': 5, 'tx_drops': 6}], stats['nics'])
+
+    @mock.patch.object(hypervisor, 'connect')
+    def test_domain_stats_suspended(self, connect_patched):
+        dom = mock.Mock()
+        dom.name.return_value = 'testcluster-master-1'
+        dom.hasManagedSaveImage.return_value = 1
+        connect_patched.return_value.getAllDomainStats.return_value = [
+            (dom, {'state.state': libvirt.VIR_DOMAIN_SHUTOFF}),
+        ]
+        self.assertEqual('suspended', hypervisor.domain_stats(
+            'qemu:///system', ['testcluster-master-1'])['testcluster-master-1']['state'])
+
+    @mock.patch.object(hypervisor, 'connect')
+    def test_host_domains(self, connect_patched):
+        running, stopped = mock.Mock(), mock.Mock()
+        running.name.return_value, stopped.name.return_value = 'running', 'stopped'
+        running.info.return_value = [libvirt.VIR_DOMAIN_RUNNING, 1048576, 1048576, 2, 0]
+        stopped.info.return_value = [libvirt.VIR_DOMAIN_SHUTOFF, 524288, 0, 1, 0]
+        connect_patched.return_value.listAllDomains.return_value = [running, stopped]
+        self.assertEqual([('running', 2, 1024, True), ('stopped', 1, 512, False)],
+                         hypervisor.host_domains('qemu:///system'))
+
+
+class SaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dom = mock.Mock()
+
+    def test_save(self):
+        self.dom.isActive.return_value = True
+        hypervisor.save_domain(self.dom)
+        self.dom.managedSave.assert_called_once_with(libvirt.VIR_DOMAIN_SAVE_RUNNING)
+
+    def test_save_stopped(self):
+        self.dom.isActive.return_value = False
+        hypervisor.save_domain(self.dom)
+        self.dom.managedSave.assert_not_called()
+
+    def test_restore(self):
+        self.dom.isActive.return_value = False
+        hypervisor.restore_domain(self.dom)
+        self.dom.create.assert_called_once_with()
+
+    def test_restore_running(self):
+        self.dom.isActive.return_value = True
+        hypervisor.restore_domain(self.dom)
+        self.dom.create.assert_not_called()
+
+    def test_has_snapshot(self):
+        self.assertTrue(hypervisor.has_snapshot(self.dom, 'clean'))
+        self.dom.snapshotLookupByName.assert_called_once_with('clean')
+
+    def test_has_snapshot_missing(self):
+        error = libvirt.libvirtError('no snapshot')
+        error.get_error_code = mock.Mock(return_value=libvirt.VIR_ERR_NO_DOMAIN_SNAPSHOT)
+        self.dom.snapshotLookupByName.side_effect = error
+        self.assertFalse(hypervisor.has_snapshot(self.dom, 'clean'))
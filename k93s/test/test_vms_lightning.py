@@ -1,10 +1,16 @@
+import ipaddress
 import os
 import shutil
 import unittest
 from unittest import mock
 
+import k93s.network
+import k93s.utils
+import k93s.vms.gc
+import k93s.vms.hypervisor
 import k93s.vms.ivms
 import k93s.vms.lightning
+import k93s.vms.numa
 from k93s.network import _state as network_state
 from virt_lightning import configuration, shell
 
@@ -51,6 +57,77 @@ class LightningVMTest(unittest.TestCase):
     def test_vm_str(self):
         self.assertEqual('<LightningVM: hello>', str(self.vm))
 
+    @mock.patch.object(k93s.vms.hypervisor, 'apply_cpu_placement')
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain')
+    @mock.patch.object(shell, 'up')
+    def test_lightning_vm_up_pinned(self, up_patched, lookup_patched, apply_patched):
+        placement = {'vcpupin': [[1]], 'emulatorpin': [1], 'numa_node': 0}
+        vm = k93s.vms.lightning.LightningVM(
+            'hello', True, self.lvl_config, **{'cpu_placement': placement})
+        vm.up()
+        lookup_patched.assert_called_once_with(self.lvl_config.libvirt_uri, 'hello')
+        apply_patched.assert_called_once_with(lookup_patched.return_value, placement)
+
+    @mock.patch.object(k93s.vms.hypervisor, 'set_domain_groups')
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_groups', return_value=['kubernetes_standby'])
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain')
+    @mock.patch.object(shell, 'up')
+    def test_lightning_vm_up_claim(self, up_patched, lookup_patched, groups_patched,
+                                   set_groups_patched):
+        vm = k93s.vms.lightning.LightningVM(
+            'hello', False, self.lvl_config, **{'groups': ['kubernetes_agent']})
+        vm.up()
+        set_groups_patched.assert_called_once_with(lookup_patched.return_value,
+                                                   ['kubernetes_agent'])
+
+    @mock.patch.object(k93s.vms.hypervisor, 'set_domain_groups')
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_groups', return_value=['kubernetes_agent'])
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain')
+    @mock.patch.object(shell, 'up')
+    def test_lightning_vm_up_already_claimed(self, up_patched, lookup_patched, groups_patched,
+                                             set_groups_patched):
+        vm = k93s.vms.lightning.LightningVM(
+            'hello', False, self.lvl_config, **{'groups': ['kubernetes_agent']})
+        vm.up()
+        set_groups_patched.assert_not_called()
+
+    def test_lightning_vm_standby_type(self):
+        vm = k93s.vms.lightning.LightningVM('hello', False, self.lvl_config, is_standby=True)
+        self.assertEqual(k93s.vms.ivms.KubernetesVMType.STANDBY, vm.vm_type)
+
+    @mock.patch.object(k93s.vms.hypervisor, 'save_domain')
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain', return_value=None)
+    def test_lightning_vm_missing_domain(self, lookup_patched, save_patched):
+        vm = k93s.vms.lightning.LightningVM('hello', False, self.lvl_config, is_standby=True)
+        self.assertFalse(vm.save())
+        self.assertFalse(vm.restore())
+        vm.pause()
+        vm.snapshot('clean')
+        save_patched.assert_not_called()
+
+    @mock.patch.object(k93s.vms.lightning.LightningVM, 'claim', mock.Mock())
+    @mock.patch.object(k93s.utils, 'wait_for_ssh')
+    @mock.patch.object(k93s.vms.hypervisor, 'restart_domain')
+    @mock.patch.object(k93s.vms.hypervisor, 'apply_nic_tuning', return_value=True)
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain')
+    @mock.patch.object(shell, 'up')
+    def test_lightning_vm_up_nic_tuning(self, up_patched, lookup_patched, nic_patched,
+                                        restart_patched, wait_patched):
+        nic_tuning = {'network_name': 'virt-lightning', 'queues': 2, 'vhost': True, 'mtu': None}
+        vm = k93s.vms.lightning.LightningVM(
+            'hello', False, self.lvl_config,
+            **{'nic_tuning': nic_tuning, 'networks': [{'ipv4': '192.168.123.111'}]})
+        vm.up()
+        nic_patched.assert_called_once_with(lookup_patched.return_value, **nic_tuning)
+        restart_patched.assert_called_once_with(lookup_patched.return_value)
+        wait_patched.assert_called_once_with('192.168.123.111')
+
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain')
+    @mock.patch.object(shell, 'up')
+    def test_lightning_vm_up_not_pinned(self, up_patched, lookup_patched):
+        self.vm.up()
+        lookup_patched.assert_not_called()
+
 
 class LightningVMNodesTest(unittest.TestCase):
 
@@ -62,7 +139,7 @@ class LightningVMNodesTest(unittest.TestCase):
                 'memory': 512,
                 'root_disk_size': 10,
                 'root_password': '!hellomaster',
-                'vcpus': 0.5,
+                'vcpus': 1,
                 'count': 3,
             },
             'agents': {
@@ -70,7 +147,7 @@ class LightningVMNodesTest(unittest.TestCase):
                 'memory': 512,
                 'root_disk_size': 10,
                 'root_password': '!helloagent',
-                'vcpus': 0.5,
+                'vcpus': 1,
                 'count': 3,
             },
             'name': 'testcluster',
@@ -116,9 +193,9 @@ class LightningVMNodesTest(unittest.TestCase):
                             "network": "virt-lightning"
                         }
                     ],
-                    "password": "root",
+                    "root_password": "root",
                     "root_disk_size": 10,
-                    "vcpus": 0
+                    "vcpus": 1
                 },
                 "testcluster-agent-2": {
                     "distro": "centos-8",
@@ -133,9 +210,9 @@ class LightningVMNodesTest(unittest.TestCase):
                             "network": "virt-lightning"
                         }
                     ],
-                    "password": "root",
+                    "root_password": "root",
                     "root_disk_size": 10,
-                    "vcpus": 0
+                    "vcpus": 1
                 },
                 "testcluster-agent-3": {
                     "distro": "centos-8",
@@ -150,9 +227,9 @@ class LightningVMNodesTest(unittest.TestCase):
                             "network": "virt-lightning"
                         }
                     ],
-                    "password": "root",
+                    "root_password": "root",
                     "root_disk_size": 10,
-                    "vcpus": 0
+                    "vcpus": 1
                 },
                 "testcluster-master-1": {
                     "distro": "centos-8",
@@ -169,7 +246,7 @@ class LightningVMNodesTest(unittest.TestCase):
                     ],
                     "root_disk_size": 10,
                     "root_password": "root",
-                    "vcpus": 0
+                    "vcpus": 1
                 },
                 "testcluster-master-2": {
                     "distro": "centos-8",
@@ -186,7 +263,7 @@ class LightningVMNodesTest(unittest.TestCase):
                     ],
                     "root_disk_size": 10,
                     "root_password": "root",
-                    "vcpus": 0
+                    "vcpus": 1
                 },
                 "testcluster-master-3": {
                     "distro": "centos-8",
@@ -203,7 +280,7 @@ class LightningVMNodesTest(unittest.TestCase):
                     ],
                     "root_disk_size": 10,
                     "root_password": "root",
-                    "vcpus": 0
+                    "vcpus": 1
                 }
             },
             self.vms.vms,
@@ -211,6 +288,382 @@ class LightningVMNodesTest(unittest.TestCase):
 
         self.assertSetEqual({'centos-8'}, self.vms.distros)
 
+    @mock.patch.object(k93s.vms.hypervisor, 'host_topology')
+    def test_lightning_compute_vms_configuration_pinned(self, topology_patched):
+        topology_patched.return_value = k93s.vms.numa.HostTopology({
+            0: [(0,), (1,), (2,), (3,)],
+            1: [(4,), (5,), (6,), (7,)],
+        })
+        self.fs_config_contents['vms_backend_config']['cpu_pinning'] = 'yes'
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+        topology_patched.assert_not_called()
+        self.vms._place()
+
+        masters = [vm.config['cpu_placement'] for vm in vms[0:3]]
+        self.assertEqual([[[0]], [[4]], [[1]]], [p['vcpupin'] for p in masters])
+        agents = [vm.config['cpu_placement'] for vm in vms[3:6]]
+        self.assertEqual([0, 1, 0], [p['numa_node'] for p in agents])
+        self.assertEqual([2, 3], agents[0]['emulatorpin'])
+        self.assertEqual(agents[0], self.vms.vms['testcluster-agent-1']['cpu_placement'])
+
+    def test_lightning_compute_vms_configuration_isolated_network(self):
+        self.fs_config_contents['vms_backend_config']['isolated_network'] = True
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+
+        cidr = k93s.network.cluster_cidr('testcluster')
+        self.assertEqual(cidr, self.vms.lightning_config.network_cidr)
+        self.assertEqual('k93s-8b2f8939', self.vms.lightning_config.network_name)
+        for vm in vms:
+            self.assertEqual('k93s-8b2f8939', vm.config['networks'][0]['network'])
+            self.assertEqual('k93s-8b2f8939', vm.lvl_config.network_name)
+        self.assertEqual(
+            str(ipaddress.ip_network(cidr)[11]),
+            self.vms.vms['testcluster-master-1']['networks'][0]['ipv4'],
+        )
+
+    def test_cluster_network_name(self):
+        names = {k93s.network.cluster_network_name(name)
+                 for name in ('testcluster1', 'testcluster2', 'testcluster-long-name')}
+        self.assertEqual(3, len(names))
+        self.assertEqual({13}, {len(name) for name in names})
+
+    def test_lightning_compute_vms_configuration_network_name_too_long(self):
+        self.fs_config_contents['vms_backend_config']['network_name'] = 'k93s-longclustername'
+        with self.assertRaises(RuntimeError):
+            self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+
+    def test_lightning_compute_vms_configuration_nic_tuning(self):
+        self.fs_config_contents['agents']['vcpus'] = 4
+        self.fs_config_contents['vms_backend_config'].update(
+            {'nic_queues': 'auto', 'vhost_net': 'yes', 'mtu': 9000})
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+        self.assertDictEqual(
+            {'network_name': 'virt-lightning', 'queues': 4, 'vhost': True, 'mtu': 9000},
+            vms[3].config['nic_tuning'],
+        )
+        self.assertEqual(vms[3].config['nic_tuning'],
+                         self.vms.vms['testcluster-agent-1']['nic_tuning'])
+
+    @mock.patch.object(k93s.vms.hypervisor, 'remove_network')
+    @mock.patch.object(k93s.vms.hypervisor, 'ensure_network')
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    def test_lightning_own_network(self, invoke_patched, ensure_patched, remove_patched):
+        self.fs_config_contents['vms_backend_config'].update(
+            {'isolated_network': True, 'network_cidr': '10.0.0.0/24', 'mtu': 9000})
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.vms.spinup(vms)
+        ensure_patched.assert_called_once_with('qemu:///system', 'k93s-8b2f8939', '10.0.0.0/24',
+                                               mtu=9000, bridge=None)
+        self.vms.teardown(vms)
+        remove_patched.assert_called_once_with('qemu:///system', 'k93s-8b2f8939')
+
+    @mock.patch.object(k93s.vms.hypervisor, 'remove_network')
+    @mock.patch.object(k93s.vms.hypervisor, 'ensure_network')
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    def test_lightning_configured_network(self, invoke_patched, ensure_patched, remove_patched):
+        self.fs_config_contents['vms_backend_config'].update(
+            {'network_name': 'default', 'network_cidr': '192.168.122.0/24'})
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.vms.spinup(vms)
+        ensure_patched.assert_called_once_with('qemu:///system', 'default', '192.168.122.0/24',
+                                               mtu=None, bridge=None)
+        self.vms.teardown(vms)
+        # Network k93s did not name after the cluster is left alone
+        remove_patched.assert_not_called()
+
+    @mock.patch.object(k93s.vms.hypervisor, 'remove_network')
+    @mock.patch.object(k93s.vms.hypervisor, 'ensure_network')
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    def test_lightning_shared_network(self, invoke_patched, ensure_patched, remove_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.vms.spinup(vms)
+        self.vms.teardown(vms)
+        ensure_patched.assert_not_called()
+        remove_patched.assert_not_called()
+
+    def _configure_hosts(self):
+        self.fs_config_contents['vms_backend_config'].update({
+            'network_bridge': 'br0',
+            'network_cidr': '10.0.0.0/24',
+            'hosts': [{'uri': 'qemu+ssh://box1/system', 'vcpus': 8, 'memory': 4096},
+                      'qemu+ssh://box2/system'],
+        })
+
+    @mock.patch.object(k93s.vms.hypervisor, 'host_domains', return_value=[])
+    @mock.patch.object(k93s.vms.hypervisor, 'host_capacity', return_value=(2, 8192))
+    def test_lightning_compute_vms_configuration_hosts(self, capacity_patched, domains_patched):
+        self._configure_hosts()
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+        # Hosts are not connected to, until an action needs placement of VMs
+        capacity_patched.assert_not_called()
+        self.vms._place()
+
+        capacity_patched.assert_called_once_with('qemu+ssh://box2/system')
+        uris = [vm.lvl_config.libvirt_uri for vm in vms]
+        self.assertEqual(['qemu+ssh://box1/system', 'qemu+ssh://box2/system',
+                          'qemu+ssh://box1/system'], uris[0:3])
+        self.assertEqual(uris, [self.vms.vms[vm.name]['libvirt_uri'] for vm in vms])
+        self.assertEqual('k93s-8b2f8939', vms[0].config['networks'][0]['network'])
+
+    @mock.patch.object(k93s.vms.hypervisor, 'host_capacity', return_value=(2, 8192))
+    def test_lightning_compute_vms_configuration_hosts_existing(self, capacity_patched):
+        self._configure_hosts()
+        domains = {
+            # Other VMs take all memory of box1
+            'qemu+ssh://box1/system': [('other', 2, 4096, True), ('stopped', 2, 4096, False)],
+            'qemu+ssh://box2/system': [('testcluster-master-1', 1, 512, True)],
+        }
+        with mock.patch.object(k93s.vms.hypervisor, 'host_domains',
+                               side_effect=lambda uri: domains[uri]):
+            vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+            self.vms._place()
+        self.assertEqual({'qemu+ssh://box2/system'}, {vm.lvl_config.libvirt_uri for vm in vms})
+
+    def test_lightning_bridged_network_gateway(self):
+        self._configure_hosts()
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+        self.assertEqual({'10.0.0.1/24'}, {vm.config['network_gateway'] for vm in vms})
+        hypervisor_class = k93s.vms.lightning.vl.LibvirtHypervisor
+        with k93s.vms.lightning._lightning_hypervisor(vms[0].config):
+            hv = k93s.vms.lightning.vl.LibvirtHypervisor(mock.Mock())
+        # Other hypervisors of virt-lightning are left alone
+        self.assertIs(hypervisor_class, k93s.vms.lightning.vl.LibvirtHypervisor)
+        hv.init_network('k93s-8b2f8939', '10.0.0.0/24')
+        self.assertEqual(ipaddress.IPv4Interface('10.0.0.1/24'), hv.gateway)
+        hv.conn.networkLookupByName.return_value.XMLDesc.assert_not_called()
+        # Bridged networks have no DHCP and DNS entries of VMs
+        hv.remove_domain_from_network(mock.Mock())
+        hv.conn.networkLookupByName.return_value.update.assert_not_called()
+
+    def test_lightning_shared_network_hypervisor(self):
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+        self.assertNotIn('network_gateway', vms[0].config)
+        hypervisor_class = k93s.vms.lightning.vl.LibvirtHypervisor
+        with k93s.vms.lightning._lightning_hypervisor(vms[0].config):
+            self.assertIs(hypervisor_class, k93s.vms.lightning.vl.LibvirtHypervisor)
+
+    @mock.patch.object(k93s.vms.lightning, 'local_address', return_value='10.0.0.7')
+    @mock.patch.object(k93s.vms.hypervisor, 'connect')
+    def test_lightning_bridged_inventory_host_address(self, connect_patched,
+                                                      local_address_patched):
+        self._configure_hosts()
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+        inventory = self.vms.inventory(vms)
+        connect_patched.assert_not_called()
+        # Gateway of a bridged network is the LAN router, not this host
+        local_address_patched.assert_called_once_with('10.0.0.1')
+        self.assertEqual({'10.0.0.7'},
+                         {hostvars['k93s_gateway'] for hostvars in inventory.hosts.values()})
+
+    def test_lightning_compute_vms_configuration_hosts_no_bridge(self):
+        self._configure_hosts()
+        del self.fs_config_contents['vms_backend_config']['network_bridge']
+        with self.assertRaises(RuntimeError):
+            self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats', return_value={})
+    @mock.patch.object(k93s.vms.hypervisor, 'remove_network')
+    @mock.patch.object(k93s.vms.hypervisor, 'ensure_network')
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    @mock.patch.object(k93s.vms.hypervisor, 'host_domains', return_value=[])
+    @mock.patch.object(k93s.vms.hypervisor, 'host_capacity', return_value=(2, 8192))
+    def test_lightning_hosts_spinup(self, capacity_patched, domains_patched, invoke_patched,
+                                    ensure_patched, remove_patched, stats_patched):
+        self._configure_hosts()
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.vms.spinup(vms)
+        self.assertCountEqual([mock.call('qemu+ssh://box1/system', 'k93s-8b2f8939',
+                                         '10.0.0.0/24', mtu=None, bridge='br0'),
+                               mock.call('qemu+ssh://box2/system', 'k93s-8b2f8939',
+                                         '10.0.0.0/24', mtu=None, bridge='br0')],
+                              ensure_patched.call_args_list)
+        self.assertEqual(2, invoke_patched.call_count)
+        self.assertCountEqual(vms, [vm for c in invoke_patched.call_args_list for vm in c[0][0]])
+
+        rows = self.vms.stats(vms)
+        self.assertEqual(2, stats_patched.call_count)
+        self.assertEqual([vm.name for vm in vms], [row['name'] for row in rows])
+
+    def _record_calls(self, vms):
+        calls = []
+        for vm in vms:
+            for action in ('pause', 'resume', 'snapshot', 'revert', 'save', 'restore'):
+                setattr(vm, action, mock.Mock(
+                    side_effect=lambda *args, _vm=vm, _action=action:
+                    calls.append((_action, _vm.name) + args)))
+        return calls
+
+    def test_lightning_snapshot(self):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        calls = self._record_calls(vms)
+        self.vms.snapshot(vms, 'clean')
+
+        self.assertEqual([('pause', vm.name) for vm in vms], calls[0:6])
+        self.assertCountEqual([('snapshot', vm.name, 'clean') for vm in vms], calls[6:12])
+        self.assertCountEqual([('resume', vm.name) for vm in vms[0:3]], calls[12:15])
+        self.assertCountEqual([('resume', vm.name) for vm in vms[3:6]], calls[15:18])
+
+    def test_lightning_snapshot_failed_resumes(self):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        calls = self._record_calls(vms)
+        vms[4].snapshot.side_effect = RuntimeError('no space left')
+        with self.assertRaises(RuntimeError):
+            self.vms.snapshot(vms, 'clean')
+        self.assertCountEqual([('resume', vm.name) for vm in vms],
+                              [c for c in calls if c[0] == 'resume'])
+
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats')
+    def test_lightning_reset(self, stats_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        stats_patched.return_value = {vm.name: {'state': 'running'} for vm in vms}
+        calls = self._record_calls(vms)
+        for vm in vms:
+            vm.has_snapshot = mock.Mock(return_value=True)
+        self.vms.reset(vms, 'clean')
+
+        self.assertCountEqual([('revert', vm.name, 'clean') for vm in vms], calls[0:6])
+        self.assertCountEqual([('resume', vm.name) for vm in vms[0:3]], calls[6:9])
+        self.assertCountEqual([('resume', vm.name) for vm in vms[3:6]], calls[9:12])
+
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats')
+    def test_lightning_reset_missing_snapshot(self, stats_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        stats_patched.return_value = {vm.name: {'state': 'running'} for vm in vms}
+        calls = self._record_calls(vms)
+        for vm in vms:
+            vm.has_snapshot = mock.Mock(return_value=vm is not vms[4])
+        with self.assertRaisesRegex(RuntimeError, vms[4].name):
+            self.vms.reset(vms, 'clean')
+        self.assertEqual([], calls)
+
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats')
+    def test_lightning_reset_missing_standby(self, stats_patched):
+        self.fs_config_contents['agents']['warm_pool'] = 2
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        stats_patched.return_value = {vm.name: {'state': 'running'} for vm in vms[0:7]}
+        calls = self._record_calls(vms)
+        for vm in vms:
+            vm.has_snapshot = mock.Mock(return_value=vm is not vms[7])
+        self.vms.reset(vms, 'clean')
+        vms[7].has_snapshot.assert_not_called()
+        self.assertCountEqual([('revert', vm.name, 'clean') for vm in vms[0:7]],
+                              [c for c in calls if c[0] == 'revert'])
+
+    @mock.patch.object(k93s.vms.hypervisor, 'has_snapshot', return_value=True)
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain')
+    def test_lightning_vm_has_snapshot(self, lookup_patched, has_snapshot_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.assertTrue(vms[0].has_snapshot('clean'))
+        has_snapshot_patched.assert_called_once_with(lookup_patched.return_value, 'clean')
+        lookup_patched.return_value = None
+        self.assertFalse(vms[0].has_snapshot('clean'))
+
+    def test_lightning_suspend(self):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        calls = self._record_calls(vms)
+        self.vms.suspend(vms)
+        self.assertCountEqual([('save', vm.name) for vm in vms], calls)
+
+    @mock.patch.object(k93s.vms.hypervisor, 'save_domain')
+    @mock.patch.object(k93s.vms.hypervisor, 'lookup_domain')
+    def test_lightning_suspend_missing_standby(self, lookup_patched, save_patched):
+        self.fs_config_contents['agents']['warm_pool'] = 1
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        standby = [vm for vm in vms if vm.vm_type == k93s.vms.ivms.KubernetesVMType.STANDBY]
+        lookup_patched.side_effect = lambda uri, name: (
+            None if name == standby[0].name else mock.Mock(name=name))
+        self.vms.suspend(vms)
+        self.assertEqual(len(vms) - 1, save_patched.call_count)
+
+    def test_lightning_resume(self):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        calls = self._record_calls(vms)
+        self.vms.resume(vms)
+        self.assertCountEqual([('restore', vm.name) for vm in vms[0:3]], calls[0:3])
+        self.assertCountEqual([('restore', vm.name) for vm in vms[3:6]], calls[3:6])
+
+    @mock.patch.object(k93s.vms.gc, 'collect', return_value=[{'action': 'orphan'}])
+    def test_lightning_collect_garbage(self, collect_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.assertEqual([{'action': 'orphan'}], self.vms.collect_garbage(vms, 1024))
+        collect_patched.assert_called_once_with('qemu:///system', 'virt-lightning',
+                                                image_budget=1024, compact=False, dry_run=False)
+
+    def test_lightning_compute_vms_configuration_warm_pool(self):
+        self.fs_config_contents['agents']['warm_pool'] = 2
+        vms = self.vms.compute_vms_configuration('test', **self.fs_config_contents)
+
+        self.assertEqual(8, len(vms))
+        for vm in vms[3:6]:
+            self.assertEqual(k93s.vms.ivms.KubernetesVMType.AGENT, vm.vm_type)
+        for vm in vms[6:8]:
+            self.assertEqual(k93s.vms.ivms.KubernetesVMType.STANDBY, vm.vm_type)
+        self.assertEqual(['testcluster-agent-4', 'testcluster-agent-5'],
+                         [vm.name for vm in vms[6:8]])
+        self.assertEqual(['kubernetes_standby'], self.vms.vms['testcluster-agent-4']['groups'])
+        self.assertEqual('192.168.123.114',
+                         self.vms.vms['testcluster-agent-4']['networks'][0]['ipv4'])
+
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    def test_lightning_spinup_skips_standby(self, invoke_patched):
+        self.fs_config_contents['agents']['warm_pool'] = 2
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.vms.spinup(vms)
+        invoke_patched.assert_called_once_with(vms[0:6], 'up')
+
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats')
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    def test_lightning_fill_pool(self, invoke_patched, stats_patched):
+        self.fs_config_contents['agents']['warm_pool'] = 2
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        stats_patched.return_value = {vms[6].name: {'state': 'shutoff'}}
+        self.assertEqual(vms[7:8], self.vms.fill_pool(vms))
+        stats_patched.assert_called_once_with('qemu:///system', [vm.name for vm in vms[6:8]],
+                                              devices=False)
+        invoke_patched.assert_called_once_with(vms[7:8], 'up')
+
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats')
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    def test_lightning_fill_pool_full(self, invoke_patched, stats_patched):
+        self.fs_config_contents['agents']['warm_pool'] = 2
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        stats_patched.return_value = {vm.name: {'state': 'running'} for vm in vms[6:8]}
+        self.assertEqual([], self.vms.fill_pool(vms))
+        invoke_patched.assert_not_called()
+
+    @mock.patch.object(k93s.vms.lightning.LightningVMNodes, '_invoke_lightning')
+    def test_lightning_fill_pool_empty(self, invoke_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        self.assertEqual([], self.vms.fill_pool(vms))
+        invoke_patched.assert_not_called()
+
+    @mock.patch('getpass.getuser', return_value='user')
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats')
+    def test_lightning_stats(self, stats_patched, getuser_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        stats_patched.return_value = {'testcluster-master-1': {'state': 'running', 'vcpus': 1}}
+        rows = self.vms.stats(vms)
+
+        stats_patched.assert_called_once_with('qemu:///system', [vm.name for vm in vms],
+                                              devices=False)
+        self.assertEqual({'name': 'testcluster-master-1', 'role': 'master', 'state': 'running',
+                          'vcpus': 1, 'address': '192.168.123.11', 'user': 'user'}, rows[0])
+        self.assertEqual({'name': 'testcluster-agent-1', 'role': 'agent', 'state': 'missing',
+                          'address': '192.168.123.111', 'user': 'user'}, rows[3])
+
+    @mock.patch('getpass.getuser', return_value='user')
+    @mock.patch.object(k93s.vms.hypervisor, 'domain_stats')
+    def test_lightning_stats_devices(self, stats_patched, getuser_patched):
+        vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
+        stats_patched.return_value = {'testcluster-master-1': {'state': 'running', 'disks': []}}
+        rows = self.vms.stats(vms, True)
+
+        stats_patched.assert_called_once_with('qemu:///system', [vm.name for vm in vms],
+                                              devices=True)
+        self.assertEqual('qemu:///system', rows[0]['host'])
+        self.assertEqual([], rows[0]['disks'])
+        self.assertNotIn('host', rows[3])
+
     def test_lightning_down(self):
         vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
         with mock.patch('k93s.vms.lightning.LightningVM.down') as down_patched:
@@ -224,16 +677,39 @@ class LightningVMNodesTest(unittest.TestCase):
             self.vms.spinup(vms)
             self.assertEqual(6, up_patched.call_count)
 
+    @mock.patch.object(k93s.vms.lightning.metrics, 'inc')
+    @mock.patch.object(k93s.vms.hypervisor, 'pool_allocation', side_effect=[1000, 5000])
     @mock.patch.object(shell, 'fetch')
     @mock.patch.object(shell, 'distro_list', side_effect=CommandSideEffect('[]'))
-    def test_lightning_up_fetch(self, distro_list_patched, fetch_patched):
+    def test_lightning_up_fetch(self, distro_list_patched, fetch_patched, allocation_patched,
+                                inc_patched):
         vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
         with mock.patch('k93s.vms.lightning.LightningVM.up'):
             self.vms.spinup(vms)
             fetch_patched.assert_called_once_with(self.vms.lightning_config, distro='centos-8')
+        allocation_patched.assert_called_with('qemu:///system', 'virt-lightning')
+        inc_patched.assert_called_once_with('k93s_image_fetch_bytes_total', 4000,
+                                            distro='centos-8')
 
-    @mock.patch.object(shell, 'ansible_inventory', side_effect=CommandSideEffect('hello inventory'))
-    def test_inventory(self, ansible_inventory_patched):
+    @mock.patch('getpass.getuser', return_value='user')
+    @mock.patch.object(shell, 'ansible_inventory')
+    def test_inventory(self, ansible_inventory_patched, getuser_patched):
+        self.fs_config_contents['agents']['python_interpreter'] = '/usr/libexec/platform-python'
+        self.fs_config_contents['agents']['warm_pool'] = 1
         vms = self.vms.compute_vms_configuration('k93s/test/_temp', **self.fs_config_contents)
         inventory = self.vms.inventory(vms)
-        self.assertEqual(inventory, 'hello inventory\n')
+
+        ansible_inventory_patched.assert_not_called()
+        self.assertEqual(['testcluster-master-1', 'testcluster-master-2', 'testcluster-master-3'],
+                         inventory.group_hosts('kubernetes_master'))
+        self.assertEqual(['testcluster-agent-4'], inventory.group_hosts('kubernetes_standby'))
+        self.assertEqual({
+            'ansible_host': '192.168.123.11',
+            'ansible_user': 'user',
+            'ansible_python_interpreter': '/usr/bin/python3',
+            'ansible_ssh_common_args': '-o UserKnownHostsFile=/dev/null '
+                                       '-o StrictHostKeyChecking=no',
+            'k93s_gateway': '192.168.123.1',
+        }, inventory.host('testcluster-master-1'))
+        self.assertEqual('/usr/libexec/platform-python',
+                         inventory.host('testcluster-agent-1')['ansible_python_interpreter'])
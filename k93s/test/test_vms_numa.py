@@ -0,0 +1,85 @@
+import unittest
+
+from k93s.vms import numa
+
+
+_CAPABILITIES = """
+<capabilities>
+  <host>
+    <topology>
+      <cells num='2'>
+        <cell id='0'>
+          <cpus num='4'>
+            <cpu id='0' socket_id='0' core_id='0' siblings='0,4'/>
+            <cpu id='1' socket_id='0' core_id='1' siblings='1,5'/>
+            <cpu id='4' socket_id='0' core_id='0' siblings='0,4'/>
+            <cpu id='5' socket_id='0' core_id='1' siblings='1,5'/>
+          </cpus>
+        </cell>
+        <cell id='1'>
+          <cpus num='4'>
+            <cpu id='2' socket_id='1' core_id='0' siblings='2,6'/>
+            <cpu id='3' socket_id='1' core_id='1' siblings='3,7'/>
+            <cpu id='6' socket_id='1' core_id='0' siblings='2,6'/>
+            <cpu id='7' socket_id='1' core_id='1' siblings='3,7'/>
+          </cpus>
+        </cell>
+      </cells>
+    </topology>
+  </host>
+</capabilities>
+"""
+
+
+class HostTopologyTest(unittest.TestCase):
+
+    def test_from_capabilities(self):
+        topology = numa.HostTopology.from_capabilities(_CAPABILITIES)
+        self.assertEqual({0: [(0, 4), (1, 5)], 1: [(2, 6), (3, 7)]}, dict(topology.cells))
+        self.assertEqual(8, topology.cpu_count)
+
+    def test_from_capabilities_no_topology(self):
+        with self.assertRaises(RuntimeError):
+            numa.HostTopology.from_capabilities('<capabilities><host/></capabilities>')
+
+    def test_format_cpuset(self):
+        self.assertEqual('0-3,8,10-11', numa.format_cpuset([10, 0, 1, 2, 3, 8, 11]))
+
+
+class PlaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.topology = numa.HostTopology.from_capabilities(_CAPABILITIES)
+
+    def test_place_master_dedicated_agents_spread(self):
+        placement = numa.place(self.topology, [
+            ('m1', 2, True),
+            ('a1', 1, False),
+            ('a2', 2, False),
+            ('a3', 1, False),
+        ])
+        self.assertEqual({'vcpupin': [[0], [4]], 'emulatorpin': [0, 4], 'numa_node': 0},
+                         placement['m1'])
+        self.assertEqual({'vcpupin': [[1, 5]], 'emulatorpin': [1, 5], 'numa_node': 0},
+                         placement['a1'])
+        self.assertEqual({'vcpupin': [[2, 3, 6, 7]] * 2, 'emulatorpin': [2, 3, 6, 7],
+                          'numa_node': 1},
+                         placement['a2'])
+        self.assertEqual(0, placement['a3']['numa_node'])
+
+    def test_place_masters_on_separate_cells(self):
+        placement = numa.place(self.topology, [('m1', 1, True), ('m2', 1, True)])
+        self.assertEqual(0, placement['m1']['numa_node'])
+        self.assertEqual(1, placement['m2']['numa_node'])
+
+    def test_place_reserved_cores(self):
+        placement = numa.place(self.topology, [('m1', 1, True)], reserved_cores=1)
+        self.assertEqual([[2]], placement['m1']['vcpupin'])
+
+    def test_place_master_too_large(self):
+        with self.assertRaises(RuntimeError):
+            numa.place(self.topology, [('m1', 6, True)])
+
+    def test_place_no_room_for_agents(self):
+        with self.assertRaises(RuntimeError):
+            numa.place(self.topology, [('m1', 4, True), ('m2', 4, True), ('a1', 1, False)])
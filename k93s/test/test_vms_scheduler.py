@@ -0,0 +1,71 @@
+import unittest
+
+from k93s.vms import scheduler
+
+
+_HOSTS = [
+    scheduler.Host('qemu:///box1', 8, 8192),
+    scheduler.Host('qemu:///box2', 8, 8192),
+]
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_hosts_from_config(self):
+        self.assertEqual(
+            [scheduler.Host('qemu:///box1', 16, 32768), scheduler.Host('qemu:///box2', None, None)],
+            scheduler.hosts_from_config([{'uri': 'qemu:///box1', 'vcpus': '16', 'memory': 32768},
+                                         'qemu:///box2']),
+        )
+
+    def test_hosts_from_config_invalid(self):
+        with self.assertRaises(RuntimeError):
+            scheduler.hosts_from_config([{'vcpus': 16}])
+        with self.assertRaises(RuntimeError):
+            scheduler.hosts_from_config(['qemu:///box1', 'qemu:///box1'])
+
+    def test_place_spread(self):
+        vms = [('master-1', 1, 1024, True)] + [('agent-%d' % i, 1, 1024, False)
+                                               for i in range(1, 5)]
+        placement = scheduler.place(_HOSTS, vms, 'spread')
+        self.assertEqual('qemu:///box1', placement['master-1'])
+        self.assertEqual(['qemu:///box2', 'qemu:///box1', 'qemu:///box2', 'qemu:///box1'],
+                         [placement['agent-%d' % i] for i in range(1, 5)])
+
+    def test_place_binpack(self):
+        vms = [('agent-%d' % i, 2, 2048, False) for i in range(1, 6)]
+        placement = scheduler.place(_HOSTS, vms, 'binpack')
+        self.assertEqual(['qemu:///box1'] * 4 + ['qemu:///box2'], list(placement.values()))
+
+    def test_place_masters_spread_with_binpack(self):
+        vms = [('master-1', 1, 512, True), ('master-2', 1, 512, True),
+               ('agent-1', 1, 512, False)]
+        placement = scheduler.place(_HOSTS, vms, 'binpack')
+        self.assertEqual(['qemu:///box1', 'qemu:///box2', 'qemu:///box1'],
+                         [placement['master-1'], placement['master-2'], placement['agent-1']])
+
+    def test_place_stable_when_growing(self):
+        vms = [('master-1', 1, 1024, True)] + [('agent-%d' % i, 1, 1024, False)
+                                               for i in range(1, 4)]
+        placement = scheduler.place(_HOSTS, vms)
+        grown = scheduler.place(_HOSTS, vms + [('agent-4', 1, 1024, False)])
+        self.assertEqual(placement, {k: v for k, v in grown.items() if k != 'agent-4'})
+
+    def test_place_existing_vms(self):
+        vms = [('master-1', 1, 1024, True), ('agent-1', 1, 1024, False),
+               ('agent-2', 1, 1024, False)]
+        placement = scheduler.place(_HOSTS, vms, used={'qemu:///box1': (0, 7168)},
+                                    pinned={'agent-1': 'qemu:///box1'})
+        self.assertEqual(['qemu:///box2', 'qemu:///box1', 'qemu:///box2'],
+                         list(placement.values()))
+        with self.assertRaises(RuntimeError):
+            scheduler.place(_HOSTS, [('agent-3', 1, 2048, False)],
+                            used={'qemu:///box1': (0, 8192), 'qemu:///box2': (0, 7168)})
+
+    def test_place_no_room(self):
+        with self.assertRaises(RuntimeError):
+            scheduler.place(_HOSTS, [('agent-1', 1, 16384, False)])
+
+    def test_place_unknown_policy(self):
+        with self.assertRaises(RuntimeError):
+            scheduler.place(_HOSTS, [], 'random')
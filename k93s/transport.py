@@ -0,0 +1,103 @@
+"""Lightweight command execution and file transfer on cluster nodes.
+
+Every node gets one multiplexed OpenSSH master connection, which is kept
+open between k93s invocations, so small operations do not pay for SSH
+handshake, let alone for starting Ansible.
+"""
+import collections
+import logging
+import os
+import shlex
+import subprocess
+
+
+logger = logging.getLogger(__name__)
+
+
+SSHHost = collections.namedtuple('SSHHost', ['name', 'address', 'user', 'ssh_args'])
+
+
+def host_from_inventory(inventory, name):
+    """Build SSH host description from Ansible inventory variables."""
+    hostvars = inventory.host(name)
+    return SSHHost(
+        name=name,
+        address=hostvars.get('ansible_host', name),
+        user=hostvars.get('ansible_user'),
+        ssh_args=tuple(shlex.split(hostvars.get('ansible_ssh_common_args', ''))),
+    )
+
+
+class SSHPool:
+    """Pool of SSH connections, one multiplexed master connection per node."""
+
+    def __init__(self, control_dir='~/.cache/k93s/ssh', persist='10m', connect_timeout=5):
+        self.control_dir = os.path.expanduser(control_dir)
+        self.persist = persist
+        self.connect_timeout = connect_timeout
+
+    @property
+    def control_path(self):
+        return os.path.join(self.control_dir, '%C')
+
+    def ssh_options(self):
+        """SSH options, which make any ssh client share pooled connections."""
+        return [
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPath={!s}'.format(self.control_path),
+            '-o', 'ControlPersist={!s}'.format(self.persist),
+            '-o', 'ConnectTimeout={!s}'.format(self.connect_timeout),
+            '-o', 'BatchMode=yes',
+        ]
+
+    def _command(self, host, *args):
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        destination = host.address if not host.user else '{}@{}'.format(host.user, host.address)
+        return ['ssh'] + self.ssh_options() + list(host.ssh_args) + list(args) + [destination]
+
+    def run(self, host, command, stdin=None, timeout=None, check=True):
+        """Run shell command on given host.
+
+        :param host: Host to run command on.
+        :type host: SSHHost
+        :param command: Shell command.
+        :type command: str
+        :param stdin: Bytes to pass to command input.
+        :type stdin: bytes
+        :param timeout: Seconds to wait for command to finish.
+        :type timeout: float
+        :param check: Whether to raise CalledProcessError on failure.
+        :type check: bool
+        :returns: Completed process with captured stdout and stderr.
+        :rtype: subprocess.CompletedProcess
+        """
+        logger.debug('Running on %s: %s', host.name, command)
+        return subprocess.run(self._command(host) + ['--', command],
+                              input=stdin if stdin is not None else b'',
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              timeout=timeout, check=check)
+
+    def fetch(self, host, path, sudo=False, timeout=None):
+        """Read contents of remote file."""
+        command = 'cat -- {!s}'.format(shlex.quote(path))
+        if sudo:
+            command = 'sudo -n ' + command
+        return self.run(host, command, timeout=timeout).stdout
+
+    def put(self, host, data, path, sudo=False, timeout=None):
+        """Write contents of remote file."""
+        command = 'cat > {!s}'.format(shlex.quote(path))
+        if sudo:
+            command = 'sudo -n sh -c {!s}'.format(shlex.quote(command))
+        self.run(host, command, stdin=data, timeout=timeout)
+
+    def close(self, host):
+        """Stop master connection of given host."""
+        subprocess.run(self._command(host, '-O', 'exit'),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+pool = SSHPool()
+
+
+__all__ = ['SSHHost', 'SSHPool', 'host_from_inventory', 'pool']
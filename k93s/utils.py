@@ -1,16 +1,27 @@
 """Utility functions and classes."""
+import concurrent.futures
+import contextlib
+import hashlib
+import json
 import logging
 import os.path
 import pydoc
 import shutil
+import socket
 import sys
+import time
 import yaml
 
 import k93s
+import k93s.metrics
+import k93s.schema
 
 
 logger = logging.getLogger(__name__)
 do_not_remove_after = int(os.environ.setdefault('K_93_NO_REMOVE', '1'))
+_config_cache_file_name = 'config.json'
+# libyaml bindings parse configs several times faster, when available
+_yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
 
 def subdict_except(d, *keys):
@@ -18,6 +29,13 @@ def subdict_except(d, *keys):
     return {k: v for k, v in d.items() if k not in keys}
 
 
+def as_bool(value):
+    """Interpret a config value, which may come as a string, as boolean."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'yes', 'true', 'on')
+    return bool(value)
+
+
 def ensure_config_file_location(config_file):
     """Given config_file cmdline argument,
        deduce absolute config file location."""
@@ -29,10 +47,48 @@ def ensure_config_file_location(config_file):
     return config_file
 
 
+def state_directory(config_file):
+    """Directory for persistent k93s state of a cluster, kept alongside its config."""
+    directory = ensure_config_file_location(config_file) + '.state'
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
 def read_config(config_file):
-    """Read config from given location into memory."""
-    with open(config_file, 'r') as fl:
-        return yaml.load(fl, Loader=yaml.FullLoader).get('k93s')
+    """Read config from given location into memory, validated and typed.
+
+    Compiled config is cached in state directory of the config, keyed by
+    modification time and hash of the file, so YAML is only parsed and
+    validated again after the file changes.
+
+    :raises RuntimeError: If config is invalid.
+    """
+    stat = os.stat(config_file)
+    cache_file = os.path.join(state_directory(config_file), _config_cache_file_name)
+    try:
+        with open(cache_file, 'r') as fl:
+            cache = json.load(fl)
+        if cache['version'] != k93s.schema.VERSION:
+            cache = {}
+    except (OSError, ValueError, KeyError):
+        cache = {}
+    if cache.get('mtime') == stat.st_mtime_ns and cache.get('size') == stat.st_size:
+        return cache['config']
+
+    with open(config_file, 'rb') as fl:
+        contents = fl.read()
+    digest = hashlib.sha256(contents).hexdigest()
+    if cache.get('sha256') == digest:
+        config = cache['config']
+    else:
+        data = yaml.load(contents, Loader=_yaml_loader) or {}
+        config = k93s.schema.compile_config(
+            data.get('k93s') if isinstance(data, dict) else None).to_dict()
+    with open(cache_file + '.tmp', 'w') as fl:
+        json.dump({'version': k93s.schema.VERSION, 'mtime': stat.st_mtime_ns,
+                   'size': stat.st_size, 'sha256': digest, 'config': config}, fl)
+    os.replace(cache_file + '.tmp', cache_file)
+    return config
 
 
 def find_vms_backend(fs_config_contents):
@@ -46,11 +102,28 @@ def find_vms_backend(fs_config_contents):
         return backend
 
 
-def vms_action(action_name, temporary_path, **configuration):
-    """Invoke given action on VMs backend within given temporary path.
+def parallel(func, items, max_workers=None):
+    """Call func for every item concurrently, in threads.
+
+    :returns: Results, in order of items. First raised exception is re-raised.
+    :rtype: list
+    """
+    items = list(items)
+    if not items:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(items)) as pool:
+        return list(pool.map(func, items))
 
-    :param action_name: An action name to execute. Should be "spinup" or "teardown"
-    :type action_name: str
+
+@contextlib.contextmanager
+def vms_session(temporary_path, **configuration):
+    """Compute VMs configuration once, and invoke several actions on it.
+
+    Yields a callable, which takes an action name and its extra arguments,
+    and returns the result of backend action. Its keyword argument `only`
+    restricts the action to VMs with given names, and `quiet` keeps
+    repeated actions out of the log. Durations of actions are recorded
+    in k93s metrics, unless `timed` is false.
 
     :param temporary_path: A temporary path to work in context of.
     :type temporary_path: str
@@ -63,15 +136,63 @@ def vms_action(action_name, temporary_path, **configuration):
         os.chdir(temporary_path)
         backend = k93s.utils.find_vms_backend(fs_config_contents)
         vms = backend.compute_vms_configuration(temporary_path, **fs_config_contents)
-        logger.warning('Going to invoke action %s on VMs : \n' + '%s\n' * len(vms),
-                       action_name, *vms)
-        return getattr(backend, action_name)(vms)
+
+        def invoke(action_name, *action_args, only=None, quiet=False, timed=True):
+            selected = vms if only is None else [vm for vm in vms if vm.name in only]
+            logger.log(logging.DEBUG if quiet else logging.WARNING,
+                       'Going to invoke action %s on VMs : \n' + '%s\n' * len(selected),
+                       action_name, *selected)
+            action = getattr(backend, action_name)
+            if not timed:
+                return action(selected, *action_args)
+            with k93s.metrics.timed(action_name):
+                return action(selected, *action_args)
+
+        yield invoke
     finally:
         if not do_not_remove_after:
             shutil.rmtree(temporary_path)  # pragma: no cover
         os.chdir(k93s.curdir)
 
 
+def vms_action(action_name, temporary_path, *action_args, **configuration):
+    """Invoke given action on VMs backend within given temporary path.
+
+    :param action_name: An action name to execute, e.g. "spinup" or "teardown"
+    :type action_name: str
+
+    :param temporary_path: A temporary path to work in context of.
+    :type temporary_path: str
+
+    :param action_args: Extra arguments for backend action.
+    :type action_args: tuple
+
+    :param configuration: A section 'k93s' of config file.
+    :type configuration: dict
+    """
+    with vms_session(temporary_path, **configuration) as invoke:
+        return invoke(action_name, *action_args)
+
+
+def wait_for_ssh(address, timeout=120, port=22):
+    """Wait until SSH server at given address sends its banner.
+
+    :returns: Whether SSH became reachable within timeout.
+    :rtype: bool
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((address, port), timeout=2) as sock:
+                if sock.recv(3) == b'SSH':
+                    return True
+        except OSError:
+            pass
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.5)
+
+
 class RedirectStdStreams(object):
     # tnx https://stackoverflow.com/a/6796752
     def __init__(self, stdout=None, stderr=None):
@@ -8,6 +8,15 @@ logger = logging.getLogger(__name__)
 spinup = functools.partial(k93s.utils.vms_action, 'spinup')
 teardown = functools.partial(k93s.utils.vms_action, 'teardown')
 inventory = functools.partial(k93s.utils.vms_action, 'inventory')
+stats = functools.partial(k93s.utils.vms_action, 'stats')
+fill_pool = functools.partial(k93s.utils.vms_action, 'fill_pool')
+snapshot = functools.partial(k93s.utils.vms_action, 'snapshot')
+reset = functools.partial(k93s.utils.vms_action, 'reset')
+suspend = functools.partial(k93s.utils.vms_action, 'suspend')
+resume = functools.partial(k93s.utils.vms_action, 'resume')
+collect_garbage = functools.partial(k93s.utils.vms_action, 'collect_garbage')
+session = k93s.utils.vms_session
 
 
-__all__ = ['spinup', 'teardown', 'inventory']
+__all__ = ['spinup', 'teardown', 'inventory', 'stats', 'fill_pool', 'snapshot', 'reset',
+           'suspend', 'resume', 'collect_garbage', 'session']
@@ -0,0 +1,263 @@
+"""Garbage collection of storage pools: orphaned volumes and stale distro images.
+
+Volumes are orphaned by failed spinups and teardowns. They are deleted,
+unless a domain uses them, directly or as a backing file, no matter
+whether k93s created the domain. Distro images are fetched by
+virt-lightning into the `upstream` directory of the pool on the local
+host. Images no VM is based on are evicted least recently used first,
+while they take more than the disk budget, and may be recompressed.
+"""
+import collections
+import glob
+import logging
+import os
+import shutil
+import subprocess
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+import libvirt
+
+from k93s import utils
+from k93s.vms import hypervisor
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds to leave new volumes and partial downloads alone, so spinups running meanwhile keep them
+MIN_AGE = 600
+_image_directory = 'upstream'
+
+Volume = collections.namedtuple('Volume', ['name', 'path', 'allocation', 'backing', 'created'])
+Image = collections.namedtuple('Image', ['path', 'size', 'last_used'])
+
+
+def _timestamp(root, name):
+    text = root.findtext('./target/timestamps/' + name)
+    return float(text) if text else 0.0
+
+
+def pool_volumes(pool):
+    """Read volumes of a storage pool, without directories, e.g. of distro images.
+
+    :returns: Pairs of libvirt volume and its :class:`Volume`.
+    :rtype: list
+    """
+    volumes = []
+    for vol in pool.listAllVolumes(0):
+        root = ET.fromstring(vol.XMLDesc(0))
+        if root.get('type') == 'dir':
+            continue
+        volumes.append((vol, Volume(
+            name=vol.name(),
+            path=root.findtext('./target/path'),
+            allocation=int(root.findtext('./allocation') or 0),
+            backing=root.findtext('./backingStore/path'),
+            created=max(_timestamp(root, 'ctime'), _timestamp(root, 'mtime')),
+        )))
+    return volumes
+
+
+def domain_disks(conn):
+    """Paths of disks of all domains defined on a host, running or not."""
+    paths = set()
+    sources = []
+    for dom in conn.listAllDomains(0):
+        # Disks of running domains may differ from their persistent definition
+        for flags in (0, libvirt.VIR_DOMAIN_XML_INACTIVE):
+            sources += [(dom, source) for source in
+                        ET.fromstring(dom.XMLDesc(flags)).findall('./devices/disk/source')]
+    for dom, source in sources:
+        if source.get('file') or source.get('dev'):
+            paths.add(source.get('file') or source.get('dev'))
+        elif source.get('pool') and source.get('volume'):
+            try:
+                pool = conn.storagePoolLookupByName(source.get('pool'))
+                paths.add(pool.storageVolLookupByName(source.get('volume')).path())
+            except libvirt.libvirtError:
+                logger.warning('Disk %s of %s is missing', source.get('volume'), dom.name())
+    return paths
+
+
+def used_paths(disks, volumes):
+    """Paths of disks and of all their backing files, which are pool volumes."""
+    backing = {volume.path: volume.backing for volume in volumes}
+    used = set()
+    pending = list(disks)
+    while pending:
+        path = pending.pop()
+        if path in used:
+            continue
+        used.add(path)
+        if backing.get(path):
+            pending.append(backing[path])
+    return used
+
+
+def distro_images(directory, volumes):
+    """Distro images in given directory, used when last read, modified or
+    taken as a backing file of a volume."""
+    images = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.qcow2'))):
+        stat = os.stat(path)
+        based = [volume.created for volume in volumes if volume.backing == path]
+        images.append(Image(path=path, size=stat.st_blocks * 512,
+                            last_used=max([stat.st_atime, stat.st_mtime] + based)))
+    return images
+
+
+def lru_evictions(images, used, budget):
+    """Pick images to remove, least recently used first, until the rest fit in budget.
+
+    :param images: Distro images.
+    :type images: list
+    :param used: Paths of images, which must be kept.
+    :type used: set
+    :param budget: Bytes all images may take, or None for no limit.
+    :type budget: int
+    :rtype: list
+    """
+    if budget is None:
+        return []
+    total = sum(image.size for image in images)
+    evicted = []
+    for image in sorted(images, key=lambda i: i.last_used):
+        if total <= budget:
+            break
+        if image.path not in used:
+            evicted.append(image)
+            total -= image.size
+    if total > budget:
+        logger.warning('Distro images in use take %d MiB, more than budget of %d MiB',
+                       total // 2 ** 20, budget // 2 ** 20)
+    return evicted
+
+
+def compact_image(path):
+    """Drop free guest blocks and zero clusters of an image, and compress it.
+
+    Cloud images are usually shipped compressed already, so the compacted
+    copy only replaces the image, if it is smaller.
+
+    :returns: Bytes saved.
+    :rtype: int
+    """
+    if shutil.which('virt-sparsify'):
+        # Zero blocks, which guest filesystems do not use, so conversion drops them
+        subprocess.run(['virt-sparsify', '--quiet', '--in-place', path], check=False)
+    compacted = path + '.compact'
+    try:
+        subprocess.check_call(['qemu-img', 'convert', '-c', '-O', 'qcow2', path, compacted])
+        saved = os.stat(path).st_blocks * 512 - os.stat(compacted).st_blocks * 512
+        if saved > 0:
+            os.replace(compacted, path)
+            return saved
+        return 0
+    finally:
+        if os.path.exists(compacted):
+            os.unlink(compacted)
+
+
+def _is_local(uri):
+    return urllib.parse.urlparse(uri).hostname in (None, '', 'localhost')
+
+
+def _row(uri, action, path, reclaimed):
+    return {'host': uri, 'action': action, 'name': os.path.basename(path), 'reclaimed': reclaimed}
+
+
+def _collect_images(uri, directory, volumes, used, budget, compact, dry_run, now):
+    report = []
+    for path in glob.glob(os.path.join(directory, '*.temp')):
+        stat = os.stat(path)
+        if now - stat.st_mtime > MIN_AGE:
+            report.append(_row(uri, 'partial', path, stat.st_blocks * 512))
+            if not dry_run:
+                os.unlink(path)
+
+    images = distro_images(directory, volumes)
+    evicted = lru_evictions(images, used, budget)
+    for image in evicted:
+        report.append(_row(uri, 'evict', image.path, image.size))
+        if not dry_run:
+            os.unlink(image.path)
+            # Settings of the distro, fetched along with the image
+            if os.path.exists(os.path.splitext(image.path)[0] + '.yaml'):
+                os.unlink(os.path.splitext(image.path)[0] + '.yaml')
+
+    if compact and not dry_run:
+        for image in images:
+            # Overlays of VMs refer to clusters of their backing image, which must stay as is
+            if image in evicted or image.path in used:
+                continue
+            saved = compact_image(image.path)
+            if saved:
+                report.append(_row(uri, 'compact', image.path, saved))
+    return report
+
+
+def collect(uri, pool_name, image_budget=None, compact=False, dry_run=False):
+    """Remove orphaned volumes and stale distro images of a host.
+
+    :param uri: Libvirt URI of the host.
+    :type uri: str
+    :param pool_name: Storage pool of VM disks.
+    :type pool_name: str
+    :param image_budget: MiB of disk distro images may take, or None for no limit.
+    :type image_budget: int
+    :param compact: Recompress distro images, which no VM is based on.
+    :type compact: bool
+    :param dry_run: Only report, what would be removed.
+    :type dry_run: bool
+    :returns: Report rows with keys 'host', 'action', 'name' and 'reclaimed' bytes.
+    :rtype: list
+    """
+    conn = hypervisor.connect(uri)
+    try:
+        pool = conn.storagePoolLookupByName(pool_name)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_STORAGE_POOL:
+            return []
+        raise
+    pool.refresh(0)
+    now = time.time()
+    volumes = pool_volumes(pool)
+    used = used_paths(domain_disks(conn), [volume for _, volume in volumes])
+
+    orphans = [(vol, volume) for vol, volume in volumes
+               if volume.path not in used and now - volume.created > MIN_AGE]
+    report = [_row(uri, 'orphan', volume.path, volume.allocation) for _, volume in orphans]
+    if orphans and not dry_run:
+        utils.parallel(lambda vol: vol.delete(0), [vol for vol, _ in orphans], max_workers=8)
+
+    directory = os.path.join(ET.fromstring(pool.XMLDesc(0)).findtext('./target/path') or '',
+                             _image_directory)
+    if not _is_local(uri):
+        logger.warning('Distro images of %s are only collected on the host itself', uri)
+    elif os.path.isdir(directory):
+        orphaned = {volume.path for _, volume in orphans}
+        kept = [volume for _, volume in volumes if volume.path not in orphaned]
+        report += _collect_images(
+            uri, directory, kept, used | {volume.backing for volume in kept},
+            image_budget * 2 ** 20 if image_budget is not None else None, compact, dry_run, now)
+    if not dry_run:
+        pool.refresh(0)
+    return report
+
+
+def format_report(rows, dry_run=False):
+    """Render garbage collection report as a plain text table, with a total."""
+    table = [['ACTION', 'HOST', 'NAME', 'RECLAIMED(MiB)']]
+    table.extend([row['action'], row['host'], row['name'],
+                  '{:.1f}'.format(row['reclaimed'] / 2 ** 20)] for row in rows)
+    widths = [max(len(line[i]) for line in table) for i in range(len(table[0]))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip()
+             for line in table]
+    lines.append('{} {:.1f} MiB'.format('Would reclaim' if dry_run else 'Reclaimed',
+                                        sum(row['reclaimed'] for row in rows) / 2 ** 20))
+    return '\n'.join(lines)
+
+
+__all__ = ['MIN_AGE', 'Volume', 'Image', 'pool_volumes', 'domain_disks', 'used_paths',
+           'distro_images', 'lru_evictions', 'compact_image', 'collect', 'format_report']
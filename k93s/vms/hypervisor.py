@@ -0,0 +1,418 @@
+"""Helpers for talking to libvirt directly, where virt-lightning has no API."""
+import ipaddress
+import logging
+import time
+import xml.etree.ElementTree as ET
+
+import libvirt
+from virt_lightning.templates import NETWORK_XML
+
+from k93s.vms import numa
+
+
+logger = logging.getLogger(__name__)
+_connections = {}
+_domain_states = {
+    libvirt.VIR_DOMAIN_NOSTATE: 'nostate',
+    libvirt.VIR_DOMAIN_RUNNING: 'running',
+    libvirt.VIR_DOMAIN_BLOCKED: 'blocked',
+    libvirt.VIR_DOMAIN_PAUSED: 'paused',
+    libvirt.VIR_DOMAIN_SHUTDOWN: 'shutdown',
+    libvirt.VIR_DOMAIN_SHUTOFF: 'shutoff',
+    libvirt.VIR_DOMAIN_CRASHED: 'crashed',
+    libvirt.VIR_DOMAIN_PMSUSPENDED: 'pmsuspended',
+}
+# Device counters of getAllDomainStats, by the names k93s gives them
+_block_stats = (('read_bytes', 'rd.bytes'), ('write_bytes', 'wr.bytes'),
+                ('read_requests', 'rd.reqs'), ('write_requests', 'wr.reqs'))
+_net_stats = (('rx_bytes', 'rx.bytes'), ('tx_bytes', 'tx.bytes'),
+              ('rx_packets', 'rx.pkts'), ('tx_packets', 'tx.pkts'),
+              ('rx_drops', 'rx.drop'), ('tx_drops', 'tx.drop'))
+
+
+def connect(uri, read_only=False):
+    """Open a libvirt connection to given URI, reusing it on later calls."""
+    key = (uri, read_only)
+    conn = _connections.get(key)
+    if conn is None or not conn.isAlive():
+        conn = libvirt.openReadOnly(uri) if read_only else libvirt.open(uri)
+        _connections[key] = conn
+    return conn
+
+
+def lookup_domain(uri, name):
+    """Find a domain by name, return None if it does not exist."""
+    try:
+        return connect(uri).lookupByName(name)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+            return None
+        raise
+
+
+def host_topology(uri):
+    """Read CPU topology of the host behind given URI."""
+    return numa.HostTopology.from_capabilities(connect(uri, read_only=True).getCapabilities())
+
+
+def _cpumap(cpus, host_cpus):
+    return tuple(i in cpus for i in range(host_cpus))
+
+
+def apply_cpu_placement(dom, placement):
+    """Pin vCPUs and emulator threads, and bind guest memory to a NUMA node.
+
+    Pinning is applied to both running and persistent domain definitions.
+
+    :param dom: A libvirt domain.
+    :param placement: A placement dictionary, as computed by :func:`numa.place`.
+    :type placement: dict
+    """
+    host_cpus = dom.connect().getCPUMap()[0]
+    flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+    if dom.isActive():
+        flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+
+    for vcpu, cpus in enumerate(placement['vcpupin']):
+        dom.pinVcpuFlags(vcpu, _cpumap(cpus, host_cpus), flags)
+    dom.pinEmulator(_cpumap(placement['emulatorpin'], host_cpus), flags)
+
+    nodeset = str(placement['numa_node'])
+    dom.setNumaParameters({
+        libvirt.VIR_DOMAIN_NUMA_NODESET: nodeset,
+        libvirt.VIR_DOMAIN_NUMA_MODE: libvirt.VIR_DOMAIN_NUMATUNE_MEM_STRICT,
+    }, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+    if dom.isActive():
+        try:
+            dom.setNumaParameters({libvirt.VIR_DOMAIN_NUMA_NODESET: nodeset},
+                                  libvirt.VIR_DOMAIN_AFFECT_LIVE)
+        except libvirt.libvirtError:
+            logger.warning('Memory of %s will be bound to NUMA node %s after reboot.',
+                           dom.name(), nodeset)
+
+    logger.warning('Pinned %s to CPUs %s on NUMA node %s', dom.name(),
+                   numa.format_cpuset(placement['emulatorpin']), nodeset)
+
+
+def host_capacity(uri):
+    """Read number of logical CPUs and memory size (MiB) of the host behind given URI."""
+    info = connect(uri, read_only=True).getInfo()
+    return info[2], info[1]
+
+
+def host_domains(uri):
+    """Read sizing of all domains defined on the host behind given URI.
+
+    :returns: Tuples of (name, vcpus, memory in MiB, whether it is running).
+    :rtype: list
+    """
+    domains = []
+    for dom in connect(uri, read_only=True).listAllDomains(0):
+        state, max_memory, _, vcpus, _ = dom.info()
+        domains.append((dom.name(), vcpus, max_memory // 1024,
+                        state not in (libvirt.VIR_DOMAIN_SHUTOFF, libvirt.VIR_DOMAIN_CRASHED)))
+    return domains
+
+
+def pool_allocation(uri, pool_name):
+    """Read bytes allocated in a storage pool, after a refresh of its volumes.
+
+    :returns: Allocated bytes, or None if the pool does not exist.
+    """
+    try:
+        pool = connect(uri).storagePoolLookupByName(pool_name)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_STORAGE_POOL:
+            return None
+        raise
+    pool.refresh(0)
+    return pool.info()[2]
+
+
+def _network_cidr(net):
+    """Addresses of given libvirt network, None for networks without them."""
+    ip = ET.fromstring(net.XMLDesc(0)).find('./ip')
+    if ip is None or not ip.get('address'):
+        return None
+    return ipaddress.ip_interface('{}/{}'.format(
+        ip.get('address'), ip.get('netmask') or ip.get('prefix', '24'))).network
+
+
+def _network_mtu(net):
+    """MTU of given libvirt network, None for the default one."""
+    element = ET.fromstring(net.XMLDesc(0)).find('./mtu')
+    return None if element is None else int(element.get('size'))
+
+
+def ensure_network(uri, name, cidr, mtu=None, bridge=None):
+    """Create a NAT network for the cluster, unless it already exists.
+
+    Networks are created the same way virt-lightning does it, so it
+    will pick them up, but may carry a custom MTU. With `bridge`, the
+    network rather attaches VMs to given existing host bridge, so VMs on
+    several hosts sharing its segment reach each other. Libvirt does not
+    take addresses of such networks, so the gateway of their VMs has to
+    be passed to virt-lightning apart from the network. MTU of a network,
+    which exists, is not changed, a differing one is warned about.
+
+    :raises RuntimeError: If the network exists with other addresses, or
+        its addresses overlap another network of the host.
+    """
+    conn = connect(uri)
+    network = ipaddress.ip_network(cidr)
+    try:
+        net = conn.networkLookupByName(name)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() != libvirt.VIR_ERR_NO_NETWORK:
+            raise
+    else:
+        existing = _network_cidr(net)
+        if not bridge and existing != network:
+            raise RuntimeError('Network {!s} on {!s} has addresses {!s}, rather than {!s}.'.format(
+                name, uri, existing, cidr))
+        if mtu and _network_mtu(net) != int(mtu):
+            logger.warning('Network %s on %s has MTU %s, rather than %s, remove it to apply '
+                           'the MTU.', name, uri, _network_mtu(net) or 'default', mtu)
+        if not net.isActive():
+            net.create()
+        return net
+
+    if bridge:
+        root = ET.Element('network')
+        ET.SubElement(root, 'name').text = name
+        ET.SubElement(root, 'forward').attrib['mode'] = 'bridge'
+        ET.SubElement(root, 'bridge').attrib['name'] = bridge
+        logger.warning('Creating network %s on bridge %s', name, bridge)
+        return conn.networkCreateXML(ET.tostring(root).decode())
+
+    for other in conn.listAllNetworks(0):
+        existing = _network_cidr(other)
+        if existing is not None and existing.overlaps(network):
+            raise RuntimeError('Addresses {!s} of network {!s} overlap network {!s} ({!s}) '
+                               'on {!s}, set network_cidr.'.format(
+                                   cidr, name, other.name(), existing, uri))
+
+    root = ET.fromstring(NETWORK_XML)
+    root.find('./name').text = name
+    root.find('./bridge').attrib['name'] = name
+    root.find('./ip').attrib = {
+        'address': network[1].exploded,
+        'netmask': network.netmask.exploded,
+    }
+    if mtu:
+        ET.SubElement(root, 'mtu').attrib['size'] = str(mtu)
+    logger.warning('Creating network %s (%s)', name, cidr)
+    return conn.networkCreateXML(ET.tostring(root).decode())
+
+
+def remove_network(uri, name):
+    """Destroy given network, if it exists."""
+    try:
+        net = connect(uri).networkLookupByName(name)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_NETWORK:
+            return
+        raise
+    logger.warning('Removing network %s', name)
+    if net.isActive():
+        net.destroy()
+    if net.isPersistent():
+        net.undefine()
+
+
+def apply_nic_tuning(dom, network_name, queues=None, vhost=False, mtu=None):
+    """Set multiqueue, vhost-net and MTU on domain NICs attached to given network.
+
+    Changes go to persistent domain definition only, and need a cold
+    restart of the domain to take effect.
+
+    :returns: Whether the definition has been changed.
+    :rtype: bool
+    """
+    root = ET.fromstring(dom.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+    changed = False
+    for iface in root.findall("./devices/interface[@type='network']"):
+        source = iface.find('./source')
+        if source is None or source.attrib.get('network') != network_name:
+            continue
+        wanted = {}
+        if vhost:
+            wanted['name'] = 'vhost'
+        if queues and int(queues) > 1:
+            wanted['queues'] = str(queues)
+        if wanted:
+            driver = iface.find('./driver')
+            if driver is None:
+                driver = ET.SubElement(iface, 'driver')
+            if any(driver.attrib.get(k) != v for k, v in wanted.items()):
+                driver.attrib.update(wanted)
+                changed = True
+        if mtu:
+            mtu_elem = iface.find('./mtu')
+            if mtu_elem is None:
+                mtu_elem = ET.SubElement(iface, 'mtu')
+            if mtu_elem.attrib.get('size') != str(mtu):
+                mtu_elem.attrib['size'] = str(mtu)
+                changed = True
+    if changed:
+        dom.connect().defineXML(ET.tostring(root).decode())
+    return changed
+
+
+def restart_domain(dom, timeout=60):
+    """Cold restart a domain, so its persistent definition is applied."""
+    if dom.isActive():
+        dom.shutdown()
+        deadline = time.monotonic() + timeout
+        while dom.isActive() and time.monotonic() < deadline:
+            time.sleep(0.5)
+        if dom.isActive():
+            logger.warning('%s did not shut down in %ss, forcing it off', dom.name(), timeout)
+            dom.destroy()
+    dom.create()
+
+
+def domain_groups(dom):
+    """Read Ansible groups of a domain, as recorded by virt-lightning."""
+    try:
+        xml = dom.metadata(libvirt.VIR_DOMAIN_METADATA_ELEMENT, 'groups')
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN_METADATA:
+            return []
+        raise
+    value = ET.fromstring(xml).attrib['name']
+    return value.split(',') if value else []
+
+
+def set_domain_groups(dom, groups):
+    """Record Ansible groups of a domain the way virt-lightning does it.
+
+    Unlike virt-lightning, live definition is updated too, so inventory
+    sees new groups without a domain restart.
+    """
+    flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+    if dom.isActive():
+        flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+    root = ET.Element('groups')
+    root.attrib['name'] = ','.join(groups)
+    dom.setMetadata(libvirt.VIR_DOMAIN_METADATA_ELEMENT, ET.tostring(root).decode(),
+                    'vl', 'groups', flags)
+
+
+def _device_stats(stats, kind, keys):
+    """Collect per-device counters of getAllDomainStats, e.g. block.0.rd.bytes."""
+    devices = []
+    for i in range(stats.get(kind + '.count', 0)):
+        prefix = '{}.{:d}.'.format(kind, i)
+        device = {'name': stats.get(prefix + 'name', str(i))}
+        device.update({key: stats.get(prefix + stat, 0) for key, stat in keys})
+        devices.append(device)
+    return devices
+
+
+def domain_stats(uri, names, devices=False):
+    """Read state, CPU and memory usage of given domains in a single libvirt call.
+
+    :param devices: Also read memory in bytes, and counters of disks and NICs.
+    :type devices: bool
+    :returns: Mapping of domain name to its stats; missing domains are absent.
+    :rtype: dict
+    """
+    wanted = set(names)
+    result = {}
+    flags = libvirt.VIR_DOMAIN_STATS_STATE | libvirt.VIR_DOMAIN_STATS_CPU_TOTAL | \
+        libvirt.VIR_DOMAIN_STATS_BALLOON | libvirt.VIR_DOMAIN_STATS_VCPU
+    if devices:
+        flags |= libvirt.VIR_DOMAIN_STATS_BLOCK | libvirt.VIR_DOMAIN_STATS_INTERFACE
+    for dom, stats in connect(uri, read_only=True).getAllDomainStats(flags):
+        name = dom.name()
+        if name not in wanted:
+            continue
+        state = _domain_states.get(stats.get('state.state'), 'unknown')
+        if state == 'shutoff' and dom.hasManagedSaveImage(0):
+            state = 'suspended'
+        result[name] = {
+            'uuid': dom.UUIDString(),
+            'state': state,
+            'vcpus': stats.get('vcpu.current', 0),
+            'cpu_time': stats.get('cpu.time', 0) / 1e9,
+            'memory': stats.get('balloon.current', 0) // 1024,
+            'rss': stats.get('balloon.rss', 0) // 1024,
+        }
+        if devices:
+            result[name].update({
+                'balloon_bytes': stats.get('balloon.current', 0) * 1024,
+                'rss_bytes': stats.get('balloon.rss', 0) * 1024,
+                'disks': _device_stats(stats, 'block', _block_stats),
+                'nics': _device_stats(stats, 'net', _net_stats),
+            })
+    return result
+
+
+def pause_domain(dom):
+    """Pause vCPUs of a running domain."""
+    state, _ = dom.state()
+    if state == libvirt.VIR_DOMAIN_RUNNING:
+        dom.suspend()
+
+
+def resume_domain(dom):
+    """Resume vCPUs of a paused domain."""
+    state, _ = dom.state()
+    if state == libvirt.VIR_DOMAIN_PAUSED:
+        dom.resume()
+
+
+def save_domain(dom):
+    """Save memory of a domain to disk and stop it, so it holds no host RAM.
+
+    Domain runs again from the saved state on its next start, even if it
+    was paused.
+    """
+    if dom.isActive():
+        dom.managedSave(libvirt.VIR_DOMAIN_SAVE_RUNNING)
+
+
+def restore_domain(dom):
+    """Start a stopped domain, from its saved state if it has one."""
+    if not dom.isActive():
+        dom.create()
+
+
+def create_snapshot(dom, name):
+    """Create internal snapshot of domain disks and memory.
+
+    Older snapshot with the same name is replaced.
+    """
+    try:
+        dom.snapshotLookupByName(name).delete()
+    except libvirt.libvirtError as e:
+        if e.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN_SNAPSHOT:
+            raise
+    root = ET.Element('domainsnapshot')
+    ET.SubElement(root, 'name').text = name
+    return dom.snapshotCreateXML(ET.tostring(root).decode(), 0)
+
+
+def has_snapshot(dom, name):
+    """Whether domain has a snapshot with given name."""
+    try:
+        dom.snapshotLookupByName(name)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN_SNAPSHOT:
+            return False
+        raise
+    return True
+
+
+def revert_snapshot(dom, name):
+    """Revert domain to snapshot with given name, leaving it paused."""
+    dom.revertToSnapshot(dom.snapshotLookupByName(name),
+                         libvirt.VIR_DOMAIN_SNAPSHOT_REVERT_PAUSED)
+
+
+__all__ = ['connect', 'lookup_domain', 'host_topology', 'host_capacity', 'host_domains',
+           'pool_allocation', 'apply_cpu_placement', 'ensure_network', 'remove_network',
+           'apply_nic_tuning', 'restart_domain', 'domain_stats', 'domain_groups',
+           'set_domain_groups', 'pause_domain', 'resume_domain', 'save_domain', 'restore_domain',
+           'create_snapshot', 'has_snapshot', 'revert_snapshot']
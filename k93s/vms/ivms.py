@@ -9,6 +9,7 @@ class KubernetesVMType(enum.Enum):
     """Distinguish master and agent nodes."""
     MASTER = 0
     AGENT = 1
+    STANDBY = 2
 
 
 class IKubernetesVM(zope.interface.Interface):
@@ -24,6 +25,22 @@ class IKubernetesVM(zope.interface.Interface):
         """Removes single VM."""
         raise NotImplementedError()
 
+    def snapshot(self, name):
+        """Snapshots disks and memory of single VM under given name."""
+        raise NotImplementedError()
+
+    def revert(self, name):
+        """Reverts single VM to snapshot with given name."""
+        raise NotImplementedError()
+
+    def save(self):
+        """Saves memory of single VM to disk and stops it."""
+        raise NotImplementedError()
+
+    def restore(self):
+        """Starts single VM from its saved memory."""
+        raise NotImplementedError()
+
 
 class IKubernetesVMCollection(zope.interface.Interface):
     """Actionable collection of Kubernetes VMs."""
@@ -50,4 +67,35 @@ class IKubernetesVMCollection(zope.interface.Interface):
         raise NotImplementedError()
 
     def inventory(self, vms: typing.List[IKubernetesVM]):
+        """Builds Ansible inventory (k93s.inventory.Inventory) of VMs."""
+        raise NotImplementedError()
+
+    def stats(self, vms: typing.List[IKubernetesVM], devices: bool = False) -> typing.List[dict]:
+        """Reads state and resource usage of all VMs, with devices also disk
+        and NIC counters."""
+        raise NotImplementedError()
+
+    def fill_pool(self, vms: typing.List[IKubernetesVM]) -> typing.List[IKubernetesVM]:
+        """Spins up missing standby agent VMs of warm pool, returns them."""
+        raise NotImplementedError()
+
+    def snapshot(self, vms: typing.List[IKubernetesVM], name: str):
+        """Snapshots all VMs consistently under given name."""
+        raise NotImplementedError()
+
+    def reset(self, vms: typing.List[IKubernetesVM], name: str):
+        """Reverts all VMs to snapshot with given name."""
+        raise NotImplementedError()
+
+    def suspend(self, vms: typing.List[IKubernetesVM]):
+        """Saves memory of all VMs to disk, freeing host RAM."""
+        raise NotImplementedError()
+
+    def resume(self, vms: typing.List[IKubernetesVM]):
+        """Restores all suspended VMs, masters first."""
+        raise NotImplementedError()
+
+    def collect_garbage(self, vms: typing.List[IKubernetesVM], image_budget: int = None,
+                        compact: bool = False, dry_run: bool = False) -> typing.List[dict]:
+        """Removes storage, which no VM uses, on hosts of VMs, reports reclaimed bytes."""
         raise NotImplementedError()
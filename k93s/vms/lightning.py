@@ -1,20 +1,78 @@
 import asyncio
+import collections
+import contextlib
+import getpass
 import io
+import ipaddress
 import logging
 import os
+import threading
+import time
 import yaml
 
 import nest_asyncio
 from virt_lightning import configuration as virt_config, shell
+from virt_lightning import virt_lightning as vl
 from zope.interface import implementer
 
-from k93s import utils
-from k93s.network import get_next_ip_address
-from k93s.vms import ivms
+from k93s import metrics, utils
+from k93s.inventory import Inventory
+from k93s.network import (cluster_cidr, cluster_network_name, gateway_address,
+                          get_next_ip_address, local_address)
+from k93s.vms import gc, hypervisor, ivms, numa, scheduler
 
 
 logger = logging.getLogger(__name__)
 
+# Guards the hypervisor class of virt-lightning, while it is substituted
+_hypervisor_lock = threading.Lock()
+
+
+def _bridged_hypervisor_class(cls, gateway):
+    """Subclass of virt-lightning hypervisor for a network, which forwards to a host bridge.
+
+    Libvirt takes no addresses of such networks, and runs no DHCP or DNS
+    on them, while virt-lightning reads gateway of VMs from the network.
+    So the gateway is taken from configuration of the VM instead, and DHCP
+    and DNS entries of VMs are skipped.
+    """
+    gateway = ipaddress.IPv4Interface(gateway)
+
+    def init_network(self, network_name, network_cidr):
+        self.network_obj = self.conn.networkLookupByName(network_name)
+        self.gateway = self.dns = gateway
+        self.network = gateway.network
+
+    methods = {'init_network': init_network}
+    # Other methods differ between virt-lightning releases
+    if hasattr(cls, 'get_network_gateway'):
+        methods['get_network_gateway'] = lambda self, network_name: gateway
+    for name in ('reuse_mac_address', 'add_domain_to_network', 'remove_domain_from_network'):
+        if hasattr(cls, name):
+            methods[name] = lambda self, *args: None
+    return type('Bridged' + cls.__name__, (cls,), methods)
+
+
+@contextlib.contextmanager
+def _lightning_hypervisor(config):
+    """Let virt-lightning within the context handle network of VM with given config.
+
+    virt-lightning creates its hypervisor from the class of its module,
+    so for a VM on a bridged network, the class is substituted only for
+    the duration of the context.
+    """
+    gateway = config.get('network_gateway')
+    if gateway is None:
+        yield
+        return
+    with _hypervisor_lock:
+        hypervisor_class = vl.LibvirtHypervisor
+        vl.LibvirtHypervisor = _bridged_hypervisor_class(hypervisor_class, gateway)
+        try:
+            yield
+        finally:
+            vl.LibvirtHypervisor = hypervisor_class
+
 
 @implementer(ivms.IKubernetesVM)
 class LightningVM:
@@ -24,9 +82,11 @@ class LightningVM:
     def vm_type(self):
         return self._vm_type
 
-    def __init__(self, name, is_master, lvl_config, **configuration):
+    def __init__(self, name, is_master, lvl_config, is_standby=False, **configuration):
         if is_master:
             self._vm_type = ivms.KubernetesVMType.MASTER
+        elif is_standby:
+            self._vm_type = ivms.KubernetesVMType.STANDBY
         else:
             self._vm_type = ivms.KubernetesVMType.AGENT
         self.name = name
@@ -40,17 +100,107 @@ class LightningVM:
     def up(self):
         """No-action for now."""
         try:
-            shell.up([self.config], self.lvl_config, 'k93s')
+            with _lightning_hypervisor(self.config):
+                shell.up([self.config], self.lvl_config, 'k93s')
         except:  # pragma: no cover  # noqa: E731
             logger.exception('Failed to bring up cluster')  # pragma: no cover
+        else:
+            self.claim()
+            self.tune()
+
+    def claim(self):
+        """Move domain into groups of its current role.
+
+        Standby agent of a warm pool keeps its name, IP address and
+        prepared state, and becomes a regular agent when agents count grows.
+        """
+        if self.vm_type != ivms.KubernetesVMType.AGENT:
+            return
+        dom = hypervisor.lookup_domain(self.lvl_config.libvirt_uri, self.name)
+        if dom is None:
+            return
+        groups = self.config.get('groups', [])
+        if hypervisor.domain_groups(dom) != groups:
+            logger.warning('Moving %s into groups %s', self, ', '.join(groups))
+            hypervisor.set_domain_groups(dom, groups)
+
+    def _domain(self, action):
+        """Domain of the VM, or None, logged, e.g. for a standby agent never created."""
+        dom = hypervisor.lookup_domain(self.lvl_config.libvirt_uri, self.name)
+        if dom is None:
+            logger.warning('Can not %s %s, domain does not exist', action, self)
+        return dom
+
+    def tune(self):
+        """Apply NIC options, CPU pinning and NUMA placement to the domain."""
+        placement = self.config.get('cpu_placement')
+        nic_tuning = self.config.get('nic_tuning')
+        if not (placement or nic_tuning):
+            return
+        dom = hypervisor.lookup_domain(self.lvl_config.libvirt_uri, self.name)
+        if dom is None:
+            logger.warning('Can not tune %s, domain does not exist', self)
+            return
+        if nic_tuning and hypervisor.apply_nic_tuning(dom, **nic_tuning):
+            logger.warning('Restarting %s to apply NIC options', self)
+            hypervisor.restart_domain(dom)
+            utils.wait_for_ssh(self.config['networks'][0]['ipv4'])
+        if placement:
+            hypervisor.apply_cpu_placement(dom, placement)
 
     def down(self):
         """No-action for now."""
         try:
-            shell.down(self.lvl_config, 'k93s')
+            with _lightning_hypervisor(self.config):
+                shell.down(self.lvl_config, 'k93s')
         except:  # pragma: no cover  # noqa: E731
             logger.exception('Failed to tear down cluster')  # pragma: no cover
 
+    def pause(self):
+        dom = self._domain('pause')
+        if dom is not None:
+            hypervisor.pause_domain(dom)
+
+    def resume(self):
+        dom = self._domain('resume')
+        if dom is not None:
+            hypervisor.resume_domain(dom)
+
+    def save(self):
+        """Save the domain to disk, returns whether it exists."""
+        dom = self._domain('save')
+        if dom is None:
+            return False
+        logger.warning('Saving %s to disk', self)
+        hypervisor.save_domain(dom)
+        return True
+
+    def restore(self):
+        """Restore the domain from disk, returns whether it exists."""
+        dom = self._domain('restore')
+        if dom is None:
+            return False
+        logger.warning('Restoring %s', self)
+        hypervisor.restore_domain(dom)
+        return True
+
+    def snapshot(self, name):
+        dom = self._domain('snapshot')
+        if dom is not None:
+            logger.warning('Taking snapshot %s of %s', name, self)
+            hypervisor.create_snapshot(dom, name)
+
+    def has_snapshot(self, name):
+        """Whether the domain exists and has a snapshot with given name."""
+        dom = hypervisor.lookup_domain(self.lvl_config.libvirt_uri, self.name)
+        return dom is not None and hypervisor.has_snapshot(dom, name)
+
+    def revert(self, name):
+        dom = self._domain('revert')
+        if dom is not None:
+            logger.warning('Reverting %s to snapshot %s', self, name)
+            hypervisor.revert_snapshot(dom, name)
+
 
 @implementer(ivms.IKubernetesVMCollection)
 class LightningVMNodes:
@@ -58,14 +208,24 @@ class LightningVMNodes:
     managed with virt_lightning."""
 
     # We do not support changing these yet.
-    blacklisted_config_keys = {'network_cidr', 'network_name', 'storage_pool'}
+    blacklisted_config_keys = {'storage_pool'}
+    # Network is shared between clusters unless configured otherwise,
+    # so do not ask about it when creating config.
     common_properties = utils.subdict_except(virt_config.DEFAULT_CONFIGURATION['main'].copy(),
+                                             'network_cidr', 'network_name',
                                              *blacklisted_config_keys)
 
     _NETWORK = '192.168.123.0/24'
     _NETWORK_NAME = 'virt-lightning'
+    _NETWORK_NAME_MAX_LENGTH = 15  # Network name is used as bridge name.
+    # vCPUs per host CPU, when capacity of a host is read from libvirt
+    _CPU_OVERCOMMIT = 4
     _MASTER_NODES_COUNT = 1
     _AGENT_NODES_COUNT = 1
+    # Same defaults, as virt-lightning applies, for hosts of Ansible inventory
+    _HOST_PROPERTIES = ('username', 'python_interpreter')
+    _PYTHON_INTERPRETER = '/usr/bin/python3'
+    _SSH_COMMON_ARGS = '-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no'
 
     _MASTER_DISTRO = 'centos-8'
     _MASTER_MEMORY = 512
@@ -100,6 +260,11 @@ class LightningVMNodes:
         self._distros = set()
         self._lightning_file_name = None
         self._network_name = None
+        self._network_cidr = None
+        self._network_mtu = None
+        self._network_bridge = None
+        self._owns_network = False
+        self._pending_placement = None
         self._lvl_configuration = shell.Configuration()
 
     @property
@@ -114,20 +279,156 @@ class LightningVMNodes:
     def distros(self):
         return self._distros
 
-    def _prefetch_distros(self):
+    @staticmethod
+    def _lightning_main_section(properties):
+        """Pick virt-lightning settings out of k93s properties, as strings."""
+        return {k: str(v) for k, v in properties.items()
+                if k in virt_config.DEFAULT_CONFIGURATION['main']}
+
+    def _configure_network(self, cluster_name, backend_config):
+        """Choose network name and CIDR for the cluster.
+
+        With ``isolated_network`` option, every cluster gets its own
+        network, named after it, unless name or CIDR are set explicitly.
+        So does it with ``network_bridge`` option, which attaches the
+        network to an existing host bridge.
+        """
+        self._network_bridge = backend_config.get('network_bridge')
+        isolated = (utils.as_bool(backend_config.get('isolated_network', False)) or
+                    bool(self._network_bridge))
+        self._network_name = backend_config.get(
+            'network_name',
+            cluster_network_name(cluster_name) if isolated else self._NETWORK_NAME)
+        self._network_cidr = backend_config.get(
+            'network_cidr', cluster_cidr(cluster_name) if isolated else self._NETWORK)
+        self._network_mtu = backend_config.get('mtu')
+        self._owns_network = self._network_name == cluster_network_name(cluster_name)
+        if len(self._network_name) > self._NETWORK_NAME_MAX_LENGTH:
+            raise RuntimeError('Network name {!r} is longer than {} '
+                               'characters.'.format(self._network_name,
+                                                    self._NETWORK_NAME_MAX_LENGTH))
+        self._lvl_configuration.data['main'].update({
+            'network_name': self._network_name,
+            'network_cidr': self._network_cidr,
+        })
+
+    def _tune_nics(self, backend_config, vms):
+        """Compute NIC options for each VM, if any are configured."""
+        queues = backend_config.get('nic_queues')
+        vhost = utils.as_bool(backend_config.get('vhost_net', False))
+        if not (queues or vhost or self._network_mtu):
+            return
+        for vm in vms:
+            vm_queues = vm.config['vcpus'] if str(queues) == 'auto' else queues
+            nic_tuning = {
+                'network_name': self._network_name,
+                'queues': vm_queues or None,
+                'vhost': vhost,
+                'mtu': self._network_mtu or None,
+            }
+            vm.config['nic_tuning'] = nic_tuning
+            self._vms[vm.name]['nic_tuning'] = nic_tuning
+
+    def _host_with_capacity(self, host):
+        """Fill capacities of a host, which are not configured, from libvirt."""
+        if host.vcpus and host.memory:
+            return host
+        cpus, memory = hypervisor.host_capacity(host.uri)
+        return host._replace(vcpus=host.vcpus or cpus * self._CPU_OVERCOMMIT,
+                             memory=host.memory or memory)
+
+    def _check_hosts(self, backend_config):
+        """Validate hosts of backend config, without connecting to them."""
+        hosts = scheduler.hosts_from_config(backend_config.get('hosts') or [])
+        if len(hosts) > 1 and not self._network_bridge:
+            raise RuntimeError('VMs on several hosts need network_bridge, a host bridge '
+                               'on a network segment, which all hosts share.')
+
+    def _schedule(self, backend_config, vms):
+        """Assign VMs to libvirt hosts, if several hosts are configured."""
+        hosts_config = backend_config.get('hosts')
+        if not hosts_config:
+            return
+        hosts = scheduler.hosts_from_config(hosts_config)
+        # VMs of the cluster stay where they exist, running VMs of others take capacity
+        names = {vm.name for vm in vms}
+        used, pinned = {}, {}
+        for host in hosts:
+            for name, vcpus, memory, active in hypervisor.host_domains(host.uri):
+                if name in names:
+                    pinned.setdefault(name, host.uri)
+                elif active:
+                    taken = used.setdefault(host.uri, [0, 0])
+                    taken[0] += vcpus
+                    taken[1] += memory
+        placement = scheduler.place(
+            [self._host_with_capacity(host) for host in hosts],
+            [(vm.name, vm.config['vcpus'], vm.config['memory'],
+              vm.vm_type == ivms.KubernetesVMType.MASTER) for vm in vms],
+            policy=backend_config.get('placement', 'spread'),
+            used=used,
+            pinned=pinned,
+        )
+        for vm in vms:
+            vm.lvl_config.data['main']['libvirt_uri'] = placement[vm.name]
+            vm.config['libvirt_uri'] = placement[vm.name]
+            self._vms[vm.name]['libvirt_uri'] = placement[vm.name]
+
+    @staticmethod
+    def _by_host(vms):
+        """Group VMs by libvirt URI of their host, in order of VMs."""
+        by_host = collections.OrderedDict()
+        for vm in vms:
+            by_host.setdefault(vm.lvl_config.libvirt_uri, []).append(vm)
+        return by_host
+
+    def _host_configuration(self, uri):
+        """virt-lightning configuration of the cluster for given host."""
+        if uri == self._lvl_configuration.libvirt_uri:
+            return self._lvl_configuration
+        configuration = shell.Configuration()
+        configuration.data['main'].update(dict(self._lvl_configuration.data['main']))
+        configuration.data['main']['libvirt_uri'] = uri
+        return configuration
+
+    def _place_cpus(self, backend_config, vms):
+        """Compute CPU pinning and NUMA placement for each VM, if enabled."""
+        if not utils.as_bool(backend_config.get('cpu_pinning', False)):
+            return
+        placement = {}
+        for uri, host_vms in self._by_host(vms).items():
+            placement.update(numa.place(
+                hypervisor.host_topology(uri),
+                [(vm.name, vm.config['vcpus'], vm.vm_type == ivms.KubernetesVMType.MASTER)
+                 for vm in host_vms],
+                reserved_cores=backend_config.get('cpu_pinning_reserved_cores', 0),
+            ))
+        for vm in vms:
+            vm.config['cpu_placement'] = placement[vm.name]
+            self._vms[vm.name]['cpu_placement'] = placement[vm.name]
+
+    def _prefetch_distros(self, vms):
         """Prefetch images from https://virt-lightning.org/images/,
-           if they are not available yet."""
-        iobuf = io.StringIO()
-        with utils.RedirectStdStreams(stdout=iobuf):
-            shell.distro_list(self._lvl_configuration)
-            iobuf.flush()
-        iobuf.seek(0)
-        distro_list = {d['distro'] for d in
-                       yaml.load(iobuf.read(), Loader=yaml.FullLoader) or set()}
-        to_fetch = self._distros - distro_list
-        for dis in to_fetch:
-            logger.warning('Going to fetch distro %s', dis)
-            shell.fetch(self._lvl_configuration, distro=dis)
+           if they are not available yet on hosts of given VMs."""
+        for uri, host_vms in self._by_host(vms).items():
+            configuration = self._host_configuration(uri)
+            iobuf = io.StringIO()
+            with utils.RedirectStdStreams(stdout=iobuf):
+                shell.distro_list(configuration)
+                iobuf.flush()
+            iobuf.seek(0)
+            distro_list = {d['distro'] for d in
+                           yaml.load(iobuf.read(), Loader=yaml.FullLoader) or set()}
+            to_fetch = {vm.config['distro'] for vm in host_vms} - distro_list
+            for dis in sorted(to_fetch):
+                logger.warning('Going to fetch distro %s on %s', dis, uri)
+                allocated = hypervisor.pool_allocation(uri, configuration.storage_pool)
+                with metrics.timed('image_fetch', distro=dis):
+                    shell.fetch(configuration, distro=dis)
+                if allocated is not None:
+                    fetched = hypervisor.pool_allocation(uri, configuration.storage_pool)
+                    metrics.inc('k93s_image_fetch_bytes_total', max(0, fetched - allocated),
+                                distro=dis)
 
     def _render_config(self):
         """Renders libvirt-lightning configuration."""
@@ -139,7 +440,7 @@ class LightningVMNodes:
 
         if action == 'up':
             # Fetch non-available distros
-            self._prefetch_distros()
+            self._prefetch_distros(vms)
 
         def perform_vm_action(_vm, _action_name, _fut):
             logger.warning('Invoking action %s on VM %s', _action_name, _vm)
@@ -167,44 +468,77 @@ class LightningVMNodes:
 
         loop.run_until_complete(perform_all_vm_actions(loop))
 
+    def _invoke_on_hosts(self, vms, action):
+        """Invoke lightning action on VMs, on one host after another.
+
+        virt-lightning registers libvirt event loop and its asyncio loop
+        globally, and is not thread safe, so hosts are not run in parallel.
+        """
+        for host_vms in self._by_host(vms).values():
+            self._invoke_lightning(host_vms, action)
+
     def _create_master_vm_config(self, name, **master_properties):
         cfg = {}
         cfg['name'] = name
         cfg['distro'] = master_properties.get('distro', self._MASTER_DISTRO)
-        cfg['vcpus'] = int(master_properties.get('vcpus', self._MASTER_VCPUS))
-        cfg['memory'] = int(master_properties.get('memory', self._MASTER_MEMORY))
-        cfg['root_disk_size'] = int(master_properties.get('root_disk_size',
-                                                          self._MASTER_ROOT_DISK_SIZE))
+        cfg['vcpus'] = master_properties.get('vcpus', self._MASTER_VCPUS)
+        cfg['memory'] = master_properties.get('memory', self._MASTER_MEMORY)
+        cfg['root_disk_size'] = master_properties.get('root_disk_size',
+                                                      self._MASTER_ROOT_DISK_SIZE)
         cfg['root_password'] = master_properties.get('root_password', self._MASTER_ROOT_PASSWORD)
+        cfg.update({k: master_properties[k] for k in self._HOST_PROPERTIES
+                    if master_properties.get(k)})
         cfg['groups'] = ['kubernetes_master']
         cfg['networks'] = [
             {
                 'network': self._network_name,
-                'ipv4': get_next_ip_address(self._NETWORK, 'master')
+                'ipv4': get_next_ip_address(self._network_cidr, 'master')
             },
         ]
+        if self._network_bridge:
+            # Libvirt network of a host bridge does not carry the gateway
+            cfg['network_gateway'] = '{}/{}'.format(
+                gateway_address(self._network_cidr),
+                ipaddress.ip_network(self._network_cidr).prefixlen)
         lvl_config = shell.Configuration()
+        lvl_config.data['main'].update(self._lightning_main_section(master_properties))
         lvl_config.data['main'].update({k: str(v) for k, v in cfg.items()})
+        lvl_config.data['main'].update({
+            'network_name': self._network_name,
+            'network_cidr': self._network_cidr,
+        })
         return cfg, lvl_config
 
-    def _create_agent_vm_config(self, name, **agent_properties):
+    def _create_agent_vm_config(self, name, is_standby=False, **agent_properties):
         cfg = {}
         cfg['name'] = name
         cfg['distro'] = agent_properties.get('distro', self._AGENT_DISTRO)
-        cfg['vcpus'] = int(agent_properties.get('vcpus', self._AGENT_VCPUS))
-        cfg['memory'] = int(agent_properties.get('memory', self._AGENT_MEMORY))
-        cfg['root_disk_size'] = int(agent_properties.get('root_disk_size',
-                                                         self._AGENT_ROOT_DISK_SIZE))
-        cfg['password'] = agent_properties.get('root_password', self._AGENT_ROOT_DISK_SIZE)
-        cfg['groups'] = ['kubernetes_agent']
+        cfg['vcpus'] = agent_properties.get('vcpus', self._AGENT_VCPUS)
+        cfg['memory'] = agent_properties.get('memory', self._AGENT_MEMORY)
+        cfg['root_disk_size'] = agent_properties.get('root_disk_size',
+                                                     self._AGENT_ROOT_DISK_SIZE)
+        cfg['root_password'] = agent_properties.get('root_password', self._AGENT_ROOT_PASSWORD)
+        cfg.update({k: agent_properties[k] for k in self._HOST_PROPERTIES
+                    if agent_properties.get(k)})
+        cfg['groups'] = ['kubernetes_standby' if is_standby else 'kubernetes_agent']
         cfg['networks'] = [
             {
                 'network': self._network_name,
-                'ipv4': get_next_ip_address(self._NETWORK, 'agent')
+                'ipv4': get_next_ip_address(self._network_cidr, 'agent')
             },
         ]
+        if self._network_bridge:
+            # Libvirt network of a host bridge does not carry the gateway
+            cfg['network_gateway'] = '{}/{}'.format(
+                gateway_address(self._network_cidr),
+                ipaddress.ip_network(self._network_cidr).prefixlen)
         lvl_config = shell.Configuration()
+        lvl_config.data['main'].update(self._lightning_main_section(agent_properties))
         lvl_config.data['main'].update({k: str(v) for k, v in cfg.items()})
+        lvl_config.data['main'].update({
+            'network_name': self._network_name,
+            'network_cidr': self._network_cidr,
+        })
         return cfg, lvl_config
 
     def compute_vms_configuration(self, work_directory, **fs_config_contents):
@@ -221,8 +555,6 @@ class LightningVMNodes:
                                    'by virt-lightning '
                                    ' backend.'.format(config_key))  # pragma: no cover
 
-        self._network_name = self._NETWORK_NAME
-
         master_nodes_config = {}
         master_nodes_config.update(fs_config_contents.get('masters', {}))
         master_nodes_config.update(fs_config_contents['vms_backend_config'])
@@ -231,42 +563,221 @@ class LightningVMNodes:
         agent_nodes_config.update(fs_config_contents['vms_backend_config'])
 
         self._lvl_configuration.data['main'].update(
-            fs_config_contents.get('vms_backend_config', {}))
+            self._lightning_main_section(fs_config_contents.get('vms_backend_config', {})))
 
         cluster_name = fs_config_contents.get('name', 'K_93_TEST')
+        self._configure_network(cluster_name, fs_config_contents['vms_backend_config'])
         vms = []
 
-        for i in range(0, int(master_nodes_config.get('count', self._MASTER_NODES_COUNT))):
+        for i in range(0, master_nodes_config.get('count', self._MASTER_NODES_COUNT)):
             name = '{}-master-{}'.format(cluster_name, i + 1)
             self._vms[name], lvl_config = self._create_master_vm_config(name, **master_nodes_config)
             self._distros.add(self._vms[name]['distro'])
             vms.append(LightningVM(is_master=True, lvl_config=lvl_config, **self._vms[name]))
 
-        for i in range(0, int(agent_nodes_config.get('count', self._AGENT_NODES_COUNT))):
+        agents_count = agent_nodes_config.get('count', self._AGENT_NODES_COUNT)
+        warm_pool = agent_nodes_config.get('warm_pool', 0)
+        for i in range(0, agents_count + warm_pool):
             name = '{}-agent-{}'.format(cluster_name, i + 1)
-            self._vms[name], lvl_config = self._create_agent_vm_config(name, **agent_nodes_config)
+            is_standby = i >= agents_count
+            self._vms[name], lvl_config = self._create_agent_vm_config(
+                name, is_standby=is_standby, **agent_nodes_config)
             self._distros.add(self._vms[name]['distro'])
-            vms.append(LightningVM(is_master=False, lvl_config=lvl_config, **self._vms[name]))
+            vms.append(LightningVM(is_master=False, lvl_config=lvl_config,
+                                   is_standby=is_standby, **self._vms[name]))
+
+        self._check_hosts(fs_config_contents['vms_backend_config'])
+        self._tune_nics(fs_config_contents['vms_backend_config'], vms)
+        self._pending_placement = (fs_config_contents['vms_backend_config'], vms)
 
         return vms
 
+    def _place(self):
+        """Assign VMs to hosts and host CPUs, once an action needs them.
+
+        Both query libvirt of every host, while e.g. inventory is built
+        from configuration only.
+        """
+        if self._pending_placement is None:
+            return
+        backend_config, vms = self._pending_placement
+        self._pending_placement = None
+        self._schedule(backend_config, vms)
+        self._place_cpus(backend_config, vms)
+
     def spinup(self, vms):
+        self._place()
+        vms = [vm for vm in vms if vm.vm_type != ivms.KubernetesVMType.STANDBY]
         self._render_config()
-        self._invoke_lightning(vms, 'up')
+        if self._network_name != self._NETWORK_NAME or self._network_mtu:
+            for uri in self._by_host(vms):
+                hypervisor.ensure_network(uri, self._network_name, self._network_cidr,
+                                          mtu=self._network_mtu, bridge=self._network_bridge)
+        self._invoke_on_hosts(vms, 'up')
 
     def teardown(self, vms):
+        self._place()
         self._render_config()
-        self._invoke_lightning(vms, 'down')
+        self._invoke_on_hosts(vms, 'down')
+        # Networks configured by name may be shared, or not created by k93s
+        if self._owns_network:
+            for uri in self._by_host(vms):
+                hypervisor.remove_network(uri, self._network_name)
+
+    def stats(self, vms, devices=False):
+        """Read state, CPU and memory usage of all VMs in one libvirt call per host.
+
+        With `devices`, rows also carry libvirt URI of the host, memory in
+        bytes, and counters of disks and NICs.
+        """
+        self._place()
+        domain_stats = {}
+        for uri, host_vms in self._by_host(vms).items():
+            host_stats = hypervisor.domain_stats(uri, [vm.name for vm in host_vms],
+                                                 devices=devices)
+            if devices:
+                for row in host_stats.values():
+                    row['host'] = uri
+            domain_stats.update(host_stats)
+        rows = []
+        for vm in vms:
+            row = {
+                'name': vm.name,
+                'role': vm.vm_type.name.lower(),
+                'address': vm.config['networks'][0]['ipv4'],
+                'user': self._ssh_user(vm),
+            }
+            row.update(domain_stats.get(vm.name, {'state': 'missing'}))
+            rows.append(row)
+        return rows
+
+    def fill_pool(self, vms):
+        """Bring up standby agents of the warm pool, which are missing.
+
+        :returns: Standby VMs, which were brought up, as others exist already.
+        """
+        standby = [vm for vm in vms if vm.vm_type == ivms.KubernetesVMType.STANDBY]
+        if not standby:
+            return []
+        missing = {row['name'] for row in self.stats(standby) if row['state'] == 'missing'}
+        created = [vm for vm in standby if vm.name in missing]
+        if created:
+            self._render_config()
+            self._invoke_on_hosts(created, 'up')
+        return created
+
+    @staticmethod
+    def _by_tier(vms):
+        """Split VMs into masters and agents, including standby ones."""
+        masters = [vm for vm in vms if vm.vm_type == ivms.KubernetesVMType.MASTER]
+        agents = [vm for vm in vms if vm.vm_type != ivms.KubernetesVMType.MASTER]
+        return masters, agents
+
+    def _resume(self, vms):
+        """Resume paused VMs, masters first, so agents find control plane running."""
+        for tier in self._by_tier(vms):
+            utils.parallel(lambda vm: vm.resume(), tier)
+
+    def snapshot(self, vms, name):
+        """Snapshot disks and memory of all VMs under given name.
+
+        VMs are paused masters first, so the whole cluster is captured at
+        the same point in time, snapshotted in parallel and resumed.
+        """
+        self._place()
+        started = time.monotonic()
+        masters, agents = self._by_tier(vms)
+        try:
+            for vm in masters + agents:
+                vm.pause()
+            utils.parallel(lambda vm: vm.snapshot(name), vms)
+        finally:
+            self._resume(vms)
+        logger.warning('Snapshot %s of %d VMs done in %.1fs', name, len(vms),
+                       time.monotonic() - started)
+
+    def reset(self, vms, name):
+        """Revert all VMs to snapshot with given name in parallel.
+
+        Standby agents, which do not exist, are left out, as the pool
+        brings them up again.
+
+        :raises RuntimeError: If a VM lacks the snapshot, before any is reverted,
+                              so the cluster is not left half reset.
+        """
+        missing = {row['name'] for row in self.stats(vms) if row['state'] == 'missing'}
+        vms = [vm for vm in vms
+               if not (vm.vm_type == ivms.KubernetesVMType.STANDBY and vm.name in missing)]
+        started = time.monotonic()
+        lacking = [vm.name for vm, found in zip(vms, utils.parallel(
+            lambda vm: vm.has_snapshot(name), vms)) if not found]
+        if lacking:
+            raise RuntimeError('Snapshot {} does not exist on {}.'.format(
+                name, ', '.join(lacking)))
+        try:
+            utils.parallel(lambda vm: vm.revert(name), vms)
+        finally:
+            self._resume(vms)
+        logger.warning('Reset %d VMs to %s in %.1fs', len(vms), name,
+                       time.monotonic() - started)
+
+    def suspend(self, vms):
+        """Save memory of all VMs to disk in parallel, and stop them.
+
+        VMs keep their names, addresses and disks, so inventory and facts
+        of the cluster stay valid until it is resumed. VMs, which do not
+        exist, e.g. standby agents not created yet, are skipped.
+        """
+        self._place()
+        started = time.monotonic()
+        saved = [done for done in utils.parallel(lambda vm: vm.save(), vms) if done]
+        logger.warning('Suspended %d VMs in %.1fs', len(saved), time.monotonic() - started)
+
+    def resume(self, vms):
+        """Restore suspended VMs in parallel, masters first, then agents."""
+        self._place()
+        started = time.monotonic()
+        restored = []
+        for tier in self._by_tier(vms):
+            restored += [done for done in utils.parallel(lambda vm: vm.restore(), tier) if done]
+        logger.warning('Resumed %d VMs in %.1fs', len(restored), time.monotonic() - started)
+
+    def collect_garbage(self, vms, image_budget=None, compact=False, dry_run=False):
+        """Remove orphaned volumes and stale distro images on every host of the cluster."""
+        self._place()
+        report = []
+        for uri in self._by_host(vms):
+            report += gc.collect(uri, self._lvl_configuration.storage_pool,
+                                 image_budget=image_budget, compact=compact, dry_run=dry_run)
+        return report
+
+    @staticmethod
+    def _ssh_user(vm):
+        # virt-lightning creates the invoking user in guests, unless told otherwise
+        return vm.config.get('username') or getpass.getuser()
 
     def inventory(self, vms):
-        self._render_config()
-        iobuf = io.StringIO()
-        with utils.RedirectStdStreams(stdout=iobuf):
-            shell.ansible_inventory(self._lvl_configuration, 'k93s')
-            iobuf.flush()
-        iobuf.seek(0)
-        r = iobuf.read()
-        return r
+        """Build Ansible inventory of VMs from their configuration.
+
+        Names, groups and static addresses of VMs are all known upfront,
+        so libvirt is not queried.
+        """
+        inventory = Inventory()
+        # Host services, e.g. registry mirror, are reachable on the gateway of
+        # NAT networks, and on own address of the host on bridged ones
+        host_address = gateway_address(self._network_cidr)
+        if self._network_bridge:
+            host_address = local_address(host_address)
+        for vm in vms:
+            inventory.add_host(vm.name, {
+                'ansible_host': vm.config['networks'][0]['ipv4'],
+                'ansible_user': self._ssh_user(vm),
+                'ansible_python_interpreter': vm.config.get('python_interpreter',
+                                                            self._PYTHON_INTERPRETER),
+                'ansible_ssh_common_args': self._SSH_COMMON_ARGS,
+                'k93s_gateway': host_address,
+            }, vm.config.get('groups', []))
+        return inventory
 
 
 backend = LightningVMNodes()
@@ -0,0 +1,111 @@
+"""Host CPU topology and vCPU placement for Kubernetes VMs."""
+import collections
+import xml.etree.ElementTree as ET
+
+
+class HostTopology:
+    """NUMA cells of a hypervisor host, each one a list of physical cores.
+
+    A core is a tuple of logical CPU ids (hyperthread siblings).
+    """
+
+    def __init__(self, cells):
+        self.cells = collections.OrderedDict(sorted(cells.items()))
+
+    @classmethod
+    def from_capabilities(cls, capabilities_xml):
+        """Parse libvirt host capabilities XML into topology."""
+        root = ET.fromstring(capabilities_xml)
+        cells = {}
+        for cell in root.findall('./host/topology/cells/cell'):
+            cores = collections.OrderedDict()
+            for cpu in cell.findall('./cpus/cpu'):
+                cpu_id = int(cpu.attrib['id'])
+                core_key = (cpu.attrib.get('socket_id'), cpu.attrib.get('core_id', cpu_id))
+                cores.setdefault(core_key, []).append(cpu_id)
+            cells[int(cell.attrib['id'])] = sorted(tuple(sorted(c)) for c in cores.values())
+        if not cells:
+            raise RuntimeError('Host capabilities do not describe CPU topology.')
+        return cls(cells)
+
+    @property
+    def cpu_count(self):
+        return sum(len(core) for cores in self.cells.values() for core in cores)
+
+
+def format_cpuset(cpus):
+    """Format CPU ids the way libvirt and taskset do, e.g. ``0-3,8``."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in ranges)
+
+
+def _vcpus_count(vcpus):
+    return max(1, int(vcpus))
+
+
+def place(topology, vms, reserved_cores=0):
+    """Assign host CPUs and NUMA nodes to VMs.
+
+    Masters get dedicated whole cores, all taken from a single NUMA cell.
+    Agents share the cores left over, spread round-robin across cells,
+    and each agent stays within its cell.
+
+    :param topology: Host CPU topology.
+    :type topology: HostTopology
+    :param vms: Tuples of (name, vcpus, is_master), in creation order.
+    :type vms: list
+    :param reserved_cores: Number of cores to leave for the host itself.
+    :type reserved_cores: int
+    :returns: Mapping of VM name to placement dictionary, with keys
+              ``vcpupin`` (CPU list per vCPU), ``emulatorpin`` (CPU list)
+              and ``numa_node`` (cell id).
+    :rtype: dict
+    """
+    free = {cell: list(cores) for cell, cores in topology.cells.items()}
+    for _ in range(int(reserved_cores)):
+        cell = max(free, key=lambda c: len(free[c]))
+        if free[cell]:
+            free[cell].pop(0)
+
+    placement = {}
+
+    for name, vcpus, is_master in vms:
+        if not is_master:
+            continue
+        needed = _vcpus_count(vcpus)
+        cell = max(free, key=lambda c: (sum(len(core) for core in free[c]), -c))
+        cpus = []
+        while len(cpus) < needed and free[cell]:
+            cpus.extend(free[cell].pop(0))
+        if len(cpus) < needed:
+            raise RuntimeError('Not enough free cores in a single NUMA cell '
+                               'to pin master {!s}.'.format(name))
+        placement[name] = {
+            'vcpupin': [[cpus[i]] for i in range(needed)],
+            'emulatorpin': cpus,
+            'numa_node': cell,
+        }
+
+    shared = [(cell, sorted(cpu for core in cores for cpu in core))
+              for cell, cores in free.items() if cores]
+    agents = [(name, vcpus) for name, vcpus, is_master in vms if not is_master]
+    if agents and not shared:
+        raise RuntimeError('No host cores left for agents after pinning masters.')
+
+    for i, (name, vcpus) in enumerate(agents):
+        cell, cpus = shared[i % len(shared)]
+        placement[name] = {
+            'vcpupin': [cpus] * _vcpus_count(vcpus),
+            'emulatorpin': cpus,
+            'numa_node': cell,
+        }
+
+    return placement
+
+
+__all__ = ['HostTopology', 'format_cpuset', 'place']
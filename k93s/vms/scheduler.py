@@ -0,0 +1,97 @@
+"""Placement of Kubernetes VMs onto several hypervisor hosts."""
+import collections
+
+
+Host = collections.namedtuple('Host', ['uri', 'vcpus', 'memory'])
+
+POLICIES = ('spread', 'binpack')
+
+
+def hosts_from_config(hosts_config):
+    """Parse `hosts` list of backend config into hosts.
+
+    Every entry is either a libvirt URI, or a dictionary with keys `uri`,
+    and optionally `vcpus` and `memory` (MiB), which cap VMs placed there.
+    Missing capacities are None, to be read from the host itself.
+
+    :rtype: list
+    """
+    hosts = []
+    for entry in hosts_config:
+        if isinstance(entry, str):
+            entry = {'uri': entry}
+        if 'uri' not in entry:
+            raise RuntimeError('Host {!r} has no libvirt uri.'.format(entry))
+        hosts.append(Host(
+            uri=entry['uri'],
+            vcpus=int(entry['vcpus']) if entry.get('vcpus') else None,
+            memory=int(entry['memory']) if entry.get('memory') else None,
+        ))
+    if len({host.uri for host in hosts}) != len(hosts):
+        raise RuntimeError('Hosts are listed more than once.')
+    return hosts
+
+
+def place(hosts, vms, policy='spread', used=None, pinned=None):
+    """Assign VMs to hosts, within capacities of hosts.
+
+    Masters are spread across hosts regardless of policy, so losing one
+    host does not take down the whole control plane. Agents follow the
+    policy: `spread` puts every agent on the least loaded host, `binpack`
+    fills hosts in order, keeping the rest free. VMs, which already
+    exist, stay on their hosts, so VMs keep their hosts when more agents
+    are added.
+
+    :param hosts: Hosts with known capacities.
+    :type hosts: list
+    :param vms: Tuples of (name, vcpus, memory, is_master), in creation order.
+    :type vms: list
+    :param policy: Either "spread" or "binpack".
+    :type policy: str
+    :param used: Mapping of libvirt URI to (vcpus, memory) taken by other VMs.
+    :type used: dict
+    :param pinned: Mapping of VM name to libvirt URI of host it exists on.
+    :type pinned: dict
+    :returns: Mapping of VM name to libvirt URI of its host.
+    :rtype: collections.OrderedDict
+    """
+    if policy not in POLICIES:
+        raise RuntimeError('Unknown placement policy {!s}, choose one of: {!s}'.format(
+            policy, ', '.join(POLICIES)))
+    pinned = pinned or {}
+    taken = {host.uri: list((used or {}).get(host.uri, (0, 0))) for host in hosts}
+    masters = collections.Counter()
+
+    def load(host, vcpus=0, memory=0):
+        return max((taken[host.uri][0] + vcpus) / host.vcpus,
+                   (taken[host.uri][1] + memory) / host.memory)
+
+    def assign(name, vcpus, memory, is_master, uri):
+        taken[uri][0] += vcpus
+        taken[uri][1] += memory
+        masters[uri] += is_master
+        placement[name] = uri
+
+    placement = collections.OrderedDict()
+    for name, vcpus, memory, is_master in vms:
+        if pinned.get(name) in taken:
+            assign(name, max(1, int(vcpus)), memory, is_master, pinned[name])
+    for name, vcpus, memory, is_master in sorted(vms, key=lambda vm: not vm[3]):
+        if name in placement:
+            continue
+        vcpus = max(1, int(vcpus))
+        fitting = [host for host in hosts if load(host, vcpus, memory) <= 1]
+        if not fitting:
+            raise RuntimeError('No host has room for {!s} ({:d} vCPUs, {:d} MiB).'.format(
+                name, vcpus, memory))
+        if is_master:
+            host = min(fitting, key=lambda h: (masters[h.uri], load(h, vcpus, memory)))
+        elif policy == 'spread':
+            host = min(fitting, key=lambda h: load(h, vcpus, memory))
+        else:
+            host = fitting[0]
+        assign(name, vcpus, memory, is_master, host.uri)
+    return collections.OrderedDict((vm[0], placement[vm[0]]) for vm in vms)
+
+
+__all__ = ['Host', 'POLICIES', 'hosts_from_config', 'place']